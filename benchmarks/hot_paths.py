@@ -0,0 +1,180 @@
+"""
+Benchmark of the request hot paths against a seeded database at several scales. The
+database is dropped and recreated for every scale, so never point this at a database
+containing real data.
+
+Results are written as json, and can be compared to an earlier result file to spot
+regressions between commits.
+
+Usage: python -m benchmarks.hot_paths [--db-uri URI] [--scales 100,1000]
+       [--repeat N] [--output FILE] [--compare FILE]
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.import_time import BENCHMARK_ENV
+
+# Average number of records per user in the seeded data
+RECORDS_PER_USER = 4
+
+
+def _get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def _time(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return {'min_ms': min(timings),
+            'median_ms': statistics.median(timings),
+            'max_ms': max(timings),
+            }
+
+
+def run_scale(scale: int, repeat: int, random_seed: int = 0) -> Dict[str, Any]:
+    """
+    Seed a fresh database with `scale` users and time the hot paths.
+
+    :param scale: number of seeded users
+    :param repeat: number of timed runs per operation
+    :param random_seed: seed of the generated data
+    :return: dict of timings by operation
+    """
+    from flask_jwt_simple import create_jwt
+    from tikki import seed, utils
+    from tikki.app import app
+    from tikki.db import api as db_api, metadata
+    from tikki.db.tables import Base, Event, Record, User
+
+    Base.metadata.drop_all(db_api.ENGINE)
+    Base.metadata.create_all(db_api.ENGINE)
+    db_api.USER_CACHE.clear()
+    results: Dict[str, Any] = {}
+
+    def parse_metadata():
+        metadata.get_dim_map.cache_clear()
+        metadata.get_test_limits.cache_clear()
+        metadata.get_dim_map()
+        metadata.get_test_limits()
+
+    def load_metadata():
+        db_api.regenerate_dimensions()
+        db_api.regenerate_limits()
+
+    results['metadata_parse'] = _time(parse_metadata, repeat)
+    results['metadata_load'] = _time(load_metadata, repeat)
+
+    stats = seed.seed(scale, records_per_user=RECORDS_PER_USER, random_seed=random_seed)
+    results['seed'] = {'rows': stats.rows, 'rows_per_sec': stats.rows_per_sec}
+
+    user = db_api.get_row(User, {'username': f'seed-{random_seed}-0'})
+    record_id = str(db_api.get_rows(Record, {'user_id': user.id})[0].id)
+    event_id = str(db_api.get_rows(Event, {})[0].id)
+    issued_at = int(time.time())
+    identity = utils.create_jwt_identity(user, {'iat': issued_at,
+                                                'exp': issued_at + 3600})
+    with app.test_request_context():
+        token = create_jwt(identity)
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    def request(method: str, path: str, **kwargs) -> Callable[[], Any]:
+        def func():
+            response = client.open(path, method=method, headers=headers, **kwargs)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{method} {path} failed: {response.data!r}')
+        return func
+
+    operations = {
+        'get_schema': request('GET', '/schema'),
+        'compstat_coopers': request('GET', '/test/cooperstest/compstat'),
+        'compstat_pushups': request('GET', '/test/pushup60test/compstat'),
+        'list_records': request('GET', '/record'),
+        'list_events': request('GET', '/event'),
+        'list_event_participants': request('GET', '/user-event-link',
+                                           query_string={'event_id': event_id}),
+        'post_record': request('POST', '/record',
+                               json={'type_id': 1, 'payload': {'distance': 2500}}),
+        'update_record': request('PATCH', '/record',
+                                 json={'id': record_id, 'type_id': 1,
+                                       'payload': {'distance': 2600}}),
+        'update_user': request('PATCH', '/user',
+                               json={'id': str(user.id),
+                                     'payload': {'city': 'Turku'}}),
+    }
+    for name, func in operations.items():
+        results[name] = _time(func, repeat)
+    return results
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[str]:
+    """
+    Compare the median timings of two result files.
+
+    :param current: current results
+    :param previous: earlier results
+    :return: lines describing the relative change of each operation
+    """
+    lines = []
+    for scale, operations in current['scales'].items():
+        for name, timings in operations.items():
+            old = previous['scales'].get(scale, {}).get(name, {}).get('median_ms')
+            if old and 'median_ms' in timings:
+                change = (timings['median_ms'] - old) / old * 100
+                lines.append(f'{scale:>8} {name:<26} {old:10.2f} ms -> '
+                             f'{timings["median_ms"]:10.2f} ms ({change:+.1f} %)')
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tikki hot paths')
+    parser.add_argument('--db-uri', help='database to benchmark against, defaults to a '
+                                         'temporary SQLite database')
+    parser.add_argument('--scales', default='100,1000,10000',
+                        help='comma separated numbers of seeded users')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of timed runs per operation')
+    parser.add_argument('--output', help='write results as json to this file')
+    parser.add_argument('--compare', help='compare results to an earlier result file')
+    args = parser.parse_args()
+
+    default_path = os.path.join(tempfile.gettempdir(), 'tikki-benchmark.db')
+    db_uri = args.db_uri or f'sqlite:///{default_path}'
+    for key, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ['TIKKI_SQLA_DB_URI'] = db_uri
+
+    result = {'commit': _get_commit(),
+              'database': db_uri.split(':', 1)[0],
+              'created_at': datetime.datetime.now().isoformat(),
+              'repeat': args.repeat,
+              'scales': {scale: run_scale(int(scale), args.repeat)
+                         for scale in args.scales.split(',')},
+              }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(result, json.load(f))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark of the startup time of the `tikki` entry point, measured by running
+`python -m tikki --validate` in fresh interpreters.
+
+Usage: python -m benchmarks.import_time [--runs N] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+# Dummy configuration, so that the benchmark runs without a database or network
+BENCHMARK_ENV = {
+    'TIKKI_JWT_SECRET': 'benchmark',
+    'TIKKI_SQLA_DB_URI': 'sqlite://',
+    'TIKKI_AUTH0_AUDIENCE': 'benchmark',
+    'TIKKI_AUTH0_JWKS_FILE': os.devnull,
+}
+
+
+def _get_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    for key, value in BENCHMARK_ENV.items():
+        env.setdefault(key, value)
+    return env
+
+
+def _get_slowest_imports(stderr: str, count: int) -> List[Dict[str, Any]]:
+    # lines are formatted as 'import time: self [us] | cumulative | imported package'
+    imports: List[Dict[str, Any]] = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append({'module': name.strip(), 'cumulative_ms': int(cumulative) / 1000})
+    imports.sort(key=lambda x: x['cumulative_ms'], reverse=True)
+    return imports[:count]
+
+
+def measure(runs: int = 10) -> Dict[str, Any]:
+    """
+    Measure the wall clock time of `python -m tikki --validate`.
+
+    :param runs: number of runs
+    :return: dict with timings in seconds
+    """
+    timings = []
+    env = _get_env()
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'tikki', '--validate'], env=env,
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started_at)
+    return {'runs': runs,
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'max': max(timings),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tikki startup time')
+    parser.add_argument('--runs', type=int, default=10, help='number of runs')
+    parser.add_argument('--importtime', action='store_true',
+                        help='also list the slowest imports')
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    if args.importtime:
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'tikki',
+                                  '--validate'], env=_get_env(), check=True,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        result['slowest_imports'] = _get_slowest_imports(process.stderr, 15)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
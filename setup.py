@@ -18,6 +18,7 @@ setup(
     url='https://github.com/tikki-fi/tikki',
     include_package_data=True,
     license='MIT',
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'tikki = tikki.__main__:main'
@@ -29,6 +30,7 @@ setup(
         'flask',
         'flask-cors',
         'flask-jwt-simple',
+        'gunicorn',
         'pandas',
         'pyjwt',
         'python-dateutil',
@@ -36,10 +38,12 @@ setup(
         'sqlalchemy-utils',
         'werkzeug',
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     classifiers=[
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
@@ -0,0 +1,95 @@
+"""
+Tests for app module
+"""
+import datetime
+import os
+from unittest import TestCase, mock
+import uuid
+
+from flask_jwt_simple import create_jwt
+
+from tikki import metrics
+from tikki.db import api as db_api
+from tikki.db.tables import Base, Record, RecordArchive, User
+
+TEST_ENV = {
+    'TIKKI_JWT_SECRET': 'secret',
+    'TIKKI_SQLA_DB_URI': 'sqlite://',
+    'TIKKI_AUTH0_AUDIENCE': 'test',
+    # refused at once, so that the keys are not fetched from Auth0
+    'TIKKI_AUTH0_JWKS_URL': 'http://127.0.0.1:9/jwks.json',
+    'TIKKI_QUERY_COUNT_HEADER': '1',
+}
+
+
+class AppTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with mock.patch.dict(os.environ, TEST_ENV):
+            from tikki import app
+        cls.app = app.app
+
+    def setUp(self):
+        self.globals = db_api.ENGINE, db_api.SESSION
+        db_api.init(self.app)
+        metrics.instrument_engine(db_api.ENGINE)
+        Base.metadata.create_all(db_api.ENGINE)
+        db_api.USER_CACHE.clear()
+        self.env = mock.patch.dict(os.environ, TEST_ENV)
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        db_api.ENGINE.dispose()
+        db_api.ENGINE, db_api.SESSION = self.globals
+
+    def get_headers(self, user_id):
+        now = datetime.datetime.utcnow()
+        with self.app.app_context():
+            token = create_jwt({'sub': user_id, 'rol': 1, 'iat': now,
+                                'exp': now + datetime.timedelta(hours=1)})
+        return {'Authorization': f'Bearer {token}'}
+
+    def test_repeated_user_request(self):
+        user_id = str(uuid.uuid4())
+        db_api.add_row(User, {'id': user_id, 'username': 'test', 'type_id': 1,
+                              'payload': {}})
+        headers = self.get_headers(user_id)
+        client = self.app.test_client()
+
+        counts = []
+        for _ in range(3):
+            response = client.get(f'/user?id={user_id}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['result'][0]['id'], user_id)
+            counts.append(int(response.headers['X-Query-Count']))
+        # the user is only read once, and then served from the user cache
+        self.assertEqual(counts, [1, 0, 0])
+
+    def test_authentication_reads_no_user(self):
+        user_id = str(uuid.uuid4())
+        response = self.app.test_client().get(f'/record?user_id={user_id}',
+                                              headers=self.get_headers(user_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Query-Count'], '1')
+
+    def test_get_archived_records(self):
+        user_id = str(uuid.uuid4())
+        now = datetime.datetime.now()
+        record = {'user_id': user_id, 'created_user_id': user_id, 'type_id': 1,
+                  'created_at': now, 'updated_at': now, 'payload': {'distance': 2400}}
+        record_id, archived_id = str(uuid.uuid4()), str(uuid.uuid4())
+        db_api.bulk_insert(Record, [dict(record, id=record_id)])
+        db_api.bulk_insert(RecordArchive, [dict(record, id=archived_id,
+                                                archived_at=now)])
+        client = self.app.test_client()
+        headers = self.get_headers(user_id)
+
+        response = client.get(f'/record?user_id={user_id}', headers=headers)
+        self.assertEqual([row['id'] for row in response.get_json()['result']],
+                         [record_id])
+        response = client.get(f'/record?user_id={user_id}&include_archive=1',
+                              headers=headers)
+        self.assertEqual([row['id'] for row in response.get_json()['result']],
+                         [record_id, archived_id])
+        self.assertIn('archived_at', response.get_json()['result'][1])
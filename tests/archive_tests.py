@@ -0,0 +1,69 @@
+"""
+Tests for archive module
+"""
+import datetime
+import uuid
+
+from tikki import export
+from tikki.db import api as db_api, archive, rollups
+from tikki.db.tables import Record, RecordArchive
+from tests.db_test_case import DbTestCase
+
+
+class ArchiveTestCase(DbTestCase):
+    def test_archive_records(self):
+        now = datetime.datetime.now()
+        user_id = str(uuid.uuid4())
+        rows = [{'id': str(uuid.uuid4()), 'user_id': user_id,
+                 'created_user_id': user_id, 'type_id': 1,
+                 'created_at': now - datetime.timedelta(days=days),
+                 'updated_at': now, 'payload': {'distance': 2000 + days}}
+                for days in [1, 400, 800, 1200]]
+        db_api.bulk_insert(Record, rows)
+
+        self.assertEqual(archive.archive_records(db_api.ENGINE, 1, batch_size=1), 3)
+        self.assertEqual([str(row.id) for row in db_api.get_rows(Record, {})],
+                         [rows[0]['id']])
+        archived = db_api.get_rows(RecordArchive, {})
+        self.assertEqual(sorted(row.result for row in archived), [2400, 2800, 3200])
+        self.assertEqual(archive.archive_records(db_api.ENGINE, 1), 0)
+
+        exported = ''.join(export.export_records('ndjson', {'type_id': 1}))
+        self.assertEqual(exported.count('\n'), 1)
+        exported = ''.join(export.export_records('ndjson', {'type_id': 1},
+                                                 include_archive=True))
+        self.assertEqual(exported.count('\n'), 4)
+
+        # archived records are part of rebuilt rollups
+        self.assertEqual(rollups.update_rollups(rebuild=True)['days'], 4)
+        result = rollups.get_rollups({'record_type_id': 1},
+                                     (now - datetime.timedelta(days=1200)).date(),
+                                     now.date())
+        self.assertEqual(sorted(row['mean'] for row in result), [2001, 2400, 2800, 3200])
+
+    def test_archived_progress_and_leaderboard(self):
+        now = datetime.datetime.now()
+        user_id, event_id = str(uuid.uuid4()), str(uuid.uuid4())
+        rows = [{'id': str(uuid.uuid4()), 'user_id': user_id,
+                 'created_user_id': user_id, 'event_id': event_id, 'type_id': 1,
+                 'created_at': now - datetime.timedelta(days=days),
+                 'updated_at': now, 'payload': {'distance': distance}}
+                for days, distance in [(1, 2400), (1200, 2600)]]
+        db_api.bulk_insert(Record, rows)
+        self.assertEqual(archive.archive_records(db_api.ENGINE, 1), 1)
+
+        progress = db_api.get_progress(user_id, 1, 'year')
+        self.assertEqual(progress['bucket'][0], f'{rows[1]["created_at"].year}-01-01')
+        self.assertEqual(progress['max'][0], 2600)
+        self.assertEqual(sum(progress['count']), 2)
+        self.assertEqual(progress['best'][-1], 2600)
+
+        leaderboard = db_api.get_leaderboard(event_id, 1)
+        self.assertEqual([(row['record_id'], row['result']) for row in leaderboard],
+                         [(rows[1]['id'], 2600)])
+
+    def test_get_cutoff(self):
+        self.assertEqual(archive.get_cutoff(datetime.datetime(2028, 2, 29, 15, 30), 3),
+                         datetime.datetime(2025, 2, 28))
+        self.assertEqual(archive.get_cutoff(datetime.datetime(2026, 10, 19, 0, 1), 3),
+                         datetime.datetime(2023, 10, 19))
@@ -0,0 +1,61 @@
+"""
+Tests for cache module
+"""
+import time
+from unittest import TestCase
+
+from tikki.cache import LRUCache
+
+
+class LRUCacheTestCase(TestCase):
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.stats['hit_rate'], 0.5)
+
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats['evictions'], 1)
+
+    def test_expiry(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1, expires_at=time.time() - 1)
+        cache.set('b', 2, expires_at=time.time() + 60)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_pop_and_clear(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.pop('a')
+        self.assertIsNone(cache.get('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_peek(self):
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        time.sleep(0.02)
+        # expired values are still returned, and usage is not recorded
+        self.assertEqual(cache.peek('a'), 1)
+        self.assertIsNone(cache.peek('c'))
+        self.assertEqual((cache.stats['hits'], cache.stats['misses']), (0, 0))
+        cache.set('c', 3)
+        self.assertIsNone(cache.peek('a'))
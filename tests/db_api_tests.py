@@ -0,0 +1,200 @@
+"""
+Tests for db api module
+"""
+import datetime
+from unittest import mock
+import uuid
+
+from tikki import utils
+from tikki.db import api as db_api, metadata
+from tikki.db.tables import Record, TestLimit, User
+from tests.db_test_case import DbTestCase
+
+
+class DbApiTestCase(DbTestCase):
+    def test_regenerate_limits_only_touches_changed_rows(self):
+        limits = [TestLimit(**limit.json_dict) for limit in metadata.test_limits[:3]]
+        with mock.patch.object(metadata, 'test_limits', limits):
+            stats = db_api.regenerate_limits()
+            self.assertEqual(stats['dim_test_limit']['inserted'], 3)
+
+            limits[0].lower_limit += 1
+            limits.pop()
+            stats = db_api.regenerate_limits()
+        self.assertEqual(stats['dim_test_limit'],
+                         {'inserted': 0, 'updated': 1, 'deleted': 1})
+        self.assertEqual(len(db_api.get_rows(TestLimit, {})), 2)
+
+    def test_get_result_quantile(self):
+        now = datetime.datetime.now()
+        user_ids = [str(uuid.uuid4()) for _ in range(4)]
+        for user_id, distance in zip(user_ids, [2000, 2400, 2800, 3200]):
+            db_api.add_row(Record, {'id': str(uuid.uuid4()), 'user_id': user_id,
+                                    'created_user_id': user_id, 'type_id': 1,
+                                    'created_at': now, 'updated_at': now,
+                                    'payload': {'distance': distance}})
+        # an older and better result of the first user is not considered
+        db_api.bulk_insert(Record, [{'id': str(uuid.uuid4()), 'user_id': user_ids[0],
+                                     'created_user_id': user_ids[0], 'type_id': 1,
+                                     'created_at': now - datetime.timedelta(days=1),
+                                     'updated_at': now, 'payload': {'distance': 4000}}])
+        since = now - datetime.timedelta(days=7)
+        self.assertEqual(db_api.get_result_quantile(1, user_ids[0], since), 0.25)
+        self.assertEqual(db_api.get_result_quantile(1, user_ids[2], since), 0.75)
+        self.assertEqual(db_api.get_result_quantile(1, str(uuid.uuid4()), since), 0)
+
+        # users whose only result is years old are ranked too
+        old_user_id = str(uuid.uuid4())
+        db_api.add_row(Record, {'id': str(uuid.uuid4()), 'user_id': old_user_id,
+                                'created_user_id': old_user_id, 'type_id': 1,
+                                'created_at': now - datetime.timedelta(days=3 * 365),
+                                'payload': {'distance': 1500}})
+        self.assertEqual(db_api.get_result_quantile(1, old_user_id), 0.2)
+        self.assertEqual(db_api.get_result_quantile(1, user_ids[0]), 0.4)
+        self.assertEqual(db_api.get_result_quantile(1, old_user_id, since), 0)
+
+    def test_payload_contains(self):
+        payload = {'city': 'Turku', 'tags': ['a', 'b'], 'flag': True, 'n': 1,
+                   'nested': {'x': 1, 'y': 2}}
+        self.assertTrue(db_api.payload_contains(payload, {}))
+        self.assertTrue(db_api.payload_contains(payload, {'city': 'Turku',
+                                                          'nested': {'x': 1}}))
+        self.assertTrue(db_api.payload_contains(payload, {'tags': ['b']}))
+        self.assertFalse(db_api.payload_contains(payload, {'city': 'Oulu'}))
+        self.assertFalse(db_api.payload_contains(payload, {'tags': 'a'}))
+        self.assertFalse(db_api.payload_contains(payload, {'missing': None}))
+        # booleans are not numbers in json
+        self.assertFalse(db_api.payload_contains(payload, {'flag': 1}))
+        self.assertFalse(db_api.payload_contains(payload, {'n': True}))
+
+    def test_get_rows_payload_filter(self):
+        for username, city in [('a', 'Turku'), ('b', 'Oulu'), ('c', 'Turku')]:
+            db_api.add_row(User, {'id': str(uuid.uuid4()), 'username': username,
+                                  'type_id': 1,
+                                  'payload': {'city': city}})
+        rows = db_api.get_rows(User, {}, {'city': 'Turku'})
+        self.assertEqual(sorted(row.username for row in rows), ['a', 'c'])
+        self.assertEqual(len(db_api.get_rows(User, {'username': 'b'},
+                                             {'city': 'Turku'})), 0)
+
+    def test_get_leaderboard(self):
+        db_api.LEADERBOARD_CACHE.clear()
+        now = datetime.datetime.now()
+        event_id = str(uuid.uuid4())
+        user_ids = [str(uuid.uuid4()) for _ in range(3)]
+        record_ids = [str(uuid.uuid4()) for _ in range(4)]
+        for record_id, user_id, distance in zip(record_ids, user_ids + user_ids[:1],
+                                                [2400, 2800, 2400, 2600]):
+            db_api.add_row(Record, {
+                'id': record_id, 'user_id': user_id, 'created_user_id': user_id,
+                'event_id': event_id, 'type_id': 1, 'created_at': now,
+                'updated_at': now, 'payload': {'distance': distance}})
+        leaderboard = db_api.get_leaderboard(event_id, 1)
+        self.assertEqual([(row['rank'], row['user_id'], row['result'])
+                          for row in leaderboard],
+                         [(1, user_ids[1], 2800), (2, user_ids[0], 2600),
+                          (3, user_ids[2], 2400)])
+        self.assertIs(db_api.get_leaderboard(event_id, 1), leaderboard)
+
+        # committing a record of the event invalidates its leaderboards
+        db_api.update_row(Record, {'id': record_ids[2]},
+                          {'payload': {'distance': 3000}})
+        leaderboard = db_api.get_leaderboard(event_id, 1)
+        self.assertEqual([(row['rank'], row['result']) for row in leaderboard],
+                         [(1, 3000), (2, 2800), (3, 2600)])
+
+        db_api.delete_row(Record, {'id': record_ids[2]})
+        self.assertEqual(len(db_api.get_leaderboard(event_id, 1)), 2)
+
+    def test_get_progress(self):
+        user_id = str(uuid.uuid4())
+        for created_at, pushups in [('2025-01-06 10:00', 20), ('2025-01-20 10:00', 30),
+                                    ('2025-03-02 10:00', 25), ('2025-06-01 10:00', 40)]:
+            created_at = datetime.datetime.strptime(created_at, '%Y-%m-%d %H:%M')
+            db_api.add_row(Record, {'id': str(uuid.uuid4()), 'user_id': user_id,
+                                    'created_user_id': user_id, 'type_id': 2,
+                                    'created_at': created_at, 'updated_at': created_at,
+                                    'payload': {'pushups': pushups}})
+        series = db_api.get_progress(user_id, 2, 'month')
+        self.assertEqual(series['bucket'], ['2025-01-01', '2025-03-01', '2025-06-01'])
+        self.assertEqual(series['mean'], [25, 25, 40])
+        self.assertEqual(series['count'], [2, 1, 1])
+        self.assertEqual(series['best'], [30, 30, 40])
+
+        series = db_api.get_progress(user_id, 2, 'week')
+        self.assertEqual(series['bucket'][:2], ['2025-01-06', '2025-01-20'])
+
+        series = db_api.get_progress(user_id, 2, 'month', max_points=2)
+        self.assertEqual(series['bucket'], ['2025-01-01', '2025-06-01'])
+        self.assertEqual(series['count'], [3, 1])
+        self.assertEqual(series['mean'], [25, 40])
+        self.assertEqual(series['min'], [20, 40])
+
+    def test_get_rows_since(self):
+        user_id = str(uuid.uuid4())
+        updated_at = datetime.datetime(2025, 1, 1)
+        record_ids = sorted(str(uuid.uuid4()) for _ in range(3))
+        db_api.bulk_insert(Record, [
+            {'id': record_id, 'user_id': user_id, 'created_user_id': user_id,
+             'type_id': 0, 'created_at': updated_at, 'updated_at': updated_at,
+             'payload': {}} for record_id in record_ids])
+        rows = db_api.get_rows_since(Record, updated_at, {'user_id': user_id})
+        self.assertEqual([str(row.id) for row in rows], record_ids)
+        # rows sharing the timestamp of the position are ordered by key
+        rows = db_api.get_rows_since(Record, updated_at, {'user_id': user_id},
+                                     record_ids[0])
+        self.assertEqual([str(row.id) for row in rows], record_ids[1:])
+
+    def test_updated_at_is_set_by_database(self):
+        user_id = str(uuid.uuid4())
+        created_at = datetime.datetime(2025, 1, 1)
+        db_api.add_row(Record, {'id': str(uuid.uuid4()), 'user_id': user_id,
+                                'created_user_id': user_id, 'type_id': 0,
+                                'created_at': created_at, 'updated_at': created_at,
+                                'payload': {}})
+        record = db_api.update_row(Record, {'user_id': user_id}, {'payload': {'a': 1}})
+        self.assertGreater(record.updated_at, created_at)
+
+    def test_tombstone_payload(self):
+        user_id = str(uuid.uuid4())
+        created_at = datetime.datetime(2025, 1, 1)
+        db_api.add_row(User, {'id': user_id, 'username': 'a', 'type_id': 1,
+                              'payload': {'birthDate': '01.01.1990'}})
+        db_api.add_row(Record, {'id': str(uuid.uuid4()), 'user_id': user_id,
+                                'created_user_id': user_id, 'type_id': 1,
+                                'created_at': created_at,
+                                'payload': {'distance': 2400}})
+        db_api.delete_rows(Record, {'user_id': user_id})
+        db_api.delete_row(User, {'id': user_id})
+        tombstones = db_api.get_tombstones_since(utils.SYNC_EPOCH)
+        self.assertEqual([tombstone.payload for tombstone in tombstones],
+                         [{'created_at': created_at.isoformat(), 'type_id': 1}, {}])
+        self.assertEqual(tombstones[1].row_key, {'id': user_id})
+        tombstones = db_api.get_tombstones_since(tombstones[0].deleted_at, None,
+                                                 tombstones[0].id)
+        self.assertEqual([tombstone.table_name for tombstone in tombstones],
+                         ['fact_user'])
+
+    def test_format_copy_row(self):
+        values = [None, '', 'a "b",c', 1, 2.5, True, {'a': None},
+                  datetime.datetime(2025, 1, 2, 3, 4, 5)]
+        self.assertEqual(db_api._format_copy_row(values),
+                         ',"","a ""b"",c",1,2.5,true,"{""a"": null}",'
+                         '"2025-01-02T03:04:05"\n')
+
+    def test_invalidate_user(self):
+        user_id = str(uuid.uuid4())
+        db_api.add_row(User, {'id': user_id, 'username': 'a', 'type_id': 1,
+                              'payload': {}})
+        user = db_api.get_user({'id': user_id})
+        stats = db_api.USER_CACHE.stats
+        db_api.invalidate_user(user_id)
+        self.assertIsNone(db_api.USER_CACHE.peek(('id', user_id)))
+        self.assertIsNone(db_api.USER_CACHE.peek(('username', 'a')))
+        self.assertEqual(db_api.USER_CACHE.stats['hits'], stats['hits'])
+        self.assertEqual(db_api.USER_CACHE.stats['misses'], stats['misses'])
+
+        # the username entry is dropped even if the id entry is gone
+        db_api.USER_CACHE.set(('username', 'a'), user)
+        db_api.invalidate_user(user_id, 'a')
+        self.assertIsNone(db_api.USER_CACHE.peek(('username', 'a')))
@@ -0,0 +1,23 @@
+"""
+Base test case for tests that use the database
+"""
+from unittest import TestCase, mock
+
+from tikki.db import api as db_api
+from tikki.db.tables import Base
+
+
+class DbTestCase(TestCase):
+    """
+    Test case that runs each test against a new in-memory SQLite database, and restores
+    the engine and session factory of `tikki.db.api` afterwards.
+    """
+    def setUp(self):
+        self.globals = db_api.ENGINE, db_api.SESSION
+        app = mock.Mock(config={'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        db_api.init(app)
+        Base.metadata.create_all(db_api.ENGINE)
+
+    def tearDown(self):
+        db_api.ENGINE.dispose()
+        db_api.ENGINE, db_api.SESSION = self.globals
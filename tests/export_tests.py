@@ -0,0 +1,35 @@
+"""
+Tests for export module
+"""
+import datetime
+import json
+from unittest import TestCase
+from uuid import UUID
+
+from tikki import export
+
+
+class ExportSerializationTestCase(TestCase):
+    row = {'id': UUID('16cbe174-4feb-456a-89e4-b591e9a234ec'),
+           'created_at': datetime.datetime(2018, 10, 1, 12, 0),
+           'username': 'user',
+           'type_id': 1,
+           'payload': {'distance': 2400}}
+
+    def test_to_ndjson(self):
+        lines = list(export.to_ndjson([self.row, self.row]))
+        self.assertEqual(len(lines), 2)
+        obj = json.loads(lines[0])
+        self.assertEqual(obj['id'], '16cbe174-4feb-456a-89e4-b591e9a234ec')
+        self.assertEqual(obj['created_at'], '2018-10-01T12:00:00')
+        self.assertDictEqual(obj['payload'], {'distance': 2400})
+        self.assertIsNone(obj['event_id'])
+
+    def test_to_csv(self):
+        lines = list(export.to_csv([self.row]))
+        self.assertEqual(lines[0].strip(), ','.join(export.EXPORT_COLUMNS))
+        self.assertIn('"{""distance"": 2400}"', lines[1])
+
+    def test_to_csv_empty(self):
+        lines = list(export.to_csv([]))
+        self.assertEqual(len(lines), 1)
@@ -0,0 +1,38 @@
+"""
+Tests for importer module
+"""
+from unittest import TestCase
+
+from tikki import importer
+
+USER_ID = '11111111-1111-1111-1111-111111111111'
+
+
+class ImporterValidateChunkTestCase(TestCase):
+    def test_payload_from_columns(self):
+        raw_rows = [{'user_id': USER_ID, 'type_id': 1.0, 'distance': 2400.0,
+                     'pushups': float('nan')}]
+        rows, errors, _ = importer.validate_chunk(2, raw_rows)
+        self.assertListEqual(errors, [])
+        self.assertEqual(rows[0]['type_id'], 1)
+        self.assertDictEqual(rows[0]['payload'], {'distance': 2400})
+        self.assertEqual(rows[0]['created_user_id'], USER_ID)
+
+    def test_payload_from_json(self):
+        raw_rows = [{'user_id': USER_ID, 'type_id': 2, 'payload': '{"pushups": 35}'}]
+        rows, errors, _ = importer.validate_chunk(2, raw_rows)
+        self.assertDictEqual(rows[0]['payload'], {'pushups': 35})
+
+    def test_invalid_rows(self):
+        raw_rows = [{'user_id': USER_ID, 'type_id': 2, 'pushups': 'many'},
+                    {'user_id': None, 'type_id': 1, 'distance': 2400},
+                    {'user_id': USER_ID, 'type_id': 99},
+                    {'user_id': 'not-a-uuid', 'type_id': 1, 'distance': 2400},
+                    {'user_id': USER_ID, 'event_id': 'x', 'type_id': 1, 'distance': 2400},
+                    {'user_id': USER_ID, 'type_id': 'one', 'distance': 2400}]
+        rows, errors, stats = importer.validate_chunk(2, raw_rows)
+        self.assertListEqual(rows, [])
+        self.assertEqual(len(errors), 6)
+        self.assertTrue(errors[0].startswith('line 2:'))
+        # only the payload of the first row reaches validation
+        self.assertEqual((stats[2].count, stats[2].failures), (1, 1))
@@ -0,0 +1,43 @@
+"""
+Tests for db instrumentation module
+"""
+from unittest import TestCase, mock
+
+import sqlalchemy as sa
+
+from tikki import metrics
+from tikki.db import instrumentation
+
+
+class InstrumentationTestCase(TestCase):
+    def test_normalize_statement(self):
+        self.assertEqual(
+            instrumentation.normalize_statement(
+                'SELECT *\n FROM fact_record WHERE id IN (%(id_1)s, %(id_2)s)'),
+            'SELECT * FROM fact_record WHERE id IN (?)')
+        self.assertEqual(
+            instrumentation.normalize_statement('SELECT * FROM a WHERE id = ?'),
+            instrumentation.normalize_statement('SELECT * FROM a WHERE id = :id'))
+
+    def test_get_parameter_shape(self):
+        self.assertEqual(instrumentation.get_parameter_shape({'a': 1, 'b': 'x'}),
+                         {'a': 'int', 'b': 'str'})
+        self.assertEqual(instrumentation.get_parameter_shape([(1,), (2,)], True),
+                         "2 x ['int']")
+
+    def test_slow_query_logged(self):
+        engine = sa.create_engine('sqlite://')
+        metrics.instrument_engine(engine)
+        with mock.patch.object(instrumentation, 'SLOW_QUERY_SECONDS', 0):
+            with self.assertLogs(instrumentation.log, 'WARNING') as logs:
+                engine.execute(sa.text('SELECT :value'), value=1)
+        self.assertIn("parameters: ['int']", logs.output[0])
+
+    def test_failed_statement_not_leaked(self):
+        engine = sa.create_engine('sqlite://')
+        metrics.instrument_engine(engine)
+        with engine.connect() as connection:
+            with self.assertRaises(sa.exc.OperationalError):
+                connection.execute('SELECT * FROM missing')
+            connection.execute('SELECT 1')
+            self.assertEqual(connection.info['metrics_started_at'], [])
@@ -0,0 +1,75 @@
+"""
+Tests for jwks module
+"""
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+from jwt.algorithms import RSAAlgorithm
+
+from tikki import exceptions
+from tikki.jwks import JwksCache
+
+
+def _generate_jwk(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048,
+                                           backend=default_backend())
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk['kid'] = kid
+    return private_key, jwk
+
+
+class JwksCacheTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key_a, jwk_a = _generate_jwk('a')
+        cls.private_key_b, jwk_b = _generate_jwk('b')
+        fd, cls.path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'keys': [jwk_a, jwk_b]}, f)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def test_get_key_by_kid(self):
+        jwks = JwksCache(local_path=self.path, cache_path=None)
+        jwks.load()
+        token = jwt.encode({'sub': 'user'}, self.private_key_b, algorithm='RS256',
+                           headers={'kid': 'b'})
+        kid = jwt.get_unverified_header(token)['kid']
+        payload = jwt.decode(token, jwks.get_key(kid), algorithms=['RS256'])
+        self.assertEqual(payload['sub'], 'user')
+
+    def test_unknown_kid(self):
+        jwks = JwksCache(local_path=self.path, cache_path=None)
+        jwks.load()
+        self.assertRaises(exceptions.Flask400Exception, jwks.get_key, 'c')
+        # without a key id the key is ambiguous
+        self.assertRaises(exceptions.Flask400Exception, jwks.get_key, None)
+
+    def test_offline_load_from_cache(self):
+        jwks = JwksCache(url='http://127.0.0.1:9/jwks.json', cache_path=self.path,
+                         timeout=0.1)
+        jwks.load()
+        self.assertSetEqual(set(jwks.keys), {'a', 'b'})
+
+    def test_offline_load_without_cache(self):
+        jwks = JwksCache(url='http://127.0.0.1:9/jwks.json', cache_path=None,
+                         timeout=0.1)
+        jwks.load()
+        self.assertDictEqual(jwks.keys, {})
+
+    def test_untrusted_cache_is_not_loaded(self):
+        jwks = JwksCache(url='http://127.0.0.1:9/jwks.json', cache_path=self.path,
+                         timeout=0.1)
+        os.chmod(self.path, 0o666)
+        try:
+            jwks.load()
+        finally:
+            os.chmod(self.path, 0o600)
+        self.assertDictEqual(jwks.keys, {})
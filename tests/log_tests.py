@@ -0,0 +1,53 @@
+"""
+Tests for log module
+"""
+import json
+import logging
+import sys
+from unittest import TestCase
+
+from flask import Flask, g
+
+from tikki import log
+
+
+class QueueHandlerTestCase(TestCase):
+    def _prepare(self):
+        handler = log.QueueHandler(None)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord('tikki', logging.ERROR, __file__, 1,
+                                       'failed %s', ('x',), sys.exc_info())
+        return handler.prepare(record)
+
+    def test_prepare_keeps_traceback(self):
+        record = self._prepare()
+        self.assertEqual(record.msg, 'failed x')
+        self.assertIsNone(record.args)
+        self.assertIsNone(record.exc_info)
+        self.assertIn('ValueError: boom', record.exc_text)
+
+    def test_json_exception(self):
+        obj = json.loads(log.JsonFormatter().format(self._prepare()))
+        self.assertEqual(obj['message'], 'failed x')
+        self.assertIn('ValueError: boom', obj['exception'])
+
+    def test_text_exception(self):
+        text = logging.Formatter('%(message)s').format(self._prepare())
+        self.assertTrue(text.startswith('failed x\nTraceback'))
+
+
+class RequestContextFilterTestCase(TestCase):
+    def test_identity_from_request(self):
+        app = Flask(__name__)
+        record = logging.LogRecord('tikki', logging.INFO, __file__, 1, 'msg', None,
+                                   None)
+        with app.test_request_context('/user'):
+            g.jwt_identity = 'user-1'
+            log.RequestContextFilter().filter(record)
+        self.assertEqual(record.jwt_identity, 'user-1')
+        self.assertTrue(record.url.endswith('/user'))
+
+        log.RequestContextFilter().filter(record)
+        self.assertEqual(record.jwt_identity, '')
@@ -0,0 +1,65 @@
+"""
+Tests for metadata module
+"""
+from unittest import TestCase
+
+from tikki.db import metadata
+from tikki.db.tables import Gender
+
+
+class MetadataTestCase(TestCase):
+    def test_dimensions(self):
+        self.assertEqual(metadata.genders[int(metadata.GenderEnum.FEMALE)].name,
+                         'Female')
+        self.assertEqual(len(metadata.dim_map[Gender]), 3)
+        self.assertIsInstance(metadata.dim_map[Gender][0].id, int)
+
+    def test_test_limits(self):
+        limits = [limit for limit in metadata.test_limits
+                  if limit.record_type_id == int(metadata.RecordTypeEnum.COOPERS_TEST)
+                  and limit.military_status_id == int(metadata.MilitaryStatusEnum.SOLDIER)
+                  and limit.gender_id == int(metadata.GenderEnum.MALE)
+                  and limit.age_lower_limit == 0]
+        self.assertEqual(limits[0].score, 5)
+        self.assertEqual(limits[0].lower_limit, 3300)
+        self.assertEqual(limits[1].upper_limit, limits[0].lower_limit)
+
+    def test_unknown_attribute(self):
+        self.assertRaises(AttributeError, getattr, metadata, 'unknown')
+
+    def test_get_result(self):
+        self.assertEqual(metadata.get_result(1, {'distance': 2400}), 2400.0)
+        self.assertIsNone(metadata.get_result(1, {'distance': '2400'}))
+        self.assertIsNone(metadata.get_result(6, {'single': 1}))
+
+    def test_dimension_registry(self):
+        registry = metadata.get_dimension_registry()
+        self.assertEqual(set(registry['dimensions']),
+                         {'categories', 'genders', 'military_statuses', 'performances',
+                          'record_types', 'user_types'})
+        self.assertIs(metadata.get_dimension_registry(), registry)
+
+        metadata.get_dimension_registry.cache_clear()
+        self.assertEqual(metadata.get_dimension_registry()['version'],
+                         registry['version'])
+
+        gender = Gender(id=99, name='test')
+        metadata.get_dim_map()[Gender].append(gender)
+        try:
+            metadata.get_dimension_registry.cache_clear()
+            self.assertNotEqual(metadata.get_dimension_registry()['version'],
+                                registry['version'])
+        finally:
+            metadata.get_dim_map()[Gender].remove(gender)
+            metadata.get_dimension_registry.cache_clear()
+
+    def test_get_performance(self):
+        coopers = int(metadata.RecordTypeEnum.COOPERS_TEST)
+        male = int(metadata.GenderEnum.MALE)
+        civilian = int(metadata.MilitaryStatusEnum.CIVILIAN)
+        self.assertEqual(metadata.get_performance(coopers, civilian, male, 26, 4000),
+                         int(metadata.PerformanceEnum.EXCELLENT))
+        self.assertEqual(metadata.get_performance(coopers, civilian, male, 26, 0),
+                         int(metadata.PerformanceEnum.INSUFFICIENT))
+        self.assertIsNone(metadata.get_performance(coopers, civilian, male, None, 3000))
+        self.assertIsNone(metadata.get_performance(coopers, None, None, 26, 3000))
@@ -0,0 +1,31 @@
+"""
+Tests for metrics module
+"""
+from unittest import TestCase
+
+from tikki import metrics
+
+
+class MetricsTestCase(TestCase):
+    def test_counter(self):
+        counter = metrics.Counter('test_total', 'Test counter')
+        counter.inc((('route', '/a'),))
+        counter.inc((('route', '/a'),), 2)
+        lines = list(counter.render())
+        self.assertEqual(lines[1], '# TYPE test_total counter')
+        self.assertEqual(lines[2], 'test_total{route="/a"} 3')
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram', buckets=(1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+        lines = list(histogram.render())
+        self.assertEqual(lines[2:], ['test_seconds_bucket{le="1"} 2.0',
+                                     'test_seconds_bucket{le="2"} 3.0',
+                                     'test_seconds_bucket{le="+Inf"} 4.0',
+                                     'test_seconds_count 4.0',
+                                     'test_seconds_sum 6.0'])
+
+    def test_gauge(self):
+        gauge = metrics.Gauge('test_size', 'Test gauge', lambda: {(('cache', 'a'),): 5})
+        self.assertEqual(list(gauge.render())[2], 'test_size{cache="a"} 5')
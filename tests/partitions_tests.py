@@ -0,0 +1,28 @@
+"""
+Tests for partitions module
+"""
+import datetime
+from unittest import TestCase, mock
+
+from tikki.db import partitions
+
+
+class PartitionsTestCase(TestCase):
+    def test_add_months(self):
+        self.assertEqual(partitions.add_months(datetime.date(2019, 11, 1), 3),
+                         datetime.date(2020, 2, 1))
+        self.assertEqual(partitions.add_months(datetime.date(2020, 1, 1), -1),
+                         datetime.date(2019, 12, 1))
+
+    def test_get_partition_name(self):
+        self.assertEqual(partitions.get_partition_name(datetime.date(2020, 2, 1)),
+                         'fact_record_202002')
+
+    def test_create_partitions_skips_existing(self):
+        with mock.patch.object(partitions, 'create_partition',
+                               side_effect=[False, True, True]) as create_partition:
+            created = partitions.create_partitions(mock.Mock(),
+                                                   datetime.date(2019, 12, 1),
+                                                   datetime.date(2020, 2, 1))
+        self.assertEqual(create_partition.call_count, 3)
+        self.assertEqual(created, ['fact_record_202001', 'fact_record_202002'])
@@ -0,0 +1,52 @@
+"""
+Tests for profiling module
+"""
+import os
+import pstats
+import tempfile
+from unittest import TestCase, mock
+
+from flask import Flask
+from flask_jwt_simple import JWTManager, create_jwt
+
+from tikki import profiling
+
+
+class RateLimiterTestCase(TestCase):
+    def test_acquire(self):
+        limiter = profiling.RateLimiter(2)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['JWT_SECRET_KEY'] = 'secret'
+        JWTManager(self.app).jwt_data_loader(lambda identity: identity)
+        self.app.add_url_rule('/', 'index', lambda: 'ok')
+        env = {'TIKKI_PROFILING': '1', 'TIKKI_PROFILE_DIR': self.directory.name}
+        with mock.patch.dict(os.environ, env):
+            profiling.init_app(self.app)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _get(self, role):
+        with self.app.test_request_context():
+            token = create_jwt({'sub': 'x', 'rol': role})
+        headers = {'Authorization': f'Bearer {token}', profiling.PROFILE_HEADER: '1'}
+        return self.app.test_client().get('/', headers=headers)
+
+    def test_admin_request_profiled(self):
+        response = self._get(profiling.ADMIN_ROLE)
+        name = response.headers[profiling.PROFILE_ID_HEADER]
+        stats = pstats.Stats(os.path.join(self.directory.name, name))
+        self.assertGreater(stats.total_calls, 0)
+
+    def test_user_request_not_profiled(self):
+        response = self._get(1)
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, response.headers)
+        self.assertEqual(os.listdir(self.directory.name), [])
@@ -0,0 +1,123 @@
+"""
+Tests for rollups module
+"""
+import datetime
+import uuid
+
+from tikki.db import api as db_api, rollups
+from tikki.db.tables import Event, Record, RollupStaleDay, RollupWatermark, User
+from tests.db_test_case import DbTestCase
+
+
+class RollupsTestCase(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user_id = str(uuid.uuid4())
+        db_api.add_row(User, {'id': self.user_id, 'username': 'test', 'type_id': 1,
+                              'payload': {'birthDate': '01.06.1990', 'genderId': 1,
+                                          'militaryStatusId': 1}})
+        self.event_id = str(uuid.uuid4())
+        db_api.add_row(Event, {'id': self.event_id, 'organization_id': 7,
+                               'name': 'test', 'description': 'test',
+                               'event_at': datetime.datetime(2025, 3, 1),
+                               'payload': {}})
+
+    def add_record(self, created_at, distance, event_id=None) -> str:
+        record_id = str(uuid.uuid4())
+        db_api.add_row(Record, {'id': record_id, 'user_id': self.user_id,
+                                'created_user_id': self.user_id, 'event_id': event_id,
+                                'type_id': 1, 'created_at': created_at,
+                                'payload': {'distance': distance}})
+        return record_id
+
+    def get_rollups(self):
+        return rollups.get_rollups({'record_type_id': 1}, datetime.date(2025, 1, 1),
+                                   datetime.date(2025, 12, 31))
+
+    def test_update_rollups(self):
+        day = datetime.datetime(2025, 3, 1, 12)
+        self.add_record(day, 2000, self.event_id)
+        self.add_record(day, 2600, self.event_id)
+        record_id = self.add_record(day, 3000, self.event_id)
+        self.add_record(day, 2400)
+        # two rollups and four distinct performance categories
+        self.assertEqual(rollups.update_rollups(), {'days': 1, 'rows': 6})
+
+        result = self.get_rollups()
+        self.assertEqual([(row['organization_id'], row['count'], row['median'])
+                          for row in result], [(0, 1, 2400), (7, 3, 2600)])
+        self.assertEqual(sum(result[1]['performance'].values()), 3)
+
+        # only days with changes since the watermark are recomputed
+        self.assertEqual(rollups.update_rollups(rebuild=False)['days'], 1)
+        self.skip_overlap()
+        self.assertEqual(rollups.update_rollups()['days'], 0)
+
+        # deleted records are found through their tombstones
+        db_api.delete_row(Record, {'id': record_id})
+        self.assertEqual(rollups.update_rollups()['days'], 1)
+        self.assertEqual([(row['organization_id'], row['count'], row['mean'])
+                          for row in self.get_rollups()], [(0, 1, 2400), (7, 2, 2300)])
+
+        before = self.get_rollups()
+        self.assertEqual(rollups.update_rollups(rebuild=True)['days'], 1)
+        self.assertEqual(self.get_rollups(), before)
+
+    def test_moved_record(self):
+        record_id = self.add_record(datetime.datetime(2025, 3, 1, 12), 2000)
+        self.add_record(datetime.datetime(2025, 3, 1, 13), 2600)
+        rollups.update_rollups()
+
+        # the day a record is moved away from is recomputed along with the new one
+        db_api.update_row(Record, {'id': record_id},
+                          {'created_at': datetime.datetime(2025, 3, 2, 12)})
+        self.assertEqual(rollups.update_rollups()['days'], 2)
+        self.assertEqual([(row['day'], row['count']) for row in self.get_rollups()],
+                         [('2025-03-01', 1), ('2025-03-02', 1)])
+
+        session = db_api.SESSION()
+        self.assertEqual(session.query(RollupStaleDay).count(), 0)
+        session.close()
+
+        # updates that do not move records leave no stale days
+        db_api.update_row(Record, {'id': record_id}, {'payload': {'distance': 2100}})
+        session = db_api.SESSION()
+        self.assertEqual(session.query(RollupStaleDay).count(), 0)
+        session.close()
+
+    def skip_overlap(self):
+        # so that the next update only finds the records through the stale days
+        session = db_api.SESSION()
+        watermark = session.query(RollupWatermark).one()
+        watermark.watermark = db_api.get_database_time() + rollups.WATERMARK_OVERLAP
+        session.commit()
+        session.close()
+
+    def assert_incremental_equals_rebuild(self):
+        rollups.update_rollups()
+        incremental = self.get_rollups()
+        rollups.update_rollups(rebuild=True)
+        self.assertEqual(incremental, self.get_rollups())
+        return incremental
+
+    def test_event_moved_to_organization(self):
+        self.add_record(datetime.datetime(2025, 3, 1, 12), 2400, self.event_id)
+        self.add_record(datetime.datetime(2025, 3, 2, 12), 2600, self.event_id)
+        rollups.update_rollups()
+        self.skip_overlap()
+
+        db_api.update_row(Event, {'id': self.event_id}, {'organization_id': 8})
+        result = self.assert_incremental_equals_rebuild()
+        self.assertEqual({row['organization_id'] for row in result}, {8})
+
+    def test_user_payload_changed(self):
+        self.add_record(datetime.datetime(2025, 3, 1, 12), 2400)
+        rollups.update_rollups()
+        before = self.get_rollups()[0]['performance']
+        self.skip_overlap()
+
+        db_api.update_row(User, {'id': self.user_id},
+                          {'payload': {'birthDate': '01.06.1960', 'genderId': 2,
+                                       'militaryStatusId': 1}})
+        result = self.assert_incremental_equals_rebuild()
+        self.assertNotEqual(result[0]['performance'], before)
@@ -0,0 +1,30 @@
+"""
+Tests for seed module
+"""
+import datetime
+from unittest import TestCase
+
+from tikki import seed, validators
+
+
+class GeneratorTestCase(TestCase):
+    reference_date = datetime.datetime(2020, 1, 1)
+
+    def _generate(self, random_seed):
+        generator = seed.Generator(random_seed, self.reference_date)
+        events = generator.generate_events(10)
+        user = generator.generate_user(0)
+        status_events = events[user['payload']['militaryStatusId']]
+        records = list(generator.generate_records(user, status_events, 50))
+        return user, records
+
+    def test_reproducible(self):
+        self.assertEqual(self._generate(1), self._generate(1))
+        self.assertNotEqual(self._generate(1), self._generate(2))
+
+    def test_records_are_valid(self):
+        user, records = self._generate(0)
+        for record in records:
+            self.assertEqual(record['user_id'], user['id'])
+            self.assertLessEqual(record['created_at'], self.reference_date)
+            validators.validate_payload(record['type_id'], record['payload'])
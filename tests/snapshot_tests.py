@@ -0,0 +1,121 @@
+"""
+Tests for snapshot module
+"""
+import datetime
+import os
+import tempfile
+import time
+from unittest import TestCase, mock, skipIf
+import uuid
+
+from tikki import snapshot
+from tikki.db import api as db_api
+from tikki.db.tables import Record, User
+from tikki.exceptions import AppException
+from tests.db_test_case import DbTestCase
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class SnapshotTestCase(TestCase):
+    def test_get_partition_path(self):
+        self.assertEqual(snapshot.get_partition_path(()), '')
+        self.assertEqual(snapshot.get_partition_path((('type_id', 1), ('year', 2025))),
+                         os.path.join('type_id=1', 'year=2025'))
+
+    def test_get_result_columns(self):
+        columns = snapshot.get_result_columns({'type_id': 2, 'result': 30.0})
+        self.assertEqual(columns['pushups'], 30.0)
+        self.assertIsNone(columns['distance'])
+        columns = snapshot.get_result_columns({'type_id': 5, 'result': None})
+        self.assertEqual(set(columns.values()), {None})
+
+    @skipIf(pyarrow is not None, 'pyarrow is installed')
+    def test_snapshot_requires_pyarrow(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.assertRaises(AppException, snapshot.snapshot, output_dir)
+
+
+@skipIf(pyarrow is None, 'pyarrow is not installed')
+class SnapshotWriteTestCase(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.output_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+        super().tearDown()
+
+    def add_record(self, user_id, type_id, created_at, payload):
+        record_id = str(uuid.uuid4())
+        db_api.add_row(Record, {'id': record_id, 'user_id': user_id,
+                                'created_user_id': user_id, 'type_id': type_id,
+                                'created_at': created_at, 'payload': payload})
+        return record_id
+
+    def test_snapshot(self):
+        user_id = str(uuid.uuid4())
+        db_api.add_row(User, {'id': user_id, 'username': 'test', 'type_id': 1,
+                              'payload': {}})
+        self.add_record(user_id, 1, datetime.datetime(2024, 5, 1), {'distance': 2400})
+        self.add_record(user_id, 1, datetime.datetime(2025, 5, 1), {'distance': 2600})
+        self.add_record(user_id, 2, datetime.datetime(2025, 5, 1), {'pushups': 30})
+        # rows written in the millisecond the snapshot starts are in the next one too
+        time.sleep(0.01)
+
+        output_dir = self.output_dir.name
+        result = snapshot.snapshot(output_dir, chunk_size=2)
+        self.assertIsNone(result['since'])
+        self.assertEqual(result['rows']['fact_record'], 3)
+        self.assertEqual(result['rows']['fact_user'], 1)
+
+        path = os.path.join(output_dir, 'fact_record', 'type_id=1', 'year=2025',
+                            f'part-{result["id"]}.parquet')
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column('distance').to_pylist(), [2600.0])
+        self.assertEqual(table.column('pushups').to_pylist(), [None])
+        self.assertEqual(table.column('user_id').to_pylist(), [user_id])
+
+        dataset = pyarrow.parquet.read_table(os.path.join(output_dir, 'fact_record'))
+        self.assertEqual(dataset.num_rows, 3)
+
+        # incremental snapshots only contain rows written since the previous one
+        time.sleep(0.01)
+        self.add_record(user_id, 2, datetime.datetime(2025, 6, 1), {'pushups': 35})
+        record_id = self.add_record(user_id, 2, datetime.datetime(2025, 6, 1),
+                                    {'pushups': 40})
+        db_api.delete_row(Record, {'id': record_id})
+        with mock.patch.object(snapshot, 'WATERMARK_OVERLAP', datetime.timedelta(0)):
+            result = snapshot.snapshot(output_dir)
+        self.assertIsNotNone(result['since'])
+        self.assertEqual(result['rows']['fact_record'], 1)
+        self.assertEqual(result['rows']['fact_user'], 0)
+        dataset = pyarrow.parquet.read_table(os.path.join(output_dir, 'fact_record'))
+        self.assertEqual(dataset.num_rows, 4)
+        self.assertEqual(result['rows']['fact_tombstone'], 1)
+        tombstones = pyarrow.parquet.read_table(os.path.join(output_dir,
+                                                             'fact_tombstone'))
+        self.assertEqual(tombstones.column_names, snapshot.TOMBSTONE_COLUMNS)
+        self.assertIn(record_id, tombstones.column('row_key').to_pylist()[0])
+        self.assertEqual(len(snapshot.read_manifest(output_dir)['snapshots']), 2)
+
+    def test_failed_snapshot(self):
+        user_id = str(uuid.uuid4())
+        db_api.add_row(User, {'id': user_id, 'username': 'test', 'type_id': 1,
+                              'payload': {}})
+        self.add_record(user_id, 1, datetime.datetime(2025, 5, 1), {'distance': 2400})
+
+        output_dir = self.output_dir.name
+        with mock.patch.object(snapshot, '_write_dimensions', side_effect=OSError):
+            self.assertRaises(OSError, snapshot.snapshot, output_dir)
+        self.assertEqual(os.listdir(output_dir), [])
+
+        snapshot.snapshot(output_dir)
+        self.assertEqual(sorted(os.listdir(output_dir)),
+                         ['_snapshot.json', 'dim_category', 'dim_gender',
+                          'dim_military_status', 'dim_performance', 'dim_record_type',
+                          'dim_test_limit', 'dim_user_type', 'fact_record',
+                          'fact_user'])
@@ -1,6 +1,7 @@
 """
 Tests for utils module
 """
+import datetime
 from unittest import TestCase, mock
 from uuid import UUID
 
@@ -51,6 +52,42 @@ class UtilsGetArgsTestCase(TestCase):
                                             constant=self.constant), expected)
 
 
+class PayloadFilterTestCase(TestCase):
+    def test_get_payload_filter(self):
+        self.assertIsNone(utils.get_payload_filter({}))
+        self.assertEqual(utils.get_payload_filter({'payload': '{"distance": 2400}'}),
+                         {'distance': 2400})
+        for value in ['{distance', '[1]', '2400']:
+            self.assertRaises(exceptions.Flask400Exception,
+                              utils.get_payload_filter, {'payload': value})
+
+
+class SyncCursorTestCase(TestCase):
+    def test_encode_decode_sync_cursor(self):
+        positions = {'records': (datetime.datetime(2025, 1, 1, 12), 'a'),
+                     'tombstones': (datetime.datetime(2025, 1, 2, 8, 30), 5)}
+        cursor = utils.encode_sync_cursor(positions)
+        self.assertEqual(utils.decode_sync_cursor(cursor), positions)
+        self.assertEqual(utils.decode_sync_cursor(None), {})
+        for value in ['abc', 'WzFd', 'eyJhIjogMX0=']:
+            self.assertRaises(exceptions.Flask400Exception,
+                              utils.decode_sync_cursor, value)
+
+    def test_get_sync_position(self):
+        start = datetime.datetime(2025, 1, 1)
+        rows = [mock.Mock(updated_at=start + datetime.timedelta(minutes=minutes),
+                          id=UUID(int=minutes))
+                for minutes in [1, 2, 2, 10]]
+        # the last row may still be followed by rows committed later
+        settled = start + datetime.timedelta(minutes=5)
+        self.assertEqual(utils.get_sync_position(rows, 'updated_at', 'id',
+                                                 (start, None), settled),
+                         (rows[2].updated_at, str(rows[2].id)))
+        self.assertEqual(utils.get_sync_position(rows[3:], 'updated_at', 'id',
+                                                 (start, None), settled),
+                         (start, None))
+
+
 class UuidTestCase(TestCase):
     def test_generate_uuid_default(self):
         val = utils.generate_uuid()
@@ -0,0 +1,71 @@
+"""
+Tests for validators module
+"""
+from unittest import TestCase
+
+from tikki import exceptions, validators
+from tikki.db.metadata import RecordTypeEnum
+
+
+class CompileSchemaTestCase(TestCase):
+    def test_numeric(self):
+        validator = validators.compile_schema({'distance': 'float'})
+        self.assertIsNone(validator({'distance': 2400}))
+        self.assertIsNone(validator({'distance': 2400.5}))
+        self.assertIsNotNone(validator({'distance': '2400'}))
+        self.assertIsNotNone(validator({'distance': True}))
+        self.assertIsNotNone(validator({}))
+
+    def test_integer(self):
+        validator = validators.compile_schema({'pushups': 'integer'})
+        self.assertIsNone(validator({'pushups': 40}))
+        self.assertIsNotNone(validator({'pushups': 40.5}))
+
+    def test_single(self):
+        validator = validators.compile_schema(
+            {'single': {'question': 'q', 'options': {'1': 'yes', '2': 'no'}}})
+        self.assertIsNone(validator({'single': '1'}))
+        self.assertIsNone(validator({'single': 2}))
+        self.assertIsNotNone(validator({'single': '3'}))
+
+    def test_format(self):
+        validator = validators.compile_schema({'question': 'q', 'format': 'integer'})
+        self.assertIsNone(validator({'value': 12}))
+        self.assertIsNotNone(validator({'value': 'twelve'}))
+
+    def test_empty(self):
+        validator = validators.compile_schema({})
+        self.assertIsNone(validator({'anything': 1}))
+        self.assertIsNotNone(validator([]))
+
+
+class ValidatePayloadTestCase(TestCase):
+    def test_validate_payload(self):
+        type_id = int(RecordTypeEnum.PUSH_UP_60_TEST)
+        validators.validate_payload(type_id, {'pushups': 40})
+        self.assertRaises(exceptions.PayloadValidationException,
+                          validators.validate_payload, type_id, {'pushups': 'x'})
+        stats = validators.get_stats()[type_id]
+        self.assertGreaterEqual(stats.count, 2)
+        self.assertGreaterEqual(stats.failures, 1)
+
+    def test_merge_stats(self):
+        type_id = int(RecordTypeEnum.SIT_UPS)
+        validators.get_validator(type_id)
+        before = validators.copy_stats()[type_id]
+        other = validators.ValidationStats()
+        other.count, other.failures, other.seconds = 3, 1, 0.5
+        validators.merge_stats({type_id: other})
+        stats = validators.get_stats()[type_id]
+        self.assertEqual(stats.count - before.count, 3)
+        self.assertEqual(stats.failures - before.failures, 1)
+        self.assertAlmostEqual(stats.seconds - before.seconds, 0.5)
+
+    def test_unknown_type(self):
+        self.assertRaises(exceptions.PayloadValidationException,
+                          validators.validate_payload, 999, {})
+
+    def test_validator_is_cached(self):
+        type_id = int(RecordTypeEnum.COOPERS_TEST)
+        self.assertIs(validators.get_validator(type_id),
+                      validators.get_validator(type_id))
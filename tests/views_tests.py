@@ -0,0 +1,50 @@
+"""
+Tests for the record views, which are only supported on Postgres. Run when
+TIKKI_TEST_POSTGRES_URI points to a Postgres database, in which the tests create and
+drop a schema of their own.
+"""
+import datetime
+import os
+from unittest import TestCase, skipIf
+import uuid
+
+import sqlalchemy as sa
+
+from tikki.db import views
+
+POSTGRES_URI = os.environ.get('TIKKI_TEST_POSTGRES_URI')
+
+
+@skipIf(POSTGRES_URI is None, 'TIKKI_TEST_POSTGRES_URI is not set')
+class ViewsTestCase(TestCase):
+    def setUp(self):
+        self.schema = 'tikki_test_' + uuid.uuid4().hex[:8]
+        self.engine = sa.create_engine(POSTGRES_URI)
+        self.connection = self.engine.connect()
+        self.connection.execute(f'create schema {self.schema}')
+        self.connection.execute(f'set search_path to {self.schema}')
+        # only the columns read by the record views
+        self.connection.execute('''create table fact_event (
+            id uuid primary key, event_at timestamp not null)''')
+        self.connection.execute('''create table fact_record (
+            id uuid primary key, user_id uuid not null, event_id uuid,
+            type_id integer not null, created_at timestamp not null, result float)''')
+
+    def tearDown(self):
+        self.connection.execute(f'drop schema {self.schema} cascade')
+        self.connection.close()
+        self.engine.dispose()
+
+    def test_backdated_record_at_recent_event(self):
+        now = datetime.datetime.now()
+        event_id, record_id = str(uuid.uuid4()), str(uuid.uuid4())
+        self.connection.execute('insert into fact_event values (%s, %s)', event_id,
+                                now - datetime.timedelta(days=30))
+        self.connection.execute(
+            'insert into fact_record values (%s, %s, %s, 1, %s, 2400)', record_id,
+            str(uuid.uuid4()), event_id, now - datetime.timedelta(days=5 * 365))
+        self.connection.execute(views.views['view_record_coopers'])
+
+        rows = self.connection.execute(
+            'select record_id, coopers from view_record_coopers').fetchall()
+        self.assertEqual([(str(row[0]), row[1]) for row in rows], [(record_id, 2400)])
@@ -1,9 +1,12 @@
+import datetime
 import os
+import sys
 
 import argparse
 
 from tikki.app import app
-from tikki.db import api as db_api
+from tikki.db import api as db_api, archive, partitions, rollups
+from tikki import export, importer, seed, snapshot, utils
 import tikki
 
 import alembic.command
@@ -15,20 +18,115 @@ def _get_alembic_config() -> Config:
     return Config(path)
 
 
+def _parse_datetime(value: str) -> datetime.datetime:
+    try:
+        return utils.parse_value(value, datetime.datetime)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid date: {value}')
+
+
+def _export(args) -> None:
+    filter_by = {}
+    if args.type is not None:
+        filter_by['type_id'] = args.type
+    if args.event is not None:
+        filter_by['event_id'] = args.event
+    chunks = export.export_records(args.format, filter_by,
+                                   since=args.since, until=args.until,
+                                   include_archive=args.include_archive)
+    if args.export == '-':
+        sys.stdout.writelines(chunks)
+    else:
+        with open(args.export, 'w', newline='', encoding='utf-8') as f:
+            f.writelines(chunks)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Tikki application backend')
     parser.add_argument('-r', '--runserver', help='start the server', action='store_true')
+    parser.add_argument('-p', '--production', action='store_true',
+                        help='run the server with multiple gunicorn workers')
+    parser.add_argument('--threads', type=int,
+                        help='number of threads per server worker')
+    parser.add_argument('--bind', metavar='ADDRESS',
+                        help='address the production server binds to')
+    parser.add_argument('--keepalive', metavar='SECONDS', type=int,
+                        help='seconds to keep idle keep-alive connections open')
     parser.add_argument('-m', '--migrate', help='run database migrations',
                         choices=['up', 'down'])
     parser.add_argument('-c', '--create', metavar='MESSAGE',
                         help='create a new database migration')
+    parser.add_argument('--create-partitions', metavar='MONTHS', type=int, nargs='?',
+                        const=partitions.DEFAULT_MONTHS_AHEAD,
+                        help='create record partitions for the next MONTHS months')
+    parser.add_argument('--update-rollups', action='store_true',
+                        help='update the daily record rollups with changed records')
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help='recompute the daily record rollups of all records')
+    parser.add_argument('--archive', metavar='YEARS', type=int, nargs='?',
+                        const=archive.DEFAULT_MAX_AGE_YEARS,
+                        help='archive records older than YEARS years')
+    parser.add_argument('--batch-size', type=int, default=archive.DEFAULT_BATCH_SIZE,
+                        help='number of records archived per transaction')
+    parser.add_argument('--snapshot', metavar='DIRECTORY',
+                        help='write a Parquet snapshot to DIRECTORY, incrementally if '
+                             'it contains an earlier snapshot')
     parser.add_argument('-v', '--validate', help='check if server can be started',
                         action='store_true')
+    parser.add_argument('-e', '--export', metavar='FILE',
+                        help="export records to FILE, or '-' for stdout")
+    parser.add_argument('-i', '--import', metavar='FILE', dest='import_file',
+                        help='import records from a CSV or TSV file')
+    parser.add_argument('-s', '--seed', metavar='USERS', type=int,
+                        help='generate synthetic data for USERS users')
+    parser.add_argument('--records-per-user', type=int, default=10,
+                        help='average number of generated records per user')
+    parser.add_argument('--random-seed', type=int, default=0,
+                        help='seed of the generated data')
+    parser.add_argument('--workers', type=int,
+                        help='number of worker processes used by the production '
+                             'server or import')
+    parser.add_argument('--format', help='format of exported records',
+                        choices=sorted(export.EXPORT_FORMATS), default='ndjson')
+    parser.add_argument('--type', metavar='TYPE_ID', type=int,
+                        help='only include records of this record type')
+    parser.add_argument('--event', metavar='EVENT_ID',
+                        help='only include records of this event')
+    parser.add_argument('--include-archive', action='store_true',
+                        help='also export archived records')
+    parser.add_argument('--since', metavar='DATE', type=_parse_datetime,
+                        help='only include records created at or after DATE')
+    parser.add_argument('--until', metavar='DATE', type=_parse_datetime,
+                        help='only include records created before DATE')
 
     args = parser.parse_args()
     if args.validate:
         print('validate')
         quit()
+    elif args.export:
+        _export(args)
+        quit()
+    elif args.import_file:
+        stats = importer.import_records(args.import_file, workers=args.workers)
+        print(stats)
+        quit()
+    elif args.seed:
+        stats = seed.seed(args.seed, records_per_user=args.records_per_user,
+                          random_seed=args.random_seed)
+        print(stats)
+        quit()
+    elif args.create_partitions is not None:
+        print(partitions.maintain_partitions(db_api.ENGINE, args.create_partitions))
+        quit()
+    elif args.snapshot:
+        print(snapshot.snapshot(args.snapshot))
+        quit()
+    elif args.archive is not None:
+        print(archive.archive_records(db_api.ENGINE, args.archive, args.batch_size))
+        quit()
+    elif args.update_rollups or args.rebuild_rollups:
+        print(rollups.update_rollups(rebuild=args.rebuild_rollups))
+        quit()
     elif args.create:
         alembic_cfg = _get_alembic_config()
         alembic.command.revision(alembic_cfg, args.create)
@@ -40,10 +138,16 @@ def main():
             db_api.regenerate_dimensions()
             db_api.regenerate_limits()
             db_api.regenerate_views()
+            partitions.maintain_partitions(db_api.ENGINE)
         elif args.migrate == 'down':
             db_api.drop_metadata()
             alembic.command.downgrade(alembic_cfg, 'base')
         quit()
+    elif args.runserver and args.production:
+        from tikki import server
+        server.run(app, workers=args.workers, threads=args.threads, bind=args.bind,
+                   keepalive=args.keepalive)
+        quit()
     elif args.runserver:
         app.run()
 
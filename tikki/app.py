@@ -6,13 +6,18 @@ This module serves the RESTful interface required by the Tikki application.
 import datetime
 import logging
 
-from tikki import utils
-from tikki.db.tables import User, Record, RecordType, Event, UserEventLink
-from tikki.db import api as db_api, metadata as db_metadata
-from tikki.exceptions import AppException, FlaskRequestException
+from tikki import export, metrics, profiling, utils, validators
+from tikki.db.tables import User, Record, RecordArchive, Event, UserEventLink
+from tikki.db import api as db_api, instrumentation, metadata as db_metadata, rollups
+from tikki.exceptions import (
+    AppException,
+    Flask400Exception,
+    FlaskRequestException,
+    NoRecordsException,
+)
 from tikki.version import get_version
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 
 from flask_cors import CORS
 
@@ -30,9 +35,36 @@ app = Flask(utils.APP_NAME)
 utils.init_app(app)
 log = logging.getLogger(utils.APP_NAME)
 db_api.init(app)
+validators.compile_validators()
+metrics.init_app(app, db_api.ENGINE)
+instrumentation.init_app(app)
+profiling.init_app(app)
 jwt = JWTManager(app)
 CORS(app)
 
+DIMENSIONS_MAX_AGE = 24 * 3600
+ROLLUP_DEFAULT_PERIOD = datetime.timedelta(days=90)
+
+
+def _get_cache_stats(key: str):
+    caches = {'token': utils.TOKEN_CACHE, 'user': db_api.USER_CACHE,
+              'leaderboard': db_api.LEADERBOARD_CACHE}
+    return {(('cache', name),): cache.stats[key] for name, cache in caches.items()}
+
+
+metrics.register(metrics.Gauge('tikki_cache_hits_total', 'Cache hits by cache',
+                               lambda: _get_cache_stats('hits'), 'counter'))
+metrics.register(metrics.Gauge('tikki_cache_misses_total', 'Cache misses by cache',
+                               lambda: _get_cache_stats('misses'), 'counter'))
+metrics.register(metrics.Gauge(
+    'tikki_validation_seconds_total', 'Time spent validating payloads by record type',
+    lambda: {(('type_id', str(type_id)),): stats.seconds
+             for type_id, stats in validators.get_stats().items()}, 'counter'))
+metrics.register(metrics.Gauge(
+    'tikki_validations_total', 'Validated payloads by record type',
+    lambda: {(('type_id', str(type_id)),): stats.count
+             for type_id, stats in validators.get_stats().items()}, 'counter'))
+
 
 def get_obj_type(path):
     if path == '/user':
@@ -41,7 +73,7 @@ def get_obj_type(path):
         return Record
     elif path == '/event':
         return Event
-    elif path == 'user-event-link':
+    elif path == '/user-event-link':
         return UserEventLink
 
 
@@ -63,7 +95,7 @@ def login():
         utils.flask_validate_request_is_json(request)
         payload = utils.get_auth0_payload(app, request)
         username_filter = {'username': payload['sub']}
-        user = db_api.get_row(User, username_filter)
+        user = db_api.get_user(username_filter)
         if user:
             identity = utils.create_jwt_identity(user, token_payload=payload)
             return utils.flask_return_success({'jwt': create_jwt(identity),
@@ -95,6 +127,8 @@ def delete_record():
                                  )
         filters['user_id'] = get_jwt_identity()
         db_api.delete_row(obj_type, filters)
+        if obj_type is User:
+            db_api.invalidate_user(filters['id'])
         return utils.flask_return_success('OK')
     except Exception as e:
         return utils.flask_handle_exception(e)
@@ -133,7 +167,7 @@ def get_whoami():
 @app.route('/schema', methods=['GET'], strict_slashes=False)
 @jwt_optional
 def get_schema():
-    log.info('schema')
+    log.debug('schema')
     try:
         jwt_id = get_jwt_identity()
         type_dict = dict()
@@ -152,18 +186,33 @@ def get_schema():
                     lag_type_id = record.type_id
                     type_dict[record.type_id] = record
 
-        rows = db_api.get_rows(RecordType, {})
+        record_types = db_metadata.get_dimension_registry()['dimensions']['record_types']
         result_list = list()
-        for row in rows:
-            result = row.json_dict
-            result['ask'] = 1 if jwt_id is not None and row.category_id == 2 and \
-                row.id not in type_dict else 0
+        for record_type in record_types:
+            result = dict(record_type)
+            result['ask'] = 1 if jwt_id is not None and result['category_id'] == 2 and \
+                result['id'] not in type_dict else 0
             result_list.append(result)
         return utils.flask_return_success(result_list)
     except Exception as ex:
         return utils.flask_handle_exception(ex)
 
 
+@app.route('/dimensions', methods=['GET'], strict_slashes=False)
+def get_dimensions():
+    try:
+        registry = db_metadata.get_dimension_registry()
+        response, status = utils.flask_return_success(registry)
+        # the version only changes when dimensions are regenerated, so clients can
+        # keep the dimensions for long and revalidate them with the version
+        response.set_etag(registry['version'])
+        response.cache_control.public = True
+        response.cache_control.max_age = DIMENSIONS_MAX_AGE
+        return response.make_conditional(request)
+    except Exception as e:
+        return utils.flask_handle_exception(e)
+
+
 @app.route('/user', methods=['GET'], strict_slashes=False)
 @jwt_required
 def get_user():
@@ -171,7 +220,12 @@ def get_user():
                              optional={'id': str, 'username': str},
                              )
     try:
-        users = db_api.get_rows(User, filters)
+        payload_filter = utils.get_payload_filter(request.args)
+        if filters and payload_filter is None:
+            user = db_api.get_user(filters)
+            users = [user] if user is not None else []
+        else:
+            users = db_api.get_rows(User, filters, payload_filter)
         return utils.flask_return_success([i.json_dict for i in users])
     except Exception as e:
         return utils.flask_handle_exception(e)
@@ -186,11 +240,12 @@ def post_user():
         uuid = str(utils.generate_uuid())
         in_user = utils.get_args(received=request.json,
                                  defaultable={'id': uuid, 'created_at': now,
-                                              'updated_at': now, 'payload': {}},
+                                              'payload': {}},
                                  constant={'type_id': 1},
                                  )
         in_user['username'] = payload['sub']
         user = db_api.add_row(User, in_user)
+        db_api.invalidate_user(in_user['id'], in_user['username'])
         identity = utils.create_jwt_identity(user, payload)
         return utils.flask_return_success({'jwt': create_jwt(identity),
                                           'user': user.json_dict})
@@ -205,10 +260,10 @@ def put_user():
         utils.flask_validate_request_is_json(request)
         now = datetime.datetime.now()
         in_user = utils.get_args(received=request.json,
-                                 defaultable={'created_at': now, 'updated_at': now,
-                                              'payload': {}})
+                                 defaultable={'created_at': now, 'payload': {}})
         filters = {'id': get_jwt_identity()}
         user = db_api.update_row(User, filters, in_user)
+        db_api.invalidate_user(filters['id'])
         return utils.flask_return_success(user.json_dict)
     except Exception as e:
         return utils.flask_handle_exception(e)
@@ -219,52 +274,73 @@ def put_user():
 def patch_user():
     try:
         utils.flask_validate_request_is_json(request)
-        now = datetime.datetime.now()
         in_user = utils.get_args(received=request.json,
                                  required={'id': str},
-                                 defaultable={'updated_at': now},
                                  optional={'created_at': datetime.datetime,
                                            'payload': dict})
         filters = {'id': in_user.pop('id', None)}
         user = db_api.update_row(User, filters, in_user)
+        db_api.invalidate_user(filters['id'])
         return utils.flask_return_success(user.json_dict)
     except Exception as e:
         return utils.flask_handle_exception(e)
 
 
-@app.route('/test/cooperstest/compstat', methods=['GET'], strict_slashes=False)
+@app.route('/user/progress', methods=['GET'], strict_slashes=False)
 @jwt_required
-def get_cooperstest_compstat():
+def get_user_progress():
     try:
-        user_id = get_jwt_identity()
-        filters = {'type_id': int(db_metadata.RecordTypeEnum.COOPERS_TEST)}
-        records = db_api.get_rows(Record, filters)
-
-        # sort records based on user_id and creation date to pick most recent
-        # result per user
-        # TODO: do sorting in db.get_rows
-        records.sort(key=lambda x: (x.user_id, x.created_at), reverse=True)
-        filtered_records = list()
-        lag_user_id = None
-        user_record = None
-        for record in records:
-            if lag_user_id != record.user_id:
-                lag_user_id = record.user_id
-                filtered_records.append(record)
-                if user_id == str(record.user_id):
-                    user_record = record
-
-        # sort filtered records and get index for quantile calculation
+        args = utils.get_args(received=request.args,
+                              required={'type': int},
+                              defaultable={'bucket': 'month'},
+                              optional={'max_points': int},
+                              )
+        if args['type'] not in db_metadata.RESULT_KEYS:
+            raise Flask400Exception('Progress is only available for fitness tests.')
+        if args['bucket'] not in db_api.PROGRESS_BUCKETS:
+            raise Flask400Exception(f'The bucket parameter must be one of '
+                                    f'{", ".join(db_api.PROGRESS_BUCKETS)}.')
+        max_points = args.get('max_points')
+        if max_points is not None and max_points < 1:
+            raise Flask400Exception('The max_points parameter cannot be below 1.')
+        series = db_api.get_progress(get_jwt_identity(), args['type'], args['bucket'],
+                                     max_points)
+        return utils.flask_return_success(series)
+    except Exception as e:
+        return utils.flask_handle_exception(e)
+
+
+@app.route('/stats/rollup', methods=['GET'], strict_slashes=False)
+@jwt_required
+def get_stats_rollup():
+    try:
+        today = datetime.date.today()
+        args = utils.get_args(received=request.args,
+                              defaultable={'since': (today - ROLLUP_DEFAULT_PERIOD)
+                                           .isoformat(),
+                                           'until': today.isoformat()},
+                              optional={'type_id': int, 'organization_id': int},
+                              )
+        filters = {'record_type_id': args['type_id']} if 'type_id' in args else {}
+        if 'organization_id' in args:
+            filters['organization_id'] = args['organization_id']
         try:
-            index = sorted(filtered_records,
-                           key=lambda x: x.payload['distance']).index(user_record)
+            since = utils.parse_value(args['since'], datetime.datetime).date()
+            until = utils.parse_value(args['until'], datetime.datetime).date()
         except ValueError:
-            index = None
+            raise Flask400Exception('Invalid since or until parameter.')
+        return utils.flask_return_success(rollups.get_rollups(filters, since, until))
+    except Exception as e:
+        return utils.flask_handle_exception(e)
 
-        if index is None or len(filtered_records) == 0:
-            quantile = 0
-        else:
-            quantile = (index + 1) / len(filtered_records)
+
+@app.route('/test/cooperstest/compstat', methods=['GET'], strict_slashes=False)
+@jwt_required
+def get_cooperstest_compstat():
+    try:
+        user_id = get_jwt_identity()
+        type_id = int(db_metadata.RecordTypeEnum.COOPERS_TEST)
+        quantile = db_api.get_result_quantile(type_id, user_id)
         return utils.flask_return_success({'quantile': quantile})
 
     except Exception as e:
@@ -278,35 +354,8 @@ def get_pushup60test_compstat():
         user_id = get_jwt_identity()
         if user_id is None:
             return jsonify({'message': 'Undefined user id.'}), 400
-        filters = {'type_id': int(db_metadata.RecordTypeEnum.PUSH_UP_60_TEST)}
-        records = db_api.get_rows(Record, filters)
-
-        # sort records based on user_id and creation date to pick most recent
-        # result per user
-        # TODO: sort in db.get_rows
-
-        records.sort(key=lambda x: (x.user_id, x.created_at), reverse=True)
-        filtered_records = list()
-        lag_user_id = None
-        user_record = None
-        for record in records:
-            if lag_user_id != record.user_id:
-                lag_user_id = record.user_id
-                filtered_records.append(record)
-                if user_id == str(record.user_id):
-                    user_record = record
-
-        # sort filtered records and get index for quantile calculation
-        filtered_records.sort(key=lambda x: x.payload['pushups'])
-        try:
-            index = filtered_records.index(user_record)
-        except ValueError:
-            index = None
-
-        if index is None or len(filtered_records) == 0:
-            quantile = 0
-        else:
-            quantile = (index + 1) / len(filtered_records)
+        type_id = int(db_metadata.RecordTypeEnum.PUSH_UP_60_TEST)
+        quantile = db_api.get_result_quantile(type_id, user_id)
         return jsonify({'result': {'quantile': quantile}}), 200
 
     except Exception as e:
@@ -317,15 +366,51 @@ def get_pushup60test_compstat():
 @jwt_required
 def get_record():
     filters = utils.get_args(received=request.args,
-                             optional={'id': str, 'user_id': str, 'event_id': str},
+                             optional={'id': str, 'user_id': str, 'event_id': str,
+                                       'include_archive': int},
                              )
     try:
-        rows = db_api.get_rows(Record, filters)
+        include_archive = bool(filters.pop('include_archive', 0))
+        payload_filter = utils.get_payload_filter(request.args)
+        rows = db_api.get_rows(Record, filters, payload_filter)
+        # archived records are returned after the others, only when requested, as
+        # synchronizing clients have no use for them
+        if include_archive:
+            rows += db_api.get_rows(RecordArchive, filters, payload_filter)
         return utils.flask_return_success([row.json_dict for row in rows])
     except Exception as e:
         return utils.flask_handle_exception(e)
 
 
+@app.route('/record/export', methods=['GET'], strict_slashes=False)
+@jwt_required
+def get_record_export():
+    try:
+        args = utils.get_args(received=request.args,
+                              defaultable={'format': 'ndjson'},
+                              optional={'type_id': int, 'event_id': str,
+                                        'since': str, 'until': str,
+                                        'include_archive': int},
+                              )
+        fmt = args.pop('format')
+        include_archive = bool(args.pop('include_archive', 0))
+        if fmt not in export.EXPORT_FORMATS:
+            raise Flask400Exception('Unsupported export format: ' + fmt)
+        try:
+            since = utils.parse_value(args.pop('since', None), datetime.datetime)
+            until = utils.parse_value(args.pop('until', None), datetime.datetime)
+        except ValueError:
+            raise Flask400Exception('Invalid since or until parameter.')
+        chunks = export.export_records(fmt, args, since=since, until=until,
+                                       include_archive=include_archive)
+        headers = {'Content-Disposition': f'attachment; filename=records.{fmt}'}
+        return Response(stream_with_context(chunks),
+                        mimetype=export.EXPORT_FORMATS[fmt],
+                        headers=headers)
+    except Exception as e:
+        return utils.flask_handle_exception(e)
+
+
 @app.route('/record', methods=['POST'], strict_slashes=False)
 @jwt_required
 def post_record():
@@ -336,7 +421,7 @@ def post_record():
         row = utils.get_args(received=request.json,
                              optional={'event_id': str},
                              defaultable={'id': uuid, 'created_at': now,
-                                          'updated_at': now, 'payload': {},
+                                          'payload': {},
                                           'type_id': 0,
                                           'user_id': get_jwt_identity()},
                              )
@@ -357,6 +442,7 @@ def post_record():
         if 'validated_user_id' in validated:
             row.update(validated)
 
+        validators.validate_payload(row['type_id'], row['payload'])
         record = db_api.add_row(Record, row)
         return utils.flask_return_success(record.json_dict)
     except Exception as e:
@@ -371,7 +457,6 @@ def patch_record():
         now = datetime.datetime.now()
         row = utils.get_args(received=request.json,
                              required={'id': str},
-                             defaultable={'updated_at': now},
                              optional={'created_at': datetime.datetime,
                                        'payload': dict, 'type_id': int,
                                        'event_id': str},
@@ -391,10 +476,18 @@ def patch_record():
                                    defaultable={'validated_at': now},
                                    optional={'validated_user_id': str},
                                    )
-        if validated['validated_user_id'] is not None:
+        if 'validated_user_id' in validated:
             row.update(validated)
 
         filters = {'id': row.pop('id', None)}
+        if 'payload' in row or 'type_id' in row:
+            if 'payload' not in row or 'type_id' not in row:
+                current = db_api.get_row(Record, filters)
+                if current is None:
+                    raise NoRecordsException
+                row.setdefault('payload', current.payload)
+                row.setdefault('type_id', current.type_id)
+            validators.validate_payload(row['type_id'], row['payload'])
         record = db_api.update_row(Record, filters, row)
         return utils.flask_return_success(record.json_dict)
     except Exception as e:
@@ -411,7 +504,7 @@ def put_record():
         user = get_jwt_identity()
         row = utils.get_args(received=request.json,
                              defaultable={'id': uuid, 'created_at': now,
-                                          'updated_at': now, 'payload': {},
+                                          'payload': {},
                                           'type_id': 0,
                                           'user_id': user},
                              optional={'event_id': str},
@@ -430,9 +523,10 @@ def put_record():
                                    defaultable={'validated_at': now},
                                    optional={'validated_user_id': str},
                                    )
-        if validated['validated_user_id'] is not None:
+        if 'validated_user_id' in validated:
             row.update(validated)
 
+        validators.validate_payload(row['type_id'], row['payload'])
         record = db_api.update_row(Record, filters, row)
         return utils.flask_return_success(record.json_dict)
     except Exception as e:
@@ -446,12 +540,32 @@ def get_event():
                              optional={'id': str, 'user_id': str, 'type_id': int},
                              )
     try:
-        rows = db_api.get_rows(Event, filters)
+        payload_filter = utils.get_payload_filter(request.args)
+        rows = db_api.get_rows(Event, filters, payload_filter)
         return utils.flask_return_success([row.json_dict for row in rows])
     except Exception as e:
         return utils.flask_handle_exception(e)
 
 
+@app.route('/event/<uuid:event_id>/leaderboard', methods=['GET'], strict_slashes=False)
+@jwt_required
+def get_event_leaderboard(event_id):
+    try:
+        args = utils.get_args(received=request.args,
+                              required={'type': int},
+                              defaultable={'limit': 10},
+                              )
+        if args['type'] not in db_metadata.RESULT_KEYS:
+            raise Flask400Exception('Leaderboards are only available for fitness tests.')
+        if not 0 < args['limit'] <= db_api.LEADERBOARD_SIZE:
+            raise Flask400Exception(f'The limit parameter cannot be below 1 or greater '
+                                    f'than {db_api.LEADERBOARD_SIZE}.')
+        leaderboard = db_api.get_leaderboard(event_id, args['type'])
+        return utils.flask_return_success(leaderboard[:args['limit']])
+    except Exception as e:
+        return utils.flask_handle_exception(e)
+
+
 @app.route('/event', methods=['POST'], strict_slashes=False)
 @jwt_required
 def post_event():
@@ -465,7 +579,7 @@ def post_event():
                                        'address': str, 'postal_code': str,
                                        'event_at': datetime.datetime},
                              defaultable={'id': uuid, 'created_at': now,
-                                          'updated_at': now, 'payload': {},
+                                          'payload': {},
                                           'organization_id': 0, 'user_id': user},
                              )
         event = db_api.add_row(Event, row)
@@ -487,7 +601,7 @@ def put_event():
                                        'address': str, 'postal_code': str,
                                        'event_at': datetime.datetime},
                              defaultable={'id': uuid, 'created_at': now,
-                                          'updated_at': now, 'payload': {},
+                                          'payload': {},
                                           'organization_id': 0, 'user_id': user},
                              )
 
@@ -520,8 +634,8 @@ def post_user_event_link():
         user = get_jwt_identity()
         row = utils.get_args(received=request.json,
                              required={'event_id': str},
-                             defaultable={'created_at': now, 'updated_at': now,
-                                          'user_id': user, 'payload': {}},
+                             defaultable={'created_at': now, 'user_id': user,
+                                          'payload': {}},
                              )
 
         obj = db_api.add_row(UserEventLink, row)
@@ -530,6 +644,47 @@ def post_user_event_link():
         return utils.flask_handle_exception(e)
 
 
+@app.route('/sync', methods=['GET'], strict_slashes=False)
+@jwt_required
+def get_sync():
+    try:
+        args = utils.get_args(received=request.args,
+                              optional={'cursor': str},
+                              )
+        cursor = utils.decode_sync_cursor(args.get('cursor'))
+        user_id = get_jwt_identity()
+        settled = db_api.get_database_time() - utils.SYNC_LOOKBACK
+        ret = {}
+        positions = {}
+        for name, base_class, key, filter_by in (
+                ('records', Record, 'id', {'user_id': user_id}),
+                ('events', Event, 'id', {}),
+                ('user_event_links', UserEventLink, 'event_id', {'user_id': user_id})):
+            position = cursor.get(name, (utils.SYNC_EPOCH, None))
+            rows = db_api.get_rows_since(base_class, position[0], filter_by,
+                                         position[1], key)
+            positions[name] = utils.get_sync_position(rows, 'updated_at', key,
+                                                      position, settled)
+            ret[name] = [row.json_dict for row in rows]
+
+        position = cursor.get('tombstones', (utils.SYNC_EPOCH, None))
+        tombstones = db_api.get_tombstones_since(position[0], user_id, position[1])
+        positions['tombstones'] = utils.get_sync_position(tombstones, 'deleted_at', 'id',
+                                                          position, settled)
+        ret['tombstones'] = [row.json_dict for row in tombstones]
+
+        # clients pass the cursor back as-is on the next call
+        ret['cursor'] = utils.encode_sync_cursor(positions)
+        return utils.flask_return_success(ret)
+    except Exception as e:
+        return utils.flask_handle_exception(e)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route("/")
 def hello():
     return f'Greetings from the Tikki API (v. {get_version()})'
@@ -0,0 +1,107 @@
+"""
+In-process caches shared by the request handlers.
+"""
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache(object):
+    """
+    Thread-safe least recently used cache with per-entry expiry.
+
+    :param maxsize: maximum number of entries. When full, the least recently used
+    entry is evicted.
+    :param ttl: default time to live of entries in seconds, or None to keep entries
+    until evicted
+    """
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value from the cache.
+
+        :param key: cache key
+        :param default: value returned if the key is missing or expired
+        :return: cached value or default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.time():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value from the cache without counting a hit or miss or marking it as
+        recently used. Expired values that have not been removed yet are returned.
+
+        :param key: cache key
+        :param default: value returned if the key is missing
+        :return: cached value or default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[1]
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """
+        Add a value to the cache.
+
+        :param key: cache key
+        :param value: value to be cached
+        :param expires_at: unix timestamp after which the entry is expired. Defaults
+        to now + ttl.
+        """
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Remove a value from the cache if present.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove all values from the cache.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Usage statistics of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                }
@@ -1,21 +1,132 @@
 """ Module for handling database interactions """
+import datetime
+import io
+import json
 import logging
-from typing import List, Dict, Any, Type, TypeVar
+import os
+import time
+from typing import List, Dict, Any, Iterator, Optional, Type, TypeVar
 
 import sqlalchemy as sa
 import sqlalchemy.orm as sao
+from sqlalchemy.dialects.postgresql import JSONB
 
 from tikki import utils
-from tikki.db.tables import Base, TestLimit, RecordType
+from tikki.cache import LRUCache
+from tikki.db.tables import (
+    Base,
+    Event,
+    Record,
+    RecordArchive,
+    RecordType,
+    RollupStaleDay,
+    TestLimit,
+    Tombstone,
+    User,
+)
 from tikki.db import metadata, views
 from tikki.exceptions import NoRecordsException, TooManyRecordsException
 
 # Initialisation
+ENGINE = None  # type: Any
 SESSION = None  # type: Any
 
+# User rows by ('id', id) and ('username', username). Only invalidated in the
+# process where the user is modified, so the ttl bounds staleness in other workers.
+USER_CACHE = LRUCache(maxsize=int(os.environ.get('TIKKI_USER_CACHE_SIZE', 4096)),
+                      ttl=float(os.environ.get('TIKKI_USER_CACHE_TTL', 60)))
+
+# Leaderboards by (event_id, type_id), invalidated when a record of the event is
+# committed. As with the user cache, the ttl bounds staleness in other workers.
+LEADERBOARD_CACHE = LRUCache(
+    maxsize=int(os.environ.get('TIKKI_LEADERBOARD_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('TIKKI_LEADERBOARD_CACHE_TTL', 30)))
+LEADERBOARD_SIZE = 100
+# payload keys of users read by the rollups of `tikki.db.rollups`
+ROLLUP_USER_KEYS = ('birthDate', 'genderId', 'militaryStatusId')
+
 T = TypeVar('T')
 
 
+@sa.event.listens_for(Record, 'before_insert')
+@sa.event.listens_for(Record, 'before_update')
+def _set_record_result(mapper, connection, target):
+    target.result = metadata.get_result(target.type_id, target.payload)
+
+
+@sa.event.listens_for(Record, 'before_update')
+def _mark_rollup_day_stale(mapper, connection, target):
+    # the rollups of the new day and type are found by updated_at, but the old ones
+    # have to be recorded before the update overwrites them
+    attrs = sa.inspect(target).attrs
+    created_at, type_id = attrs.created_at.history, attrs.type_id.history
+    if not created_at.deleted and not type_id.deleted:
+        return
+    old_created_at = created_at.deleted[0] if created_at.deleted else target.created_at
+    old_type_id = type_id.deleted[0] if type_id.deleted else target.type_id
+    connection.execute(RollupStaleDay.__table__.insert(),
+                       {'day': old_created_at.date(), 'record_type_id': old_type_id})
+
+
+def _mark_record_days_stale(connection: Any, column: str, value: Any,
+                            type_ids: Optional[List[int]] = None) -> None:
+    # marks the days of the live and archived records with a column value, for rollups
+    # that depend on the event or the user of the records
+    for base_class in (Record, RecordArchive):
+        table = base_class.__table__
+        days = sa.select([sa.func.date(table.c.created_at), table.c.type_id]) \
+            .where(table.c[column] == value).distinct()
+        if type_ids is not None:
+            days = days.where(table.c.type_id.in_(type_ids))
+        connection.execute(RollupStaleDay.__table__.insert().from_select(
+            ['day', 'record_type_id'], days))
+
+
+@sa.event.listens_for(Event, 'before_update')
+def _mark_event_rollup_days_stale(mapper, connection, target):
+    # rollups are grouped by the organization of the event
+    if sa.inspect(target).attrs.organization_id.history.deleted:
+        _mark_record_days_stale(connection, 'event_id', target.id)
+
+
+@sa.event.listens_for(User, 'before_update')
+def _mark_user_rollup_days_stale(mapper, connection, target):
+    # the performance categories of results depend on these payload keys of the user
+    history = sa.inspect(target).attrs.payload.history
+    if not history.deleted:
+        return
+    old_payload, payload = history.deleted[0] or {}, target.payload or {}
+    if any(old_payload.get(key) != payload.get(key) for key in ROLLUP_USER_KEYS):
+        _mark_record_days_stale(connection, 'user_id', target.id,
+                                list(metadata.RESULT_KEYS))
+
+
+def _mark_leaderboards_stale(session: Any, record: Record) -> None:
+    event_ids = session.info.setdefault('stale_leaderboards', set())
+    event_ids.add(record.event_id)
+    # a record moved to another event also changes the leaderboard of the old event
+    history = sa.inspect(record).attrs.event_id.history
+    event_ids.update(history.deleted or ())
+    event_ids.discard(None)
+
+
+@sa.event.listens_for(Record, 'after_insert')
+@sa.event.listens_for(Record, 'after_update')
+def _record_written(mapper, connection, target):
+    _mark_leaderboards_stale(sao.object_session(target), target)
+
+
+@sa.event.listens_for(sao.Session, 'after_commit')
+def _invalidate_leaderboards(session):
+    for event_id in session.info.pop('stale_leaderboards', ()):
+        invalidate_leaderboards(event_id)
+
+
+@sa.event.listens_for(sao.Session, 'after_rollback')
+def _discard_stale_leaderboards(session):
+    session.info.pop('stale_leaderboards', None)
+
+
 def init(app):
     """Function for initializing the database connection.
 
@@ -24,23 +135,64 @@ def init(app):
 
     :param app: Flask app object.
     """
-    global SESSION
+    global ENGINE, SESSION
 
-    engine = sa.create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-    SESSION = sao.sessionmaker(bind=engine)
+    ENGINE = sa.create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+    SESSION = sao.sessionmaker(bind=ENGINE)
 
 
-def get_rows(base_class: Type[Base], filter_by: Dict[str, Any]) -> List[Base]:
+def dispose_engine():
+    """Function for discarding all pooled database connections. Should be called in
+    forked processes before the database is accessed.
+    """
+    global ENGINE
+    if ENGINE is not None:
+        ENGINE.dispose()
+
+
+def payload_contains(payload: Any, subset: Any) -> bool:
+    """Function for checking if a json value contains another, following the
+    semantics of the Postgres JSONB `@>` operator.
+
+    :param payload: json value
+    :param subset: json value that should be contained in `payload`
+    :return: True if `payload` contains `subset`
+    """
+    if isinstance(subset, dict):
+        return isinstance(payload, dict) and \
+            all(key in payload and payload_contains(payload[key], value)
+                for key, value in subset.items())
+    if isinstance(subset, list):
+        return isinstance(payload, list) and \
+            all(any(payload_contains(item, value) for item in payload)
+                for value in subset)
+    if isinstance(subset, bool) or isinstance(payload, bool):
+        return payload is subset
+    return payload == subset
+
+
+def get_rows(base_class: Type[Base], filter_by: Dict[str, Any],
+             payload_filter: Optional[Dict[str, Any]] = None) -> List[Base]:
     """Function for retrieving rows from the database.
 
     :param base_class: SQL Alchemy object type to be retrieved.
     :param filter_by: Filters specifying which rows should be retrieved.
+    :param payload_filter: Only rows whose payload contains this json object are
+    retrieved. Uses the GIN index of the payload on Postgres, on other databases the
+    rows are filtered after retrieval.
     :return: list of SQL Alchemy objects
     """
-    global SESSION
+    global ENGINE, SESSION
     session = SESSION()
-    rows = session.query(base_class).filter_by(**filter_by).all()
+    query = session.query(base_class).filter_by(**filter_by)
+    filter_in_db = ENGINE.dialect.name == 'postgresql'
+    if payload_filter and filter_in_db:
+        query = query.filter(
+            sa.type_coerce(base_class.payload, JSONB).contains(payload_filter))
+    rows = query.all()
     session.close()
+    if payload_filter and not filter_in_db:
+        rows = [row for row in rows if payload_contains(row.payload, payload_filter)]
     return rows
 
 
@@ -58,6 +210,43 @@ def get_row(base_class: Type[Base], filter_by: Dict[str, Any]) -> Base:
     return row
 
 
+def get_user(filter_by: Dict[str, Any]) -> Optional[User]:
+    """Function for retrieving a user, using the user cache when filtering by only id
+    or username.
+
+    :param filter_by: Filters specifying which user should be retrieved.
+    :return: SQL Alchemy object, or None if no user matched the filters
+    """
+    if len(filter_by) != 1 or not ('id' in filter_by or 'username' in filter_by):
+        return get_row(User, filter_by)
+
+    column, value = next(iter(filter_by.items()))
+    key = (column, str(value))
+    user = USER_CACHE.get(key)
+    if user is None:
+        user = get_row(User, filter_by)
+        if user is not None:
+            USER_CACHE.set(('id', str(user.id)), user)
+            USER_CACHE.set(('username', user.username), user)
+    return user
+
+
+def invalidate_user(user_id: Any, username: Optional[str] = None) -> None:
+    """Function for removing a user from the user cache. Must be called whenever a
+    user is modified.
+
+    :param user_id: id of the modified user
+    :param username: username of the user before the modification, if the cached
+    user may already have been evicted
+    """
+    user = USER_CACHE.peek(('id', str(user_id)))
+    USER_CACHE.pop(('id', str(user_id)))
+    if user is not None:
+        USER_CACHE.pop(('username', user.username))
+    if username is not None:
+        USER_CACHE.pop(('username', username))
+
+
 def add_row(base_class: Type[Base], params: Dict[str, Any]) -> Base:
     """Function for adding a row into the database.
 
@@ -73,6 +262,98 @@ def add_row(base_class: Type[Base], params: Dict[str, Any]) -> Base:
     return row
 
 
+def _create_tombstone(row: Base) -> Tombstone:
+    """Create a tombstone marking the deletion of a row. Only the key of the row and
+    the columns needed to update rollups are kept, so that tombstones of deleted users
+    contain no personal data.
+
+    :param row: SQL Alchemy object that is about to be deleted.
+    :return: Tombstone object, which should be added in the same session as the delete.
+    """
+    mapper = sa.inspect(row).mapper
+    row_key = {}
+    for column in mapper.primary_key:
+        value = getattr(row, column.key)
+        row_key[column.key] = value if isinstance(value, int) else str(value)
+    user_id = getattr(row, 'user_id', None)
+    payload = {}
+    if isinstance(row, Record):
+        payload = {'created_at': row.created_at.isoformat(), 'type_id': row.type_id}
+    # deleted_at defaults to the database clock, like updated_at of changed rows
+    return Tombstone(table_name=mapper.local_table.name,
+                     row_key=row_key,
+                     user_id=user_id,
+                     payload=payload)
+
+
+def _format_copy_value(value: Any) -> str:
+    if value is None:
+        # only unquoted empty fields are read as NULL by COPY, quoted ones are ''
+        return ''
+    elif isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, (int, float)):
+        return str(value)
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _format_copy_row(values: List[Any]) -> str:
+    """Format a row as a line of CSV read by `COPY ... WITH (FORMAT csv)`.
+
+    :param values: Column values of the row.
+    :return: line of CSV, with NULLs as unquoted empty fields and strings quoted
+    """
+    return ','.join(_format_copy_value(value) for value in values) + '\n'
+
+
+def bulk_insert(base_class: Type[Base], rows: List[Dict[str, Any]]) -> int:
+    """Function for inserting many rows into the database in a single transaction.
+
+    On Postgres rows are loaded with `COPY`, on other databases with a multi-row
+    insert. Rows are inserted as-is, so ORM defaults and events are not applied.
+
+    :param base_class: SQL Alchemy object type to be inserted.
+    :param rows: Column values of the rows to be inserted. All rows must have the
+    same keys. The `result` of records is filled in from the payload.
+    :return: number of rows inserted
+    """
+    global SESSION
+    if not rows:
+        return 0
+    if base_class is Record:
+        rows = [dict(row, result=metadata.get_result(row.get('type_id'),
+                                                     row.get('payload')))
+                for row in rows]
+    session = SESSION()
+    try:
+        table = base_class.__table__
+        columns = list(rows[0].keys())
+        connection = session.connection()
+        if connection.dialect.name == 'postgresql':
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write(_format_copy_row([row[col] for col in columns]))
+            buffer.seek(0)
+            cursor = connection.connection.cursor()
+            cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) '
+                               f'FROM STDIN WITH (FORMAT csv)', buffer)
+        else:
+            connection.execute(table.insert(), rows)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return len(rows)
+
+
 def delete_row(base_class: Type[Base], filter_by: Dict[str, Any]) -> None:
     """Function for deleting a single row in the database.
 
@@ -84,12 +365,18 @@ def delete_row(base_class: Type[Base], filter_by: Dict[str, Any]) -> None:
     """
     global SESSION
     session = SESSION()
-    rows_affected = session.query(base_class).filter_by(**filter_by).delete()
-    if rows_affected == 0:
+    query = session.query(base_class).filter_by(**filter_by)
+    rows = query.all()
+    if len(rows) == 0:
         raise NoRecordsException
-    elif rows_affected > 1:
+    elif len(rows) > 1:
         session.rollback()
         raise TooManyRecordsException
+    tombstone = _create_tombstone(rows[0])
+    if isinstance(rows[0], Record):
+        _mark_leaderboards_stale(session, rows[0])
+    query.delete()
+    session.add(tombstone)
     session.commit()
 
 
@@ -102,9 +389,16 @@ def delete_rows(base_class: Type[Base], filter_by: Dict[str, Any]):
     """
     global SESSION
     session = SESSION()
-    rows_affected = session.query(base_class).filter_by(**filter_by).delete()
-    if rows_affected == 0:
+    query = session.query(base_class).filter_by(**filter_by)
+    rows = query.all()
+    if len(rows) == 0:
         raise NoRecordsException
+    tombstones = [_create_tombstone(row) for row in rows]
+    for row in rows:
+        if isinstance(row, Record):
+            _mark_leaderboards_stale(session, row)
+    query.delete()
+    session.add_all(tombstones)
     session.commit()
 
 
@@ -169,30 +463,407 @@ def update_rows(base_class: Type[Base], filter_by: Dict[str, Any],
     return rows
 
 
-def regenerate_dimensions():
-    """Rebuild dimension tables and views.
+def get_database_time() -> datetime.datetime:
+    """Function for reading the clock of the database, which timestamps all changes.
+
+    :return: current time of the database
     """
     global SESSION
     session = SESSION()
-    logger = logging.getLogger(utils.APP_NAME)
+    try:
+        now = session.query(sa.func.now()).scalar()
+    finally:
+        session.close()
+    # timestamps are stored without time zone, in the time zone of the database
+    return now.replace(tzinfo=None)
+
+
+def _after_position(timestamp_column: Any, key_column: Any, since: datetime.datetime,
+                    after_key: Any) -> Any:
+    if after_key is None:
+        return timestamp_column >= since
+    return sa.or_(timestamp_column > since,
+                  sa.and_(timestamp_column == since, key_column > after_key))
+
+
+def get_rows_since(base_class: Type[Base], since: datetime.datetime,
+                   filter_by: Dict[str, Any], after_key: Any = None,
+                   key: str = 'id') -> List[Base]:
+    """Function for retrieving rows that have changed after a position in the order of
+    `(updated_at, key)`, so that rows sharing a timestamp are neither skipped nor
+    returned twice.
+
+    :param base_class: SQL Alchemy object type to be retrieved. Must have an
+    `updated_at` column.
+    :param since: `updated_at` of the position.
+    :param filter_by: Filters specifying which rows should be retrieved.
+    :param after_key: Key of the row at the position. If None, rows updated at
+    `since` are included.
+    :param key: Name of a unique column ordering the rows sharing a timestamp.
+    :return: list of SQL Alchemy objects ordered by `updated_at` and key
+    """
+    global SESSION
+    session = SESSION()
+    key_column = getattr(base_class, key)
+    rows = session.query(base_class).filter_by(**filter_by) \
+        .filter(_after_position(base_class.updated_at, key_column, since, after_key)) \
+        .order_by(base_class.updated_at, key_column).all()
+    session.close()
+    return rows
+
+
+def get_result_quantile(type_id: int, user_id: str,
+                        since: Optional[datetime.datetime] = None) -> float:
+    """Function for calculating the quantile of the most recent result of a user among
+    the most recent results of all users.
+
+    :param type_id: Record type of the fitness test.
+    :param user_id: Id of the user.
+    :param since: If given, only records created at or after this timestamp are
+    considered.
+    :return: share of users whose result is lower than the result of the user, counting
+    the user too, or 0 if the user has no result. Users with the same result as the
+    user are not counted, so all of them get the same quantile.
+    """
+    global SESSION
+    session = SESSION()
+    try:
+        recency = sa.func.row_number().over(partition_by=Record.user_id,
+                                            order_by=Record.created_at.desc())
+        latest = session.query(Record.user_id, Record.result,
+                               recency.label('recency')) \
+            .filter(Record.type_id == type_id, Record.result.isnot(None))
+        if since is not None:
+            latest = latest.filter(Record.created_at >= since)
+        latest = latest.subquery()
+        user_result = session.query(latest.c.result) \
+            .filter(latest.c.recency == 1, latest.c.user_id == user_id).scalar()
+        if user_result is None:
+            return 0
+        total, lower = session.query(
+            sa.func.count(), sa.func.count(sa.case([(latest.c.result < user_result, 1)]))
+        ).filter(latest.c.recency == 1).one()
+        return (lower + 1) / total
+    finally:
+        session.close()
+
+
+def get_leaderboard(event_id: Any, type_id: int) -> List[Dict[str, Any]]:
+    """Function for retrieving the best results of the participants of an event, using
+    the leaderboard cache.
+
+    :param event_id: Id of the event.
+    :param type_id: Record type of the fitness test.
+    :return: list of at most `LEADERBOARD_SIZE` dicts with the rank, user id, record id
+    and result of each participant, ordered by result
+    """
+    key = (str(event_id), type_id)
+    leaderboard = LEADERBOARD_CACHE.get(key)
+    if leaderboard is None:
+        leaderboard = _query_leaderboard(event_id, type_id, LEADERBOARD_SIZE)
+        LEADERBOARD_CACHE.set(key, leaderboard)
+    return leaderboard
 
+
+def _query_leaderboard(event_id: Any, type_id: int, limit: int) -> List[Dict[str, Any]]:
+    global SESSION
+    session = SESSION()
     try:
-        for dim_type in metadata.dim_map.keys():
-            session.query(dim_type).delete()
-            logger.info(f'Regenerate {dim_type.__name__} data in database')
-            for dim_row in metadata.dim_map[dim_type]:
-                session.add(dim_row)
+        # archived records stay on the leaderboards of old events
+        results = [session.query(base_class.id.label('id'),
+                                 base_class.user_id.label('user_id'),
+                                 base_class.result.label('result'),
+                                 base_class.created_at.label('created_at'))
+                   .filter(base_class.event_id == event_id,
+                           base_class.type_id == type_id,
+                           base_class.result.isnot(None))
+                   for base_class in (Record, RecordArchive)]
+        records = results[0].union_all(results[1]).subquery()
+        # best result of each user, earlier records winning ties
+        position = sa.func.row_number().over(
+            partition_by=records.c.user_id,
+            order_by=(records.c.result.desc(), records.c.created_at))
+        best = session.query(records, position.label('position')).subquery()
+        rows = session.query(best.c.id, best.c.user_id, best.c.result,
+                             best.c.created_at) \
+            .filter(best.c.position == 1) \
+            .order_by(best.c.result.desc(), best.c.created_at) \
+            .limit(limit).all()
+    finally:
+        session.close()
+
+    leaderboard: List[Dict[str, Any]] = []
+    for index, row in enumerate(rows):
+        # equal results share the rank of the first of them
+        rank = leaderboard[-1]['rank'] \
+            if leaderboard and leaderboard[-1]['result'] == row.result else index + 1
+        leaderboard.append({'rank': rank,
+                            'user_id': str(row.user_id),
+                            'record_id': str(row.id),
+                            'result': row.result,
+                            'created_at': row.created_at.isoformat(),
+                            })
+    return leaderboard
+
+
+def invalidate_leaderboards(event_id: Any) -> None:
+    """Function for removing the leaderboards of an event from the leaderboard cache.
+    Called when records of the event are committed.
+
+    :param event_id: id of the event
+    """
+    for type_id in metadata.RESULT_KEYS:
+        LEADERBOARD_CACHE.pop((str(event_id), type_id))
+
+
+# Progress buckets and the SQLite date modifiers truncating to their start
+PROGRESS_BUCKETS = {
+    'day': ('start of day',),
+    'week': ('weekday 0', '-6 days', 'start of day'),
+    'month': ('start of month',),
+    'year': ('start of year',),
+}
+
+
+def _truncate_datetime(column: Any, bucket: str) -> Any:
+    if ENGINE.dialect.name == 'postgresql':
+        return sa.func.date_trunc(bucket, column)
+    # SQLite has no date_trunc. 'weekday 0' moves to the next Sunday, so Mondays start
+    # the week as with date_trunc.
+    return sa.func.date(column, *PROGRESS_BUCKETS[bucket])
+
+
+def _format_bucket(value: Any) -> str:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+def get_progress(user_id: Any, type_id: int, bucket: str,
+                 max_points: Optional[int] = None) -> Dict[str, List[Any]]:
+    """Function for aggregating the results of a user into a time series.
+
+    :param user_id: Id of the user.
+    :param type_id: Record type of the fitness test.
+    :param bucket: Length of the buckets, one of `PROGRESS_BUCKETS`.
+    :param max_points: If defined, consecutive buckets are merged so that the series
+    has at most this many points.
+    :return: dict of equally long lists with the start date, mean, minimum, maximum and
+    number of results of each bucket, and the best result up to each bucket. Includes
+    archived records.
+    """
+    global SESSION
+    session = SESSION()
+    try:
+        results = [session.query(base_class.created_at.label('created_at'),
+                                 base_class.result.label('result'))
+                   .filter(base_class.user_id == user_id, base_class.type_id == type_id,
+                           base_class.result.isnot(None))
+                   for base_class in (Record, RecordArchive)]
+        records = results[0].union_all(results[1]).subquery()
+        bucket_start = _truncate_datetime(records.c.created_at, bucket)
+        series = session.query(bucket_start.label('bucket'),
+                               sa.func.count(records.c.result).label('count'),
+                               sa.func.sum(records.c.result).label('total'),
+                               sa.func.min(records.c.result).label('minimum'),
+                               sa.func.max(records.c.result).label('maximum')) \
+            .group_by(bucket_start) \
+            .subquery()
+        if max_points is not None:
+            group = sa.func.ntile(max_points).over(order_by=series.c.bucket)
+            grouped = session.query(series, group.label('point')).subquery()
+            series = session.query(sa.func.min(grouped.c.bucket).label('bucket'),
+                                   sa.func.sum(grouped.c.count).label('count'),
+                                   sa.func.sum(grouped.c.total).label('total'),
+                                   sa.func.min(grouped.c.minimum).label('minimum'),
+                                   sa.func.max(grouped.c.maximum).label('maximum')) \
+                .group_by(grouped.c.point) \
+                .subquery()
+        best = sa.func.max(series.c.maximum).over(order_by=series.c.bucket)
+        rows = session.query(series, best.label('best')) \
+            .order_by(series.c.bucket).all()
+    finally:
+        session.close()
+
+    return {'bucket': [_format_bucket(row.bucket) for row in rows],
+            'mean': [row.total / row.count for row in rows],
+            'min': [row.minimum for row in rows],
+            'max': [row.maximum for row in rows],
+            'count': [row.count for row in rows],
+            'best': [row.best for row in rows],
+            }
+
+
+def get_tombstones_since(since: datetime.datetime, user_id: Optional[str] = None,
+                         after_id: Optional[int] = None) -> List[Tombstone]:
+    """Function for retrieving tombstones of rows deleted after a position in the
+    order of `(deleted_at, id)`.
+
+    :param since: `deleted_at` of the position.
+    :param user_id: If defined, only return tombstones of rows owned by this user, or
+    of events, which are shared between users.
+    :param after_id: Id of the tombstone at the position. If None, tombstones created
+    at `since` are included.
+    :return: list of Tombstone objects ordered by `deleted_at` and id
+    """
+    global SESSION
+    session = SESSION()
+    query = session.query(Tombstone).filter(
+        _after_position(Tombstone.deleted_at, Tombstone.id, since, after_id))
+    if user_id is not None:
+        query = query.filter(sa.or_(Tombstone.user_id == user_id,
+                                    Tombstone.table_name == Event.__tablename__))
+    rows = query.order_by(Tombstone.deleted_at, Tombstone.id).all()
+    session.close()
+    return rows
 
-        logger.info(f'Regenerate RecordType data in database')
-        session.query(RecordType).delete()
-        for record_type in metadata.record_types.values():
-            session.add(record_type)
 
+def stream_records(filter_by: Dict[str, Any],
+                   since: Optional[datetime.datetime] = None,
+                   until: Optional[datetime.datetime] = None,
+                   batch_size: int = 1000,
+                   include_archive: bool = False) -> Iterator[Dict[str, Any]]:
+    """Function for streaming records joined with their users and events.
+
+    Rows are fetched in batches from a server-side cursor where the database
+    supports it, so memory usage stays constant regardless of the result size.
+
+    :param filter_by: Filters on record columns, e.g. `type_id` or `event_id`.
+    :param since: If defined, only return records created at or after this timestamp.
+    :param until: If defined, only return records created before this timestamp.
+    :param batch_size: Number of rows fetched from the database at a time.
+    :param include_archive: If True, archived records are returned before the records
+    in `fact_record`.
+    :return: iterator of dicts containing record, user and event columns
+    """
+    record_classes = [RecordArchive, Record] if include_archive else [Record]
+    for record_class in record_classes:
+        yield from _stream_records(record_class, filter_by, since, until, batch_size)
+
+
+def _stream_records(record_class: Any, filter_by: Dict[str, Any],
+                    since: Optional[datetime.datetime],
+                    until: Optional[datetime.datetime],
+                    batch_size: int) -> Iterator[Dict[str, Any]]:
+    global SESSION
+    session = SESSION()
+    try:
+        query = session.query(record_class.id,
+                              record_class.created_at,
+                              record_class.updated_at,
+                              record_class.user_id,
+                              User.username,
+                              record_class.created_user_id,
+                              record_class.event_id,
+                              Event.name.label('event_name'),
+                              Event.event_at,
+                              Event.organization_id,
+                              record_class.type_id,
+                              record_class.validated_user_id,
+                              record_class.validated_at,
+                              record_class.payload) \
+            .outerjoin(User, record_class.user_id == User.id) \
+            .outerjoin(Event, record_class.event_id == Event.id)
+        for key, value in filter_by.items():
+            query = query.filter(getattr(record_class, key) == value)
+        if since is not None:
+            query = query.filter(record_class.created_at >= since)
+        if until is not None:
+            query = query.filter(record_class.created_at < until)
+        query = query.execution_options(stream_results=True).yield_per(batch_size)
+        for row in query:
+            yield row._asdict()
+    finally:
+        session.close()
+
+
+def _sync_table(session: Any, base_class: Type[Base],
+                rows: List[Base]) -> Dict[str, int]:
+    """Function for making the contents of a table match a list of rows, touching
+    only the rows that differ.
+
+    :param session: Session in which the changes are made
+    :param base_class: SQL Alchemy object type of the table
+    :param rows: SQL Alchemy objects describing the desired contents of the table
+    :return: number of inserted, updated and deleted rows
+    """
+    table = base_class.__table__
+    key_columns = list(table.primary_key.columns)
+    value_columns = [col for col in table.columns if not col.primary_key]
+
+    def get_key(row: Any) -> tuple:
+        return tuple(row[col.name] for col in key_columns)
+
+    current = {get_key(row): dict(row) for row in session.execute(sa.select([table]))}
+    desired = {}
+    for obj in rows:
+        row = {col.name: getattr(obj, col.key) for col in table.columns}
+        desired[get_key(row)] = row
+
+    key_filter = sa.and_(*[col == sa.bindparam(f'key_{col.name}') for col in key_columns])
+
+    def get_key_params(key: tuple) -> Dict[str, Any]:
+        return {f'key_{col.name}': value for col, value in zip(key_columns, key)}
+
+    inserts = [row for key, row in desired.items() if key not in current]
+    updates = [dict(get_key_params(key),
+                    **{col.name: row[col.name] for col in value_columns})
+               for key, row in desired.items()
+               if key in current and any(row[col.name] != current[key][col.name]
+                                         for col in value_columns)]
+    deletes = [get_key_params(key) for key in current if key not in desired]
+
+    if inserts:
+        session.execute(table.insert(), inserts)
+    if updates:
+        session.execute(table.update().where(key_filter), updates)
+    if deletes:
+        session.execute(table.delete().where(key_filter), deletes)
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
+
+
+def _sync_tables(tables: List[Any]) -> Dict[str, Dict[str, int]]:
+    """Function for syncing several tables in a single transaction.
+
+    :param tables: list of (SQL Alchemy object type, list of objects) tuples
+    :return: number of inserted, updated and deleted rows by table name
+    """
+    global SESSION
+    session = SESSION()
+    logger = logging.getLogger(utils.APP_NAME)
+    stats: Dict[str, Dict[str, int]] = {}
+    started_at = time.monotonic()
+    try:
+        for base_class, rows in tables:
+            stats[base_class.__tablename__] = _sync_table(session, base_class, rows)
         session.commit()
     except Exception as ex:
         print(ex)
         logger.exception(ex)
         session.rollback()
+        return {}
+    finally:
+        session.close()
+
+    elapsed = time.monotonic() - started_at
+    for table_name, counts in stats.items():
+        logger.info(f'Regenerate {table_name}: {counts["inserted"]} inserted, '
+                    f'{counts["updated"]} updated, {counts["deleted"]} deleted')
+    touched = sum(sum(counts.values()) for counts in stats.values())
+    logger.info(f'Regenerated {len(stats)} tables in {elapsed:.2f} s, '
+                f'{touched} rows touched')
+    return stats
+
+
+def regenerate_dimensions() -> Dict[str, Dict[str, int]]:
+    """Bring dimension and record type tables up to date with `metadata`, only
+    writing rows that have changed.
+
+    :return: number of inserted, updated and deleted rows by table name
+    """
+    tables = list(metadata.dim_map.items())
+    tables.append((RecordType, list(metadata.record_types.values())))
+    return _sync_tables(tables)
 
 
 def regenerate_views():
@@ -210,19 +881,13 @@ def regenerate_views():
         session.rollback()
 
 
-def regenerate_limits():
-    global SESSION
-    session = SESSION()
-    logger = logging.getLogger(utils.APP_NAME)
-    try:
-        logging.info('Regenerate dim_test_limit data in database')
-        session.query(TestLimit).delete()
-        for limit in metadata.test_limits:
-            session.add(limit)
-        session.commit()
-    except Exception as ex:
-        logger.exception(ex)
-        session.rollback()
+def regenerate_limits() -> Dict[str, Dict[str, int]]:
+    """Bring the test limit table up to date with `metadata`, only writing rows that
+    have changed.
+
+    :return: number of inserted, updated and deleted rows by table name
+    """
+    return _sync_tables([(TestLimit, metadata.test_limits)])
 
 
 def drop_metadata():
@@ -0,0 +1,89 @@
+"""
+Archival of old records. Records created before a cutoff are moved from `fact_record`
+to `fact_record_archive` in batches, each in its own short transaction, so that the
+hot table stays small without locking it for long. Only the results of the last two
+years are used by the FA index and comparisons, so by default records older than three
+years are archived. The cutoff is the start of a day, so that no day is split between
+the two tables.
+
+Archived records stay available to the progress series and leaderboards of
+`tikki.db.api`, to `GET /record` and exports with `include_archive`, and to the rollups
+of `tikki.db.rollups`. They are not reported to synchronizing clients as deleted. The
+record views and comparisons only read `fact_record`.
+"""
+import datetime
+import logging
+from typing import Any
+
+from dateutil.relativedelta import relativedelta
+import sqlalchemy as sa
+
+from tikki import utils
+from tikki.db.tables import Record, RecordArchive
+
+DEFAULT_MAX_AGE_YEARS = 3
+DEFAULT_BATCH_SIZE = 5000
+
+
+def archive_batch(connection: Any, cutoff: datetime.datetime, batch_size: int) -> int:
+    """
+    Move a batch of records created before a cutoff to the archive.
+
+    :param connection: SQL Alchemy connection, in a transaction
+    :param cutoff: records created before this timestamp are archived
+    :param batch_size: maximum number of records to move
+    :return: number of archived records
+    """
+    record, archive = Record.__table__, RecordArchive.__table__
+    ids = [row[0] for row in connection.execute(
+        sa.select([record.c.id]).where(record.c.created_at < cutoff).limit(batch_size))]
+    if not ids:
+        return 0
+    # the bound on created_at lets Postgres prune the partitions of newer records
+    selected = sa.and_(record.c.id.in_(ids), record.c.created_at < cutoff)
+    columns = [col.name for col in record.columns]
+    values = [record.c[col] for col in columns]
+    values.append(sa.func.now())
+    connection.execute(archive.insert().from_select(
+        columns + ['archived_at'], sa.select(values).where(selected)))
+    connection.execute(record.delete().where(selected))
+    return len(ids)
+
+
+def get_cutoff(now: datetime.datetime, max_age_years: int) -> datetime.datetime:
+    """
+    Get the start of the day on which records become older than `max_age_years`
+    years, counting calendar years like the intervals of Postgres.
+
+    :param now: current time
+    :param max_age_years: age in years after which records are archived
+    :return: records created before this timestamp are archived
+    """
+    day = (now - relativedelta(years=max_age_years)).date()
+    return datetime.datetime.combine(day, datetime.time())
+
+
+def archive_records(engine: Any, max_age_years: int = DEFAULT_MAX_AGE_YEARS,
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Move all records created on days older than `max_age_years` years to the archive.
+
+    :param engine: SQL Alchemy engine
+    :param max_age_years: age in years after which records are archived
+    :param batch_size: number of records moved per transaction
+    :return: number of archived records
+    """
+    logger = logging.getLogger(utils.APP_NAME)
+    with engine.connect() as connection:
+        now = connection.execute(sa.select([sa.func.now()])).scalar()
+    # timestamps are stored without time zone, in the time zone of the database
+    cutoff = get_cutoff(now.replace(tzinfo=None), max_age_years)
+    archived = 0
+    while True:
+        with engine.begin() as connection:
+            count = archive_batch(connection, cutoff, batch_size)
+        if count == 0:
+            break
+        archived += count
+        logger.info(f'Archived {archived} records created before {cutoff:%Y-%m-%d}')
+    return archived
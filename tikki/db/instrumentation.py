@@ -0,0 +1,112 @@
+"""
+Reporting of slow queries and N+1 query patterns. Statements are timed by the cursor
+listeners of `tikki.metrics`, which pass them to `observe_statement`.
+
+Configured with the following environment variables:
+ - TIKKI_SLOW_QUERY_MS: statements running longer than this are logged, defaults to 250
+ - TIKKI_SIMILAR_QUERY_LIMIT: requests issuing more similar statements than this are
+   logged, defaults to 10
+ - TIKKI_QUERY_COUNT_HEADER: set to 1 to add the X-Query-Count header to responses.
+   Always enabled when the app runs in debug mode.
+"""
+import collections
+import logging
+import os
+import re
+from typing import Any
+
+from flask import current_app, g, has_request_context, request
+
+from tikki import utils
+
+SLOW_QUERY_SECONDS = float(os.environ.get('TIKKI_SLOW_QUERY_MS', 250)) / 1000
+SIMILAR_QUERY_LIMIT = int(os.environ.get('TIKKI_SIMILAR_QUERY_LIMIT', 10))
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+_PLACEHOLDER_PATTERN = re.compile(r'%\(\w+\)s|%s|\?|(?<!:):\w+')
+_PLACEHOLDER_LIST_PATTERN = re.compile(r'\(\?(?:, \?)+\)')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+log = logging.getLogger(utils.APP_NAME)
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Normalize a statement so that statements differing only by bound parameters,
+    such as the length of an IN list, compare equal.
+
+    :param statement: SQL statement
+    :return: normalized statement
+    """
+    statement = _WHITESPACE_PATTERN.sub(' ', statement).strip()
+    statement = _PLACEHOLDER_PATTERN.sub('?', statement)
+    return _PLACEHOLDER_LIST_PATTERN.sub('(?)', statement)
+
+
+def get_parameter_shape(parameters: Any, executemany: bool = False) -> Any:
+    """
+    Describe bound parameters by their types, so that statements can be logged
+    without leaking values.
+
+    :param parameters: parameters passed to the DBAPI cursor
+    :param executemany: True if the parameters are a sequence of parameter sets
+    :return: description of the parameters
+    """
+    if executemany:
+        if not parameters:
+            return []
+        return '{} x {}'.format(len(parameters), get_parameter_shape(parameters[0]))
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def observe_statement(statement: str, parameters: Any, executemany: bool,
+                      elapsed: float) -> None:
+    """
+    Log a statement if it was slow, and count it if it was issued during a request of
+    an app set up with `init_app`.
+
+    :param statement: SQL statement
+    :param parameters: parameters passed to the DBAPI cursor
+    :param executemany: True if the parameters are a sequence of parameter sets
+    :param elapsed: execution time of the statement in seconds
+    """
+    if elapsed > SLOW_QUERY_SECONDS:
+        log.warning('Slow query (%.1f ms): %s; parameters: %s', elapsed * 1000,
+                    _WHITESPACE_PATTERN.sub(' ', statement).strip(),
+                    get_parameter_shape(parameters, executemany))
+    if has_request_context() and 'query_counts' in g:
+        g.query_counts[normalize_statement(statement)] += 1
+
+
+def _before_request() -> None:
+    g.query_counts = collections.Counter()
+
+
+def _after_request(response: Any) -> Any:
+    query_counts = g.get('query_counts')
+    if query_counts is None:
+        return response
+    for statement, count in query_counts.most_common():
+        if count <= SIMILAR_QUERY_LIMIT:
+            break
+        log.warning('Possible N+1 query: %d similar statements in %s %s: %s', count,
+                    request.method, request.path, statement)
+    if current_app.debug or os.environ.get('TIKKI_QUERY_COUNT_HEADER') == '1':
+        response.headers[QUERY_COUNT_HEADER] = str(g.get('metrics_db_queries', 0))
+    return response
+
+
+def init_app(app: Any) -> None:
+    """
+    Count the statements issued by each request of a Flask app, log requests issuing
+    many similar statements and optionally report the count in a response header.
+    Requires the metrics of `tikki.metrics` to be set up for the app and its engine.
+
+    :param app: Flask app object
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
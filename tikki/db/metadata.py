@@ -2,13 +2,23 @@
 Module containing type ids and their schenas that are used throughout the application.
 These are currently regenerated at the end of the migration process, but will be moved
 to a dedicated migration step once wording and schemas are finalized.
+
+Dimensions and test limits are read from the files in `tikki.data` on first access of
+`dim_map`, `military_statuses`, `categories`, `genders`, `performances` or
+`test_limits`, so that importing this module is cheap.
+
+All dimensions are also served to clients from `get_dimension_registry`, versioned by
+a hash of their content so that every worker reports the same version for the same
+dimensions.
 """
+import csv
+import functools
+import hashlib
+import json
 import re
 from enum import IntEnum
 import os
-from typing import Any, Dict, List, Tuple, Type, TypeVar
-
-import pandas as pd
+from typing import Any, Callable, Dict, List, Optional, Type, TypeVar, Union
 
 import tikki.data
 from tikki.db.tables import (
@@ -69,6 +79,14 @@ class RecordTypeEnum(IntEnum):
     SICK_LEAVE = 16
 
 
+# Payload keys of the numeric results of fitness tests, stored in `Record.result`
+RESULT_KEYS = {
+    int(RecordTypeEnum.COOPERS_TEST): 'distance',
+    int(RecordTypeEnum.PUSH_UP_60_TEST): 'pushups',
+    int(RecordTypeEnum.SIT_UPS): 'situps',
+    int(RecordTypeEnum.STANDING_JUMP): 'standingjump',
+}
+
 T = TypeVar('T')
 
 base_dimensions = [
@@ -80,25 +98,39 @@ base_dimensions = [
 ]
 
 
-def _populate_dimension_from_file(t: Type[T], filename: str) -> List[T]:
-    ret_list: List[T] = []
+def _parse_value(value: str) -> Union[int, float, str]:
+    for type_ in (int, float):
+        try:
+            return type_(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _read_data_file(filename: str) -> List[Dict[str, Any]]:
+    """
+    Read a tab separated file from `tikki.data`, converting numeric values to ints or
+    floats.
+
+    :param filename: name of the file
+    :return: list of rows as dicts mapping column names to values
+    """
     path = os.path.join(os.path.dirname(tikki.data.__file__), filename)
-    data = pd.read_csv(path, header=0, sep='\t')
-    cols = list(data)
-    for _, row in data.iterrows():
-        row_dict = {}
-        for col in cols:
-            row_dict[col] = row[col]
-        ret_list.append(t(**row_dict))  # type: ignore
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        cols = next(reader)
+        return [{col: _parse_value(value) for col, value in zip(cols, row)}
+                for row in reader if row]
 
-    return ret_list
+
+def _populate_dimension_from_file(t: Type[T], filename: str) -> List[T]:
+    return [t(**row) for row in _read_data_file(filename)]  # type: ignore
 
 
-dim_map: Dict[Any, Any] = {}
-for dim in base_dimensions:
-    dim_type, filename = dim[0], dim[1]
-    dim_list = _populate_dimension_from_file(dim_type, filename)
-    dim_map[dim_type] = dim_list
+@functools.lru_cache(maxsize=None)
+def get_dim_map() -> Dict[Any, Any]:
+    return {dim_type: _populate_dimension_from_file(dim_type, filename)
+            for dim_type, filename in base_dimensions}
 
 
 def _get_dimension_map(dimension_list: List[T]) -> Dict[int, T]:
@@ -108,10 +140,6 @@ def _get_dimension_map(dimension_list: List[T]) -> Dict[int, T]:
 # Category types
 
 
-military_statuses: Dict[int, MilitaryStatus] = _get_dimension_map(dim_map[MilitaryStatus])
-categories: Dict[int, Category] = _get_dimension_map(dim_map[Category])
-genders: Dict[int, Gender] = _get_dimension_map(dim_map[Gender])
-performances: Dict[int, Performance] = _get_dimension_map(dim_map[Performance])
 record_types: Dict[int, RecordType] = {}
 
 
@@ -231,6 +259,24 @@ _append_record_type(16, 2, 'Sick leave', {
             '8': 'yli 120 päivää'}}})
 
 
+def get_result(type_id: Optional[int], payload: Any) -> Optional[float]:
+    """
+    Get the numeric result of a fitness test record.
+
+    :param type_id: record type id
+    :param payload: record payload
+    :return: the result, or None if the record type has no numeric result or the
+    payload does not contain a number
+    """
+    key = RESULT_KEYS.get(type_id)  # type: ignore
+    if key is None or not isinstance(payload, dict):
+        return None
+    value = payload.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
 def _get_limit_rows_from_file(filename: str) -> List[TestLimit]:
     ret_list: List[TestLimit] = []
     gender_map = {
@@ -251,23 +297,24 @@ def _get_limit_rows_from_file(filename: str) -> List[TestLimit]:
     record_type_id = file_map[filename]
     regex = re.compile(r'([scx])([mf])(\d{1,2})-(\d{2,3})')
 
-    path = os.path.join(os.path.dirname(tikki.data.__file__), filename)
-    data = pd.read_csv(path, header=0, sep='\t')
-    limit_cols = {}
-    for col in list(data):
+    rows = _read_data_file(filename)
+    limit_cols = []
+    for col in rows[0] if rows else []:
         match = regex.match(col)
         if match:
             military_status_id = int(military_status_map[match[1]])
             gender_id = int(gender_map[match.group(2)])
             age_lower_limit = int(match.group(3))
             age_upper_limit = int(match.group(4))
-            limit_cols[col] = (military_status_id, gender_id, age_lower_limit, age_upper_limit)  # noqa
+            limit_cols.append((col, (military_status_id, gender_id, age_lower_limit, age_upper_limit)))  # noqa
 
-    lag_upper_limit: Dict[str, Tuple[int, int, int, int]] = {}
-    for _, row in data.sort_values('score', ascending=False).iterrows():
-        for col, ids in limit_cols.items():
-            upper_limit = lag_upper_limit.get(col, 10 * row[col])
+    # the upper limit of a score is the lower limit of the next higher score, or ten
+    # times the lower limit for the highest score
+    lag_upper_limit: Dict[str, Any] = {}
+    for row in sorted(rows, key=lambda x: x['score'], reverse=True):
+        for col, ids in limit_cols:
             lower_limit = row[col]
+            upper_limit = lag_upper_limit.get(col, 10 * lower_limit)
             ret_list.append(TestLimit(record_type_id=record_type_id,
                                       military_status_id=ids[0],
                                       gender_id=ids[1],
@@ -283,8 +330,96 @@ def _get_limit_rows_from_file(filename: str) -> List[TestLimit]:
     return ret_list
 
 
-test_limits: List[TestLimit] = []
-test_limits.extend(_get_limit_rows_from_file('coopers.tsv'))
-test_limits.extend(_get_limit_rows_from_file('pushup.tsv'))
-test_limits.extend(_get_limit_rows_from_file('standingjump.tsv'))
-test_limits.extend(_get_limit_rows_from_file('situp.tsv'))
+@functools.lru_cache(maxsize=None)
+def get_test_limits() -> List[TestLimit]:
+    test_limits: List[TestLimit] = []
+    test_limits.extend(_get_limit_rows_from_file('coopers.tsv'))
+    test_limits.extend(_get_limit_rows_from_file('pushup.tsv'))
+    test_limits.extend(_get_limit_rows_from_file('standingjump.tsv'))
+    test_limits.extend(_get_limit_rows_from_file('situp.tsv'))
+    return test_limits
+
+
+@functools.lru_cache(maxsize=None)
+def _get_test_limit_map() -> Dict[Any, List[TestLimit]]:
+    limit_map: Dict[Any, List[TestLimit]] = {}
+    for limit in get_test_limits():
+        key = (limit.record_type_id, limit.military_status_id, limit.gender_id)
+        limit_map.setdefault(key, []).append(limit)
+    return limit_map
+
+
+def get_performance(type_id: int, military_status_id: Optional[int],
+                    gender_id: Optional[int], age: Optional[int],
+                    result: Optional[float]) -> Optional[int]:
+    """
+    Get the performance category of a fitness test result from the test limits.
+
+    :param type_id: record type of the fitness test
+    :param military_status_id: military status of the user
+    :param gender_id: gender of the user
+    :param age: age of the user at the time of the test
+    :param result: result of the test
+    :return: performance id, or None if no limit matches
+    """
+    if age is None or result is None:
+        return None
+    limits = _get_test_limit_map().get((type_id, military_status_id, gender_id), [])
+    for limit in limits:
+        if limit.age_lower_limit <= age < limit.age_upper_limit and \
+                limit.lower_limit <= result < limit.upper_limit:
+            return limit.performance_id
+    return None
+
+
+# Dimension types included in the registry, by the name used by clients
+registry_dimensions = [
+    ('categories', Category),
+    ('genders', Gender),
+    ('military_statuses', MilitaryStatus),
+    ('performances', Performance),
+    ('user_types', UserType),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def get_dimension_registry() -> Dict[str, Any]:
+    """
+    Get all dimensions and record types as json serializable lists, along with a
+    version that changes whenever their content changes. The content is read from the
+    data files shipped with the package, so the version only changes when a new
+    release is deployed and the server processes are restarted.
+
+    :return: dict with the `version` and the `dimensions` by name
+    """
+    dim_map = get_dim_map()
+    dimensions = {name: sorted((row.json_dict for row in dim_map[dim_type]),
+                               key=lambda row: row['id'])
+                  for name, dim_type in registry_dimensions}
+    dimensions['record_types'] = [record_types[id_].json_dict
+                                  for id_ in sorted(record_types)]
+    content = json.dumps(dimensions, sort_keys=True).encode('utf-8')
+    return {'version': hashlib.sha256(content).hexdigest()[:16],
+            'dimensions': dimensions,
+            }
+
+
+_lazy_attributes: Dict[str, Callable[[], Any]] = {
+    'dim_map': get_dim_map,
+    'military_statuses': lambda: _get_dimension_map(get_dim_map()[MilitaryStatus]),
+    'categories': lambda: _get_dimension_map(get_dim_map()[Category]),
+    'genders': lambda: _get_dimension_map(get_dim_map()[Gender]),
+    'performances': lambda: _get_dimension_map(get_dim_map()[Performance]),
+    'test_limits': get_test_limits,
+}
+
+
+def __getattr__(name: str) -> Any:
+    # Loads data files on first access of the lazy attributes, and then stores the
+    # result as a module global so that later lookups bypass this function. Module
+    # level __getattr__ (PEP 562) requires Python 3.7, see python_requires.
+    if name not in _lazy_attributes:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = _lazy_attributes[name]()
+    globals()[name] = value
+    return value
@@ -0,0 +1,114 @@
+"""
+Maintenance of the monthly range partitions of `fact_record` on Postgres 11+. Rows
+outside the existing monthly partitions are stored in a default partition, and are
+moved to the monthly partition when it is created.
+
+Partitions are created by the migration that partitions the table, and should be
+created ahead of time by running `tikki --create-partitions` regularly, for example
+daily from cron.
+"""
+import datetime
+import logging
+from typing import Any, List
+
+from tikki import utils
+
+PARTITIONED_TABLE = 'fact_record'
+DEFAULT_PARTITION = 'fact_record_default'
+DEFAULT_MONTHS_AHEAD = 3
+
+
+def get_month_start(value: datetime.datetime) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month: datetime.date, count: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month: datetime.date) -> str:
+    return f'{PARTITIONED_TABLE}_{month:%Y%m}'
+
+
+def is_partitioned(connection: Any) -> bool:
+    """
+    Check if `fact_record` is a partitioned table.
+
+    :param connection: SQL Alchemy connection
+    :return: True if the table is partitioned
+    """
+    if connection.dialect.name != 'postgresql':
+        return False
+    relkind = connection.execute(
+        "select relkind from pg_class where oid = to_regclass(%s)",
+        PARTITIONED_TABLE).scalar()
+    return relkind == 'p'
+
+
+def create_partition(connection: Any, month: datetime.date) -> bool:
+    """
+    Create the partition of a month if it does not exist, moving its rows from the
+    default partition.
+
+    :param connection: SQL Alchemy connection
+    :param month: first day of the month
+    :return: True if the partition was created
+    """
+    name = get_partition_name(month)
+    if connection.execute("select to_regclass(%s)", name).scalar() is not None:
+        return False
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    # attaching a partition fails if the default partition has rows in its range,
+    # so the rows are moved before attaching
+    connection.execute(f"create table {name} (like {PARTITIONED_TABLE} "
+                       f"including defaults including constraints)")
+    if connection.execute("select to_regclass(%s)", DEFAULT_PARTITION).scalar():
+        connection.execute(
+            f"with moved as (delete from {DEFAULT_PARTITION} "
+            f"where created_at >= '{start}' and created_at < '{end}' returning *) "
+            f"insert into {name} select * from moved")
+    connection.execute(f"alter table {PARTITIONED_TABLE} attach partition {name} "
+                       f"for values from ('{start}') to ('{end}')")
+    return True
+
+
+def create_partitions(connection: Any, first_month: datetime.date,
+                      last_month: datetime.date) -> List[str]:
+    """
+    Create the missing partitions of a range of months.
+
+    :param connection: SQL Alchemy connection
+    :param first_month: first day of the first month
+    :param last_month: first day of the last month
+    :return: names of the created partitions
+    """
+    created = []
+    month = first_month
+    while month <= last_month:
+        if create_partition(connection, month):
+            created.append(get_partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def maintain_partitions(engine: Any,
+                        months_ahead: int = DEFAULT_MONTHS_AHEAD) -> List[str]:
+    """
+    Create the partitions from the current month up to `months_ahead` months ahead.
+    Does nothing if `fact_record` is not partitioned.
+
+    :param engine: SQL Alchemy engine
+    :param months_ahead: number of future months to create partitions for
+    :return: names of the created partitions
+    """
+    logger = logging.getLogger(utils.APP_NAME)
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            logger.info(f'{PARTITIONED_TABLE} is not partitioned, skipping partitions')
+            return []
+        this_month = get_month_start(datetime.datetime.now())
+        created = create_partitions(connection, this_month,
+                                    add_months(this_month, months_ahead))
+    logger.info(f'Created {len(created)} partitions of {PARTITIONED_TABLE}')
+    return created
@@ -0,0 +1,238 @@
+"""
+Maintenance of the daily rollups of `fact_record` used by dashboards. Each rollup row
+aggregates the records of a record type, organization and day: the number of records,
+the mean and median result, and the number of results in each performance category.
+Records without an event belong to organization 0, the default organization of events.
+
+Rollups are updated incrementally by `tikki --update-rollups`, which should be run
+regularly, for example every few minutes from cron. Each run finds the days touched by
+records written or deleted since the watermark of the previous run, and recomputes the
+rollups of those days from `fact_record` and `fact_record_archive`. Records are found by
+`updated_at`, which is set by the database clock on every write, including imports.
+The days that updates move records away from, and the days of the records of events
+moved to another organization and of users whose gender, military status or birth date
+changed, are recorded in `agg_stale_day` by the updates, and are recomputed and
+cleared by the next run.
+"""
+import datetime
+import logging
+import statistics
+from typing import Any, Dict, List, Optional, Set
+
+import sqlalchemy as sa
+
+from tikki import utils
+from tikki.db import api as db_api, metadata
+from tikki.db.tables import (
+    Event,
+    PerformanceRollup,
+    Record,
+    RecordArchive,
+    RecordRollup,
+    RollupStaleDay,
+    RollupWatermark,
+    Tombstone,
+    User,
+)
+
+WATERMARK_NAME = 'record_daily'
+# Changes committed this long after they were timestamped are still picked up, as the
+# next run looks back this far past the watermark
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+
+
+def _parse_day(value: Any) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _get_age(payload: Any, at: datetime.datetime) -> Optional[int]:
+    try:
+        birth_date = datetime.datetime.strptime(payload['birthDate'], '%d.%m.%Y')
+    except (KeyError, TypeError, ValueError):
+        return None
+    return at.year - birth_date.year - \
+        ((at.month, at.day) < (birth_date.month, birth_date.day))
+
+
+def _get_changed_days(session: Any, since: Optional[datetime.datetime]) \
+        -> Dict[datetime.date, Set[int]]:
+    """
+    Find the days and record types of records written or deleted after a point in
+    time.
+
+    :param session: SQL Alchemy session
+    :param since: point in time, or None for all records
+    :return: record type ids by day
+    """
+    day = sa.func.date(Record.created_at)
+    query = session.query(day, Record.type_id).distinct()
+    if since is not None:
+        query = query.filter(Record.updated_at > since)
+    else:
+        # archived records are never changed, but are part of rebuilt rollups
+        archive_day = sa.func.date(RecordArchive.created_at)
+        query = query.union(session.query(archive_day, RecordArchive.type_id))
+    changed: Dict[datetime.date, Set[int]] = {}
+    for value, type_id in query:
+        changed.setdefault(_parse_day(value), set()).add(type_id)
+
+    if since is not None:
+        # deleted records are only found through their tombstones
+        tombstones = session.query(Tombstone.payload) \
+            .filter(Tombstone.table_name == Record.__tablename__,
+                    Tombstone.deleted_at > since)
+        for payload, in tombstones:
+            changed.setdefault(_parse_day(payload['created_at']), set()) \
+                .add(payload['type_id'])
+    return changed
+
+
+def _rebuild_day(session: Any, day: datetime.date, type_ids: Set[int]) -> int:
+    """
+    Recompute the rollups of some record types on a day.
+
+    :param session: SQL Alchemy session
+    :param day: day to recompute
+    :param type_ids: record types to recompute
+    :return: number of rollup rows written
+    """
+    start = datetime.datetime.combine(day, datetime.time())
+    end = start + datetime.timedelta(days=1)
+
+    def get_records(base_class: Any) -> Any:
+        return session.query(base_class.type_id,
+                             sa.func.coalesce(Event.organization_id, 0),
+                             base_class.created_at, base_class.result, User.payload) \
+            .outerjoin(Event, base_class.event_id == Event.id) \
+            .outerjoin(User, base_class.user_id == User.id) \
+            .filter(base_class.type_id.in_(type_ids),
+                    base_class.created_at >= start, base_class.created_at < end)
+
+    # archived records keep counting towards the rollups of their days
+    records = get_records(Record).union_all(get_records(RecordArchive))
+
+    counts: Dict[Any, int] = {}
+    results: Dict[Any, List[float]] = {}
+    performances: Dict[Any, int] = {}
+    for type_id, organization_id, created_at, result, user_payload in records:
+        key = (type_id, organization_id)
+        counts[key] = counts.get(key, 0) + 1
+        if result is None:
+            continue
+        results.setdefault(key, []).append(result)
+        # the payload keys read here are listed in db_api.ROLLUP_USER_KEYS
+        user_payload = user_payload or {}
+        performance_id = metadata.get_performance(
+            type_id, user_payload.get('militaryStatusId'), user_payload.get('genderId'),
+            _get_age(user_payload, created_at), result)
+        if performance_id is not None:
+            performance_key = key + (performance_id,)
+            performances[performance_key] = performances.get(performance_key, 0) + 1
+
+    for base_class in (RecordRollup, PerformanceRollup):
+        session.query(base_class) \
+            .filter(base_class.record_type_id.in_(type_ids), base_class.day == day) \
+            .delete(synchronize_session=False)
+    rollups = []
+    for (type_id, organization_id), count in counts.items():
+        values = results.get((type_id, organization_id), [])
+        rollups.append({'record_type_id': type_id,
+                        'organization_id': organization_id,
+                        'day': day,
+                        'count': count,
+                        'result_count': len(values),
+                        'mean': statistics.mean(values) if values else None,
+                        'median': statistics.median(values) if values else None,
+                        })
+    session.bulk_insert_mappings(RecordRollup, rollups)
+    session.bulk_insert_mappings(PerformanceRollup, [
+        {'record_type_id': type_id, 'organization_id': organization_id, 'day': day,
+         'performance_id': performance_id, 'count': count}
+        for (type_id, organization_id, performance_id), count in performances.items()])
+    return len(rollups) + len(performances)
+
+
+def update_rollups(rebuild: bool = False) -> Dict[str, int]:
+    """
+    Bring the rollups up to date with the records written or deleted since the
+    previous update.
+
+    :param rebuild: if True, recompute the rollups of all records
+    :return: number of recomputed days and written rollup rows
+    """
+    logger = logging.getLogger(utils.APP_NAME)
+    # taken from the clock that timestamps the records before reading, so that changes
+    # committed during the update are picked up by the next one
+    started_at = db_api.get_database_time()
+    session = db_api.SESSION()
+    try:
+        watermark = session.query(RollupWatermark).get(WATERMARK_NAME)
+        since = None
+        if rebuild:
+            session.query(RecordRollup).delete(synchronize_session=False)
+            session.query(PerformanceRollup).delete(synchronize_session=False)
+        elif watermark is not None:
+            since = watermark.watermark - WATERMARK_OVERLAP
+
+        # stale days are cleared by id, as days marked while the update runs are only
+        # read by the next one
+        stale_days = session.query(RollupStaleDay.id, RollupStaleDay.day,
+                                   RollupStaleDay.record_type_id).all()
+        changed = _get_changed_days(session, since)
+        for _, day, type_id in stale_days:
+            changed.setdefault(_parse_day(day), set()).add(type_id)
+        rows = 0
+        for day, type_ids in sorted(changed.items()):
+            rows += _rebuild_day(session, day, type_ids)
+        if stale_days:
+            session.query(RollupStaleDay) \
+                .filter(RollupStaleDay.id.in_([row[0] for row in stale_days])) \
+                .delete(synchronize_session=False)
+        session.merge(RollupWatermark(name=WATERMARK_NAME, watermark=started_at))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    logger.info(f'Updated rollups of {len(changed)} days, {rows} rows written')
+    return {'days': len(changed), 'rows': rows}
+
+
+def get_rollups(filter_by: Dict[str, Any], since: datetime.date,
+                until: datetime.date) -> List[Dict[str, Any]]:
+    """
+    Retrieve rollups with their performance category counts.
+
+    :param filter_by: filters on `record_type_id` and `organization_id`
+    :param since: first day to retrieve
+    :param until: last day to retrieve
+    :return: list of rollups ordered by day, with performance counts by performance id
+    """
+    session = db_api.SESSION()
+    try:
+        rollups = session.query(RecordRollup).filter_by(**filter_by) \
+            .filter(RecordRollup.day >= since, RecordRollup.day <= until) \
+            .order_by(RecordRollup.day, RecordRollup.record_type_id,
+                      RecordRollup.organization_id).all()
+        performances = session.query(PerformanceRollup).filter_by(**filter_by) \
+            .filter(PerformanceRollup.day >= since, PerformanceRollup.day <= until).all()
+    finally:
+        session.close()
+
+    counts: Dict[Any, Dict[int, int]] = {}
+    for row in performances:
+        key = (row.record_type_id, row.organization_id, row.day)
+        counts.setdefault(key, {})[row.performance_id] = row.count
+    ret = []
+    for rollup in rollups:
+        val = rollup.json_dict
+        val['performance'] = counts.get(
+            (rollup.record_type_id, rollup.organization_id, rollup.day), {})
+        ret.append(val)
+    return ret
@@ -5,9 +5,22 @@ import json
 import sqlalchemy as sa
 from sqlalchemy.ext.declarative import declarative_base
 import sqlalchemy.orm as sao
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
 from typing import Any, Dict
 from sqlalchemy_utils import UUIDType, JSONType
 
+# Payloads are stored as JSONB on Postgres, so that they can be filtered by containment
+# using GIN indexes
+PayloadType = JSONType().with_variant(postgresql.JSONB(), 'postgresql')
+
+
+@compiles(sa.sql.functions.now, 'sqlite')
+def _compile_sqlite_now(element, compiler, **kw):
+    # SQLite stores datetimes as strings, so timestamps from the database clock must
+    # have the format used by SQL Alchemy to compare correctly with other datetimes
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
 
 class TikkiBase(object):
     """
@@ -93,8 +106,9 @@ class User(Base):
     username = sa.Column(sa.String, nullable=False, unique=True)
     type_id = sa.Column(sa.Integer, sa.ForeignKey('dim_user_type.id'), nullable=False)
     created_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
-    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
-    payload = sa.Column(JSONType, nullable=False)
+    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now(),
+                           onupdate=sa.func.now())
+    payload = sa.Column(PayloadType, nullable=False)
 
     @property
     def json_dict(self) -> Dict[str, Any]:
@@ -115,18 +129,78 @@ class Record(Base):
     __tablename__ = 'fact_record'
     id = sa.Column(UUIDType, primary_key=True)
     created_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
-    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
+    # set from the database clock on every write, never by clients, as synchronization
+    # and rollups find changed rows by it
+    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now(),
+                           onupdate=sa.func.now(), index=True)
     user_id = sa.Column(UUIDType, sa.ForeignKey('fact_user.id'), nullable=False)
     created_user_id = sa.Column(UUIDType, nullable=False)
-    event_id = sa.Column(UUIDType, sa.ForeignKey('fact_event.id'), nullable=False)
+    event_id = sa.Column(UUIDType, sa.ForeignKey('fact_event.id'), nullable=True)
     parent_record_id = sa.Column(UUIDType, nullable=True)
     type_id = sa.Column(sa.Integer, nullable=False, default=0)
     validated_user_id = sa.Column(UUIDType, nullable=True)
     validated_at = sa.Column(sa.DateTime, nullable=True)
-    payload = sa.Column(JSONType, nullable=False)
+    payload = sa.Column(PayloadType, nullable=False)
+    # numeric result of fitness tests, copied from the payload when written
+    result = sa.Column(sa.Float, nullable=True)
+
+    __table_args__ = (
+        sa.Index('ix_fact_record_created_at', 'created_at'),
+        sa.Index('ix_fact_record_type_id_result', 'type_id', 'result'),
+        sa.Index('ix_fact_record_event_id_type_id_result', 'event_id', 'type_id',
+                 'result'),
+    )
+
+    @property
+    def json_dict(self):
+        val = {'id': str(self.id),
+               'created_at': self.created_at.isoformat(),
+               'updated_at': self.updated_at.isoformat(),
+               'user_id': str(self.user_id),
+               'created_user_id': str(self.created_user_id),
+               'type_id': self.type_id,
+               'payload': self.payload,
+               }
+        if self.event_id is not None:
+            val['event_id'] = self.event_id
+        if self.validated_at:
+            val['validated_at'] = self.validated_at.isoformat()
+        if self.validated_user_id:
+            val['validated_user_id'] = self.validated_user_id
+        if self.parent_record_id:
+            val['parent_record_id'] = self.parent_record_id
+        return val
+
+
+class RecordArchive(Base):
+    """
+    Table containing old records moved out of `fact_record` by `tikki.db.archive`.
+    Has the columns of `fact_record` without foreign keys, and the time of archival.
+    """
+    __tablename__ = 'fact_record_archive'
+    id = sa.Column(UUIDType, primary_key=True)
+    created_at = sa.Column(sa.DateTime, nullable=False, index=True)
+    updated_at = sa.Column(sa.DateTime, nullable=False)
+    user_id = sa.Column(UUIDType, nullable=False)
+    created_user_id = sa.Column(UUIDType, nullable=False)
+    event_id = sa.Column(UUIDType, nullable=True)
+    parent_record_id = sa.Column(UUIDType, nullable=True)
+    type_id = sa.Column(sa.Integer, nullable=False, default=0)
+    validated_user_id = sa.Column(UUIDType, nullable=True)
+    validated_at = sa.Column(sa.DateTime, nullable=True)
+    payload = sa.Column(PayloadType, nullable=False)
+    result = sa.Column(sa.Float, nullable=True)
+    archived_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
+
+    __table_args__ = (
+        sa.Index('ix_fact_record_archive_user_id_type_id', 'user_id', 'type_id'),
+        sa.Index('ix_fact_record_archive_event_id_type_id_result', 'event_id',
+                 'type_id', 'result'),
+    )
 
     @property
     def json_dict(self):
+        # the json of `Record`, so that archived records can be returned along with it
         val = {'id': str(self.id),
                'created_at': self.created_at.isoformat(),
                'updated_at': self.updated_at.isoformat(),
@@ -134,6 +208,7 @@ class Record(Base):
                'created_user_id': str(self.created_user_id),
                'type_id': self.type_id,
                'payload': self.payload,
+               'archived_at': self.archived_at.isoformat(),
                }
         if self.event_id is not None:
             val['event_id'] = self.event_id
@@ -157,13 +232,14 @@ class Event(Base):
     description = sa.Column(sa.String, nullable=False)
     event_at = sa.Column(sa.DateTime, nullable=False)
     created_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
-    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
+    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now(),
+                           onupdate=sa.func.now(), index=True)
     user_id = sa.Column(UUIDType, sa.ForeignKey('fact_user.id'), nullable=True)
     address = sa.Column(sa.String, nullable=True)
     postal_code = sa.Column(sa.String, nullable=True)
     longitude = sa.Column(sa.Numeric, nullable=True)
     latitude = sa.Column(sa.Numeric, nullable=True)
-    payload = sa.Column(JSONType, nullable=False)
+    payload = sa.Column(PayloadType, nullable=False)
     participants = sao.relationship('UserEventLink', lazy='joined')
 
     @property
@@ -196,8 +272,9 @@ class UserEventLink(Base):
     user_id = sa.Column(UUIDType, sa.ForeignKey('fact_user.id'), primary_key=True)
     event_id = sa.Column(UUIDType, sa.ForeignKey('fact_event.id'), primary_key=True)
     created_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
-    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
-    payload = sa.Column(JSONType, nullable=False)
+    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now(),
+                           onupdate=sa.func.now(), index=True)
+    payload = sa.Column(PayloadType, nullable=False)
 
     @property
     def json_dict(self):
@@ -209,6 +286,28 @@ class UserEventLink(Base):
                 }
 
 
+class Tombstone(Base):
+    """
+    Table containing markers for deleted rows, so that offline clients can learn about
+    removals when synchronizing.
+    """
+    __tablename__ = 'fact_tombstone'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    table_name = sa.Column(sa.String, nullable=False)
+    row_key = sa.Column(JSONType, nullable=False)
+    user_id = sa.Column(UUIDType, nullable=True)
+    deleted_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now(),
+                           index=True)
+    payload = sa.Column(JSONType, nullable=False)
+
+    @property
+    def json_dict(self):
+        return {'table_name': self.table_name,
+                'row_key': self.row_key,
+                'deleted_at': self.deleted_at.isoformat(),
+                }
+
+
 class MilitaryStatus(Base):
     """
     Table containing military statuses (soldier, civilian, conscript)
@@ -263,13 +362,13 @@ class TestLimit(Base):
     military_status_id = sa.Column(sa.Integer, sa.ForeignKey('dim_military_status.id'),
                                    primary_key=True)
     gender_id = sa.Column(sa.Integer, sa.ForeignKey('dim_gender.id'), primary_key=True)
-    age_lower_limit = sa.Column(sa.Integer, nullable=False)
+    score = sa.Column(sa.Float, primary_key=True)
+    age_lower_limit = sa.Column(sa.Integer, primary_key=True)
     age_upper_limit = sa.Column(sa.Integer, nullable=False)
     lower_limit = sa.Column(sa.Float, nullable=False)
     upper_limit = sa.Column(sa.Float, nullable=False)
     performance_id = sa.Column(sa.Integer, sa.ForeignKey('dim_performance.id'),
                                nullable=False)
-    score = sa.Column(sa.Float, nullable=False)
 
     @property
     def json_dict(self):
@@ -283,3 +382,79 @@ class TestLimit(Base):
                 'performance_id': self.performance_id,
                 'score': self.score
                 }
+
+
+class RecordRollup(Base):
+    """
+    Table containing daily aggregates of records by record type and organization,
+    maintained by `tikki.db.rollups`
+    """
+    __tablename__ = 'agg_record_daily'
+    record_type_id = sa.Column(sa.Integer, primary_key=True)
+    organization_id = sa.Column(sa.Integer, primary_key=True)
+    day = sa.Column(sa.Date, primary_key=True)
+    count = sa.Column(sa.Integer, nullable=False)
+    result_count = sa.Column(sa.Integer, nullable=False)
+    mean = sa.Column(sa.Float, nullable=True)
+    median = sa.Column(sa.Float, nullable=True)
+    updated_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
+
+    @property
+    def json_dict(self):
+        return {'record_type_id': self.record_type_id,
+                'organization_id': self.organization_id,
+                'day': self.day.isoformat(),
+                'count': self.count,
+                'result_count': self.result_count,
+                'mean': self.mean,
+                'median': self.median,
+                }
+
+
+class PerformanceRollup(Base):
+    """
+    Table containing daily counts of test results by performance category, record
+    type and organization, maintained by `tikki.db.rollups`
+    """
+    __tablename__ = 'agg_record_daily_performance'
+    record_type_id = sa.Column(sa.Integer, primary_key=True)
+    organization_id = sa.Column(sa.Integer, primary_key=True)
+    day = sa.Column(sa.Date, primary_key=True)
+    performance_id = sa.Column(sa.Integer, primary_key=True)
+    count = sa.Column(sa.Integer, nullable=False)
+
+    @property
+    def json_dict(self):
+        return {'record_type_id': self.record_type_id,
+                'organization_id': self.organization_id,
+                'day': self.day.isoformat(),
+                'performance_id': self.performance_id,
+                'count': self.count,
+                }
+
+
+class RollupWatermark(Base):
+    """
+    Table containing the point in time up to which each rollup has processed changes
+    """
+    __tablename__ = 'agg_watermark'
+    name = sa.Column(sa.String, primary_key=True)
+    watermark = sa.Column(sa.DateTime, nullable=False)
+
+    @property
+    def json_dict(self):
+        return {'name': self.name,
+                'watermark': self.watermark.isoformat(),
+                }
+
+
+class RollupStaleDay(Base):
+    """
+    Table containing the days and record types that records were moved away from by
+    updates, so that `tikki.db.rollups` can recompute their rollups
+    """
+    __tablename__ = 'agg_stale_day'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    day = sa.Column(sa.Date, nullable=False)
+    record_type_id = sa.Column(sa.Integer, nullable=False)
+    marked_at = sa.Column(sa.DateTime, nullable=False, default=sa.func.now())
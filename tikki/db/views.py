@@ -23,8 +23,8 @@ select
   fr.user_id,
   fr.event_id,
   coalesce(fe.event_at, fr.created_at) as created_at,
-  cast(fr.payload->>'distance' as integer) as coopers,
-  rank() over (partition by fr.user_id order by cast(fr.payload->>'distance' as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
+  cast(fr.result as integer) as coopers,
+  rank() over (partition by fr.user_id order by cast(fr.result as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
 from
   fact_record fr
 left outer join
@@ -40,8 +40,8 @@ select
   fr.user_id,
   fr.event_id,
   coalesce(fe.event_at, fr.created_at) as created_at,
-  cast(fr.payload->>'pushups' as integer) as pushups,
-  rank() over (partition by fr.user_id order by cast(fr.payload->>'pushups' as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
+  cast(fr.result as integer) as pushups,
+  rank() over (partition by fr.user_id order by cast(fr.result as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
 from
   fact_record fr
 left outer join
@@ -57,8 +57,8 @@ select
   fr.user_id,
   fr.event_id,
   coalesce(fe.event_at, fr.created_at) as created_at,
-  cast(fr.payload->>'situps' as integer) as situps,
-  rank() over (partition by fr.user_id order by cast(fr.payload->>'situps' as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
+  cast(fr.result as integer) as situps,
+  rank() over (partition by fr.user_id order by cast(fr.result as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
 from
   fact_record fr
 left outer join
@@ -74,8 +74,8 @@ select
   fr.user_id,
   fr.event_id,
   coalesce(fe.event_at, fr.created_at) as created_at,
-  cast(fr.payload->>'situps' as integer) as situps,
-  rank() over (partition by fr.user_id order by cast(fr.payload->>'situps' as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
+  cast(fr.result as integer) as situps,
+  rank() over (partition by fr.user_id order by cast(fr.result as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
 from
   fact_record fr
 left outer join
@@ -91,8 +91,8 @@ select
   fr.user_id,
   fr.event_id,
   coalesce(fe.event_at, fr.created_at) as created_at,
-  cast(fr.payload->>'standingjump' as integer) as standingjump,
-  rank() over (partition by fr.user_id order by cast(fr.payload->>'standingjump' as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
+  cast(fr.result as integer) as standingjump,
+  rank() over (partition by fr.user_id order by cast(fr.result as integer) desc, coalesce(fe.event_at, fr.created_at) desc, fr.id) as rnk
 from
   fact_record fr
 left outer join
@@ -53,3 +53,11 @@ class TooManyRecordsException(DbApiException):
     an update query only updates a single row.
     """
     pass
+
+
+class PayloadValidationException(Flask400Exception):
+    """
+    Exception to indicate that a record payload does not conform to the schema of
+    its record type.
+    """
+    pass
@@ -0,0 +1,104 @@
+"""
+Streaming export of records. Rows are serialized one at a time from a server-side
+cursor, so exports of any size can be written to a file or a HTTP response with
+constant memory usage.
+"""
+import csv
+import datetime
+import io
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional
+from uuid import UUID
+
+from tikki.db import api as db_api
+from tikki.exceptions import AppException
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+EXPORT_COLUMNS = [
+    'id',
+    'created_at',
+    'updated_at',
+    'user_id',
+    'username',
+    'created_user_id',
+    'event_id',
+    'event_name',
+    'event_at',
+    'organization_id',
+    'type_id',
+    'validated_user_id',
+    'validated_at',
+    'payload',
+]
+
+
+def _serialize_value(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    elif isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def get_export_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a row returned by `db_api.stream_records` into a json serializable dict.
+
+    :param row: dict mapping export column names to database values
+    :return: dict mapping export column names to serializable values
+    """
+    return {col: _serialize_value(row.get(col)) for col in EXPORT_COLUMNS}
+
+
+def to_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """
+    Serialize rows as newline delimited json, one line per row.
+    """
+    for row in rows:
+        yield json.dumps(get_export_row(row), default=str) + '\n'
+
+
+def to_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """
+    Serialize rows as csv with a header line. Payloads are written as json strings.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        export_row = get_export_row(row)
+        export_row['payload'] = json.dumps(export_row['payload'], default=str)
+        writer.writerow([export_row[col] for col in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_records(fmt: str, filter_by: Dict[str, Any],
+                   since: Optional[datetime.datetime] = None,
+                   until: Optional[datetime.datetime] = None,
+                   include_archive: bool = False) -> Iterator[str]:
+    """
+    Stream records joined with users and events in the requested format.
+
+    :param fmt: export format, one of the keys in `EXPORT_FORMATS`
+    :param filter_by: filters on record columns, e.g. `type_id` or `event_id`
+    :param since: if defined, only export records created at or after this timestamp
+    :param until: if defined, only export records created before this timestamp
+    :param include_archive: if True, also export archived records
+    :return: iterator of serialized chunks
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise AppException('Unsupported export format: ' + fmt)
+    rows = db_api.stream_records(filter_by, since=since, until=until,
+                                 include_archive=include_archive)
+    if fmt == 'csv':
+        return to_csv(rows)
+    return to_ndjson(rows)
@@ -0,0 +1,199 @@
+"""
+Bulk import of historical records from CSV or TSV files. Files are read in chunks,
+validated in parallel worker processes and loaded into the database in batches.
+
+Each line of the file is a record. The columns `user_id` and `type_id` are required,
+and `id`, `created_user_id`, `event_id`, `created_at`, `validated_user_id` and
+`validated_at` are optional. The payload is either read from a `payload` column
+containing a json object, or built from all remaining columns. An `updated_at` column
+is ignored, as imported rows are timestamped by the database clock when loaded, so that
+synchronizing clients and rollups pick them up.
+
+Payloads are validated in worker processes, which return their validation statistics
+with each chunk, so that they are counted in `validators.get_stats` of the importing
+process. Servers report only their own validations in their metrics.
+"""
+import concurrent.futures
+import datetime
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from tikki import utils, validators
+from tikki.db import api as db_api
+from tikki.db.tables import Record
+from tikki.exceptions import PayloadValidationException
+
+RECORD_COLUMNS = [
+    'id',
+    'user_id',
+    'created_user_id',
+    'event_id',
+    'type_id',
+    'created_at',
+    'updated_at',
+    'validated_user_id',
+    'validated_at',
+]
+UUID_COLUMNS = ['id', 'user_id', 'created_user_id', 'event_id', 'validated_user_id']
+
+
+class ImportStats(object):
+    """
+    Counters describing the progress of an import.
+    """
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.imported = 0
+        self.rejected = 0
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.imported / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f'{self.imported} rows imported, {self.rejected} rows rejected ' \
+               f'({self.rows_per_sec:.0f} rows/sec)'
+
+
+def _to_native(value: Any) -> Any:
+    """
+    Convert pandas and numpy values into plain Python values, mapping missing values
+    to None and integral floats to ints.
+    """
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _prepare_row(raw: Dict[str, Any], now: datetime.datetime) -> Dict[str, Any]:
+    row = {col: _to_native(raw.get(col)) for col in RECORD_COLUMNS}
+    if 'payload' in raw:
+        payload = _to_native(raw['payload'])
+        row['payload'] = json.loads(payload) if isinstance(payload, str) else {}
+    else:
+        row['payload'] = {key: _to_native(value) for key, value in raw.items()
+                          if key not in RECORD_COLUMNS}
+        row['payload'] = {key: value for key, value in row['payload'].items()
+                          if value is not None}
+
+    row['id'] = row['id'] or str(utils.generate_uuid())
+    row['created_user_id'] = row['created_user_id'] or row['user_id']
+    # malformed values are rejected here, as they would abort the whole batch when
+    # loaded into the database
+    for col in UUID_COLUMNS:
+        if row[col] is not None:
+            row[col] = str(UUID(str(row[col])))
+    if row['type_id'] is not None:
+        row['type_id'] = int(row['type_id'])
+    for col in ('created_at', 'validated_at'):
+        if row[col] is not None:
+            row[col] = utils.parse_value(str(row[col]), datetime.datetime)
+    row['created_at'] = row['created_at'] or now
+    return row
+
+
+def validate_chunk(first_line: int, raw_rows: List[Dict[str, Any]]) \
+        -> Tuple[List[Dict[str, Any]], List[str], Dict[int, validators.ValidationStats]]:
+    """
+    Convert and validate a chunk of rows read from an import file. Executed in
+    worker processes.
+
+    :param first_line: line number of the first row in the chunk, used in errors
+    :param raw_rows: rows as read from the file
+    :return: a tuple containing valid rows ready to be inserted, errors, and the
+    validation statistics of the chunk by record type id
+    """
+    # workers validate many chunks and start with a copy of the statistics of the
+    # importing process, so only the validations of this chunk are returned
+    stats_before = validators.copy_stats()
+    now = datetime.datetime.now()
+    rows: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    for line, raw in enumerate(raw_rows, start=first_line):
+        try:
+            row = _prepare_row(raw, now)
+            if row['user_id'] is None or row['type_id'] is None:
+                raise ValueError('user_id and type_id are required')
+            validators.validate_payload(row['type_id'], row['payload'])
+        except (PayloadValidationException, ValueError) as ex:
+            errors.append(f'line {line}: {ex}')
+            continue
+        rows.append(row)
+    stats = validators.copy_stats()
+    for type_id, before in stats_before.items():
+        stats[type_id].add(before, -1)
+    return rows, errors, stats
+
+
+def read_chunks(path: str,
+                chunk_size: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Read an import file in chunks. Files ending in `.tsv` or `.tab` are read as tab
+    separated, others as comma separated.
+
+    :param path: path to the import file
+    :param chunk_size: number of rows per chunk
+    :return: iterator of tuples containing the line number of the first row in the
+    chunk and the rows as dicts
+    """
+    # pandas is slow to import, so only import it when actually needed
+    import pandas as pd
+
+    sep = '\t' if os.path.splitext(path)[1].lower() in ('.tsv', '.tab') else ','
+    first_line = 2
+    for chunk in pd.read_csv(path, sep=sep, header=0, chunksize=chunk_size):
+        yield first_line, chunk.to_dict('records')
+        first_line += len(chunk)
+
+
+def import_records(path: str, workers: Optional[int] = None,
+                   chunk_size: int = 10000) -> ImportStats:
+    """
+    Import records from a CSV or TSV file.
+
+    :param path: path to the import file
+    :param workers: number of validation worker processes, defaults to CPU count
+    :param chunk_size: number of rows validated and inserted at a time
+    :return: statistics of the import
+    """
+    logger = logging.getLogger(utils.APP_NAME)
+    workers = workers or os.cpu_count() or 1
+    stats = ImportStats()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: List[concurrent.futures.Future] = []
+        chunks = read_chunks(path, chunk_size)
+        for first_line, raw_rows in chunks:
+            pending.append(executor.submit(validate_chunk, first_line, raw_rows))
+            # keep a bounded number of chunks in flight to limit memory usage,
+            # inserting in file order
+            if len(pending) >= 2 * workers:
+                _load_chunk(pending.pop(0).result(), stats, logger)
+        for future in pending:
+            _load_chunk(future.result(), stats, logger)
+    return stats
+
+
+def _load_chunk(result: Tuple[List[Dict[str, Any]], List[str],
+                              Dict[int, validators.ValidationStats]],
+                stats: ImportStats, logger: logging.Logger) -> None:
+    rows, errors, validation_stats = result
+    validators.merge_stats(validation_stats)
+    for error in errors:
+        logger.warning(f'Rejected row on {error}')
+    stats.rejected += len(errors)
+    updated_at = db_api.get_database_time()
+    for row in rows:
+        row['updated_at'] = updated_at
+    stats.imported += db_api.bulk_insert(Record, rows)
+    logger.info(str(stats))
@@ -0,0 +1,187 @@
+"""
+Cache for the JSON Web Key Set (JWKS) used to verify Auth0 tokens. Keys are selected
+by key id (`kid`), kept in memory and optionally on disk, and refreshed in a
+background thread, so that starting the app does not require network access.
+"""
+import json
+import logging
+import os
+import random
+import stat
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, Optional
+
+from jwt.algorithms import RSAAlgorithm  # type: ignore
+
+from tikki.exceptions import Flask400Exception
+
+DEFAULT_URL = 'https://tikkifi.eu.auth0.com/.well-known/jwks.json'
+
+
+class JwksCache(object):
+    """
+    Signing keys of an identity provider, indexed by key id.
+
+    :param url: URL of the JWKS document
+    :param cache_path: path of the on-disk cache, or None to disable it. The cache is
+    only trusted if it is owned by the user of the process and not writable by others,
+    so it should be in a directory owned by the app.
+    :param local_path: path of a local JWKS file. If defined, keys are only ever
+    loaded from this file and the network is never accessed.
+    :param refresh_interval: seconds between background refreshes
+    :param min_retry: seconds to wait before retrying a failed refresh. Doubled after
+    each consecutive failure up to `max_retry`.
+    :param max_retry: maximum seconds to wait before retrying a failed refresh
+    :param timeout: network timeout in seconds
+    """
+    def __init__(self, url: str = DEFAULT_URL,
+                 cache_path: Optional[str] = None,
+                 local_path: Optional[str] = None,
+                 refresh_interval: float = 3600, min_retry: float = 5,
+                 max_retry: float = 600, timeout: float = 5):
+        self.url = url
+        self.cache_path = cache_path
+        self.local_path = local_path
+        self.refresh_interval = refresh_interval
+        self.min_retry = min_retry
+        self.max_retry = max_retry
+        self.timeout = timeout
+        self.keys: Dict[str, Any] = {}
+        self.refreshed_at = 0.0
+        self.attempted_at = 0.0
+        self._lock = threading.Lock()
+        self._thread_pid: Optional[int] = None
+        self._logger = logging.getLogger(__name__)
+
+    def _set_keys(self, document: Dict[str, Any]) -> None:
+        keys = {}
+        for jwk in document['keys']:
+            if jwk.get('kty') == 'RSA':
+                keys[jwk.get('kid')] = RSAAlgorithm.from_jwk(json.dumps(jwk))
+        if not keys:
+            raise ValueError('JWKS contains no RSA keys')
+        self.keys = keys
+
+    def _load_file(self, path: str, check_owner: bool = False) -> bool:
+        try:
+            with open(path, encoding='utf-8') as f:
+                if check_owner:
+                    # checked on the opened file, so that it cannot be swapped after
+                    # the check
+                    st = os.fstat(f.fileno())
+                    if st.st_uid != os.getuid() \
+                            or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                        raise ValueError('not owned by the user of the process or '
+                                         'writable by others')
+                self._set_keys(json.load(f))
+            return True
+        except (OSError, ValueError, KeyError) as ex:
+            self._logger.warning(f'Unable to load JWKS from {path}: {ex}')
+            return False
+
+    def _write_cache(self, contents: bytes) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            # write to a temporary file first so that concurrent readers never see a
+            # partially written cache
+            directory = os.path.dirname(self.cache_path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(contents)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as ex:
+            self._logger.warning(f'Unable to write JWKS cache {self.cache_path}: {ex}')
+
+    def load(self) -> None:
+        """
+        Load keys without blocking on the network if possible: from the local file if
+        defined, otherwise from the on-disk cache. Only if neither is available is the
+        JWKS fetched from the network. Failures are logged, not raised, so that the
+        app can start while offline.
+        """
+        if self.local_path is not None:
+            self._load_file(self.local_path)
+        elif self.cache_path is not None and os.path.exists(self.cache_path) \
+                and self._load_file(self.cache_path, check_owner=True):
+            return
+        else:
+            self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Fetch the JWKS from the network and update the in-memory and on-disk caches.
+
+        :return: True if successful, False otherwise
+        """
+        self.attempted_at = time.monotonic()
+        if self.local_path is not None:
+            return self._load_file(self.local_path)
+        try:
+            contents = urllib.request.urlopen(self.url, timeout=self.timeout).read()
+            self._set_keys(json.loads(contents))
+        except (OSError, ValueError, KeyError) as ex:
+            self._logger.warning(f'Unable to refresh JWKS from {self.url}: {ex}')
+            return False
+        self.refreshed_at = time.monotonic()
+        self._write_cache(contents)
+        return True
+
+    def _refresh_loop(self) -> None:
+        # keys loaded from the on-disk cache may be stale, so refresh them soon
+        delay = self.refresh_interval if self.refreshed_at else self.min_retry
+        while True:
+            # jitter spreads the refreshes of different workers over time
+            time.sleep(delay * random.uniform(0.9, 1.1))
+            if self.refresh():
+                delay = self.refresh_interval
+            elif delay >= self.refresh_interval:
+                delay = self.min_retry
+            else:
+                delay = min(delay * 2, self.max_retry)
+
+    def start(self) -> None:
+        """
+        Start refreshing keys in a background thread, unless already started in this
+        process. Threads do not survive forking, so this is checked per process.
+        """
+        if self.local_path is not None or self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            thread = threading.Thread(target=self._refresh_loop, name='jwks-refresh',
+                                      daemon=True)
+            thread.start()
+
+    def get_key(self, kid: Optional[str]) -> Any:
+        """
+        Get the public key with the given key id. If the key is unknown, the JWKS is
+        refreshed, at most once per `min_retry` seconds, to pick up rotated keys.
+
+        :param kid: key id from the token header. If None, the only key is returned.
+        :raises Flask400Exception: if no matching key is found
+        :return: public key
+        """
+        self.start()
+        key = self._find_key(kid)
+        if key is None and time.monotonic() - self.attempted_at > self.min_retry:
+            with self._lock:
+                key = self._find_key(kid)
+                if key is None:
+                    self.refresh()
+                    key = self._find_key(kid)
+        if key is None:
+            raise Flask400Exception(f'Unknown token signing key: {kid}')
+        return key
+
+    def _find_key(self, kid: Optional[str]) -> Any:
+        keys = self.keys
+        if kid is None:
+            # tokens without a key id can only be verified when there is a single key
+            return next(iter(keys.values())) if len(keys) == 1 else None
+        return keys.get(kid)
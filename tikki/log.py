@@ -0,0 +1,166 @@
+"""
+Logging setup of the application. Log records are put on a queue in the thread that
+emits them and formatted and written by a background thread, so that logging does not
+add I/O latency to request threads.
+
+Configured with the following environment variables:
+ - TIKKI_LOG_LEVEL: level of the application logger, defaults to INFO
+ - TIKKI_LOG_FORMAT: `text` (default) or `json`
+ - TIKKI_LOG_SAMPLE_RATE: fraction of INFO and lower records that are kept, defaults
+   to 1.0. Warnings and errors are never sampled.
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Any, Dict
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_simple.utils import decode_jwt
+
+TEXT_FORMAT = '[%(asctime)s] - %(name)s - %(levelname)s - %(remote_addr)s - %(url)s - %(jwt_identity)s - %(message)s'  # noqa
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds details of the current request to log records. Must run in the thread that
+    emits the record, as the request context is not available in the listener thread.
+    The JWT identity is resolved once per request by the hook added by `init_app`.
+    """
+    def filter(self, record):
+        if has_request_context():
+            record.url = request.url
+            record.remote_addr = request.remote_addr
+            record.jwt_identity = g.get('jwt_identity', '')
+        else:
+            record.url, record.remote_addr, record.jwt_identity = '', '', ''
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of high-volume log records.
+
+    :param rate: fraction of records that are kept
+    :param max_level: records above this level are always kept
+    """
+    def __init__(self, rate: float, max_level: int = logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record):
+        return record.levelno > self.max_level or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as single line json objects.
+    """
+    def format(self, record):
+        obj: Dict[str, Any] = {
+            'timestamp': datetime.datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'url': getattr(record, 'url', ''),
+            'remote_addr': getattr(record, 'remote_addr', ''),
+            'jwt_identity': getattr(record, 'jwt_identity', ''),
+        }
+        # records from the queue carry their traceback already formatted
+        exception = self.formatException(record.exc_info) if record.exc_info \
+            else record.exc_text
+        if exception:
+            obj['exception'] = exception
+        return json.dumps(obj, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that keeps the traceback of a record apart from its message, so that
+    the formatters of the listener can place it, e.g. in the `exception` field of json
+    records. The base class merges it into the message.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # tracebacks can not be passed between threads safely, their text can
+        record.exc_info = None
+        return record
+
+
+def _start_listener(handler: logging.handlers.QueueHandler,
+                    target: logging.Handler) -> logging.handlers.QueueListener:
+    log_queue: queue.Queue = queue.Queue(-1)
+    handler.queue = log_queue
+    listener = logging.handlers.QueueListener(log_queue, target)
+    listener.start()
+    return listener
+
+
+def _get_jwt_identity() -> str:
+    parts = request.headers.get(current_app.config['JWT_HEADER_NAME'], '').split()
+    if not parts:
+        return ''
+    try:
+        claims = decode_jwt(parts[-1])
+    except Exception:
+        return ''
+    return claims.get(current_app.config['JWT_IDENTITY_CLAIM'], '')
+
+
+def init_logging(logger_name: str) -> logging.handlers.QueueListener:
+    """
+    Set up asynchronous logging for a logger based on environment variables.
+
+    :param logger_name: name of the logger to set up
+    :return: the listener that writes queued records, replaced by a new one in
+    forked child processes
+    """
+    level = os.environ.get('TIKKI_LOG_LEVEL', 'INFO').upper()
+    log_format = os.environ.get('TIKKI_LOG_FORMAT', 'text')
+    sample_rate = float(os.environ.get('TIKKI_LOG_SAMPLE_RATE', 1.0))
+
+    stream_handler = logging.StreamHandler()
+    if log_format == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = QueueHandler(queue.Queue(-1))
+    if sample_rate < 1.0:
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+    queue_handler.addFilter(RequestContextFilter())
+    listeners = [_start_listener(queue_handler, stream_handler)]
+    atexit.register(lambda: listeners[-1].stop())
+    if hasattr(os, 'register_at_fork'):
+        # The listener thread does not survive forking, and the queue may have been
+        # copied in an inconsistent state, so start a new listener with a new queue.
+        os.register_at_fork(after_in_child=lambda: listeners.append(
+            _start_listener(queue_handler, stream_handler)))
+
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    return listeners[0]
+
+
+def init_app(app: Any) -> None:
+    """
+    Resolve the JWT identity of each request once for the log records of the request.
+    Records of requests without a valid token have an empty identity.
+
+    :param app: Flask app object
+    """
+    @app.before_request
+    def resolve_jwt_identity():
+        g.jwt_identity = _get_jwt_identity()
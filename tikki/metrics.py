@@ -0,0 +1,209 @@
+"""
+Request and database metrics, exposed in the Prometheus text format. Metrics are
+collected per process, so with multiple server workers each worker reports its own.
+"""
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import g, has_request_context, request
+import sqlalchemy as sa
+
+from tikki.db import instrumentation
+
+# Upper bounds of the latency histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('"', '\\"'))
+                     for key, value in labels)
+    return '{' + pairs + '}'
+
+
+class Counter(object):
+    """
+    Monotonically increasing values by labels.
+    """
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), value: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self._values.items()):
+            yield f'{self.name}{_format_labels(labels)} {value}'
+
+
+class Histogram(object):
+    """
+    Distribution of observed values by labels, with cumulative buckets.
+    """
+    def __init__(self, name: str, description: str,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        # values are stored as bucket counts followed by the +Inf count and the sum
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, values in sorted(self._values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else str(bound)
+                yield f'{self.name}_bucket{_format_labels(labels + (("le", le),))} ' \
+                      f'{cumulative}'
+            yield f'{self.name}_count{_format_labels(labels)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(labels)} {values[-1]}'
+
+
+class Gauge(object):
+    """
+    Values by labels that are read from a callback when rendered. Can also expose
+    counters maintained elsewhere by setting `metric_type` to `counter`.
+    """
+    def __init__(self, name: str, description: str,
+                 callback: Callable[[], Dict[Labels, float]], metric_type: str = 'gauge'):
+        self.name = name
+        self.description = description
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} {self.metric_type}'
+        for labels, value in sorted(self.callback().items()):
+            yield f'{self.name}{_format_labels(labels)} {value}'
+
+
+REQUEST_LATENCY = Histogram('tikki_request_duration_seconds',
+                            'Request latency by route and method')
+REQUEST_COUNT = Counter('tikki_requests_total',
+                        'Requests by route, method and status code')
+DB_QUERY_COUNT = Counter('tikki_db_queries_total', 'Database queries by route')
+DB_QUERY_TIME = Counter('tikki_db_query_seconds_total',
+                        'Time spent in database queries by route')
+DB_QUERIES_PER_REQUEST = Histogram('tikki_db_queries_per_request',
+                                   'Database queries per request by route',
+                                   buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+
+_metrics: List[Any] = [
+    REQUEST_LATENCY,
+    REQUEST_COUNT,
+    DB_QUERY_COUNT,
+    DB_QUERY_TIME,
+    DB_QUERIES_PER_REQUEST,
+]
+
+
+def register(metric: Any) -> None:
+    """
+    Add a metric to the output of `render`.
+    """
+    _metrics.append(metric)
+
+
+def render() -> str:
+    """
+    Render all metrics in the Prometheus text format.
+    """
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _get_route() -> str:
+    # use the url rule instead of the path to keep label cardinality bounded
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _before_request() -> None:
+    g.metrics_started_at = time.perf_counter()
+    g.metrics_db_queries = 0
+    g.metrics_db_seconds = 0.0
+
+
+def _after_request(response: Any) -> Any:
+    started_at: Optional[float] = g.get('metrics_started_at')
+    if started_at is None:
+        return response
+    route = _get_route()
+    labels = (('route', route), ('method', request.method))
+    REQUEST_LATENCY.observe(time.perf_counter() - started_at, labels)
+    REQUEST_COUNT.inc(labels + (('status', str(response.status_code)),))
+    DB_QUERY_COUNT.inc((('route', route),), g.metrics_db_queries)
+    DB_QUERY_TIME.inc((('route', route),), g.metrics_db_seconds)
+    DB_QUERIES_PER_REQUEST.observe(g.metrics_db_queries, (('route', route),))
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany) -> None:
+    conn.info.setdefault('metrics_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany) -> None:
+    elapsed = time.perf_counter() - conn.info['metrics_started_at'].pop()
+    instrumentation.observe_statement(statement, parameters, executemany, elapsed)
+    if has_request_context() and 'metrics_started_at' in g:
+        g.metrics_db_queries += 1
+        g.metrics_db_seconds += elapsed
+
+
+def _handle_error(context: Any) -> None:
+    # after_cursor_execute is not called for failed statements
+    connection = context.connection
+    if connection is not None and connection.info.get('metrics_started_at'):
+        connection.info['metrics_started_at'].pop()
+
+
+def instrument_engine(engine: Any) -> None:
+    """
+    Time the statements of an engine, for the query metrics of requests and for the
+    slow query log of `tikki.db.instrumentation`.
+
+    :param engine: SQL Alchemy engine
+    """
+    sa.event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    sa.event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    sa.event.listen(engine, 'handle_error', _handle_error)
+
+
+def init_app(app: Any, engine: Any) -> None:
+    """
+    Start collecting request metrics of a Flask app and query metrics of an engine.
+
+    :param app: Flask app object
+    :param engine: SQL Alchemy engine used by the app
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    instrument_engine(engine)
@@ -0,0 +1,43 @@
+"""add sync tombstones
+
+Revision ID: 3f9c2a7d1b64
+Revises: ea592060b0b5
+Create Date: 2026-10-19 09:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import func
+from sqlalchemy_utils import UUIDType, JSONType
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d1b64'
+down_revision = 'ea592060b0b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('fact_tombstone',
+                    sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+                    sa.Column('table_name', sa.String, nullable=False),
+                    sa.Column('row_key', JSONType, nullable=False),
+                    sa.Column('user_id', UUIDType, nullable=True),
+                    sa.Column('deleted_at', sa.DateTime, nullable=False,
+                              default=func.now()),
+                    sa.Column('payload', JSONType, nullable=False))
+
+    op.create_index('ix_fact_tombstone_deleted_at', 'fact_tombstone', ['deleted_at'])
+    op.create_index('ix_fact_record_updated_at', 'fact_record', ['updated_at'])
+    op.create_index('ix_fact_event_updated_at', 'fact_event', ['updated_at'])
+    op.create_index('ix_fact_user_event_link_updated_at', 'fact_user_event_link',
+                    ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_fact_user_event_link_updated_at', 'fact_user_event_link')
+    op.drop_index('ix_fact_event_updated_at', 'fact_event')
+    op.drop_index('ix_fact_record_updated_at', 'fact_record')
+    op.drop_index('ix_fact_tombstone_deleted_at', 'fact_tombstone')
+    op.drop_table('fact_tombstone')
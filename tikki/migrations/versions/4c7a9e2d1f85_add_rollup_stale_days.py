@@ -0,0 +1,30 @@
+"""add days of moved records to recompute rollups of
+
+Revision ID: 4c7a9e2d1f85
+Revises: d81f6c2b9e47
+Create Date: 2026-10-19 15:12:47.905316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import func
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7a9e2d1f85'
+down_revision = 'd81f6c2b9e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('agg_stale_day',
+                    sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+                    sa.Column('day', sa.Date, nullable=False),
+                    sa.Column('record_type_id', sa.Integer, nullable=False),
+                    sa.Column('marked_at', sa.DateTime, nullable=False,
+                              default=func.now()))
+
+
+def downgrade():
+    op.drop_table('agg_stale_day')
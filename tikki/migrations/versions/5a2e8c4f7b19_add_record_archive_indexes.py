@@ -0,0 +1,28 @@
+"""add indexes for progress and leaderboards of archived records
+
+Revision ID: 5a2e8c4f7b19
+Revises: 9e3b6d5a7c42
+Create Date: 2026-10-19 17:21:36.240918
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a2e8c4f7b19'
+down_revision = '9e3b6d5a7c42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_fact_record_archive_user_id_type_id', 'fact_record_archive',
+                    ['user_id', 'type_id'])
+    op.create_index('ix_fact_record_archive_event_id_type_id_result',
+                    'fact_record_archive', ['event_id', 'type_id', 'result'])
+
+
+def downgrade():
+    op.drop_index('ix_fact_record_archive_event_id_type_id_result',
+                  'fact_record_archive')
+    op.drop_index('ix_fact_record_archive_user_id_type_id', 'fact_record_archive')
@@ -0,0 +1,90 @@
+"""partition fact_record by created_at
+
+Revision ID: 8b51c4e0a2d7
+Revises: 3f9c2a7d1b64
+Create Date: 2026-10-19 10:02:17.904551
+
+"""
+import datetime
+
+from alembic import op
+
+from tikki.db import partitions
+
+
+# revision identifiers, used by Alembic.
+revision = '8b51c4e0a2d7'
+down_revision = '3f9c2a7d1b64'
+branch_labels = None
+depends_on = None
+
+COLUMNS = """
+  id uuid not null,
+  created_at timestamp without time zone not null,
+  updated_at timestamp without time zone not null,
+  user_id uuid,
+  created_user_id uuid,
+  event_id uuid,
+  parent_record_id uuid,
+  type_id integer not null default 0,
+  validated_user_id uuid,
+  validated_at timestamp without time zone,
+  payload json not null
+"""
+
+# views are recreated by `tikki --migrate up` after the migrations
+RECORD_VIEWS = [
+    'view_user_fa_index',
+    'view_record_coopers',
+    'view_record_pushups',
+    'view_record_situps',
+    'view_record_standingjump',
+]
+
+
+def _drop_views():
+    for view in RECORD_VIEWS:
+        op.execute(f'drop view if exists {view}')
+
+
+def upgrade():
+    # partitioned tables with primary keys and default partitions require
+    # Postgres 11+, other databases keep the plain table
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or bind.dialect.server_version_info < (11,):
+        return
+
+    _drop_views()
+    op.execute('alter table fact_record rename to fact_record_unpartitioned')
+    op.execute(f'create table fact_record ({COLUMNS}) partition by range (created_at)')
+    op.execute(f'create table {partitions.DEFAULT_PARTITION} '
+               f'partition of fact_record default')
+
+    first_created_at = bind.execute(
+        'select min(created_at) from fact_record_unpartitioned').scalar()
+    this_month = partitions.get_month_start(datetime.datetime.now())
+    first_month = partitions.get_month_start(first_created_at) \
+        if first_created_at else this_month
+    partitions.create_partitions(
+        bind, first_month, partitions.add_months(this_month,
+                                                 partitions.DEFAULT_MONTHS_AHEAD))
+
+    op.execute('insert into fact_record select * from fact_record_unpartitioned')
+    op.execute('drop table fact_record_unpartitioned')
+    # the partition key must be part of the primary key
+    op.execute('alter table fact_record add primary key (id, created_at)')
+    op.create_index('ix_fact_record_updated_at', 'fact_record', ['updated_at'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not partitions.is_partitioned(bind):
+        return
+
+    _drop_views()
+    op.execute('alter table fact_record rename to fact_record_partitioned')
+    op.execute(f'create table fact_record ({COLUMNS})')
+    op.execute('insert into fact_record select * from fact_record_partitioned')
+    op.execute('drop table fact_record_partitioned')
+    op.execute('alter table fact_record add primary key (id)')
+    op.create_index('ix_fact_record_updated_at', 'fact_record', ['updated_at'])
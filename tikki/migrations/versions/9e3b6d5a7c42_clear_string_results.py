@@ -0,0 +1,42 @@
+"""clear results backfilled from json strings
+
+Revision ID: 9e3b6d5a7c42
+Revises: 4c7a9e2d1f85
+Create Date: 2026-10-19 16:02:11.583204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b6d5a7c42'
+down_revision = '4c7a9e2d1f85'
+branch_labels = None
+depends_on = None
+
+# payload keys of the numeric results by record type, as in metadata.RESULT_KEYS
+RESULT_KEYS = {
+    1: 'distance',
+    2: 'pushups',
+    3: 'situps',
+    4: 'standingjump',
+}
+
+
+def upgrade():
+    # the first version of c6e1f93a7d20 also backfilled results from json strings
+    # of digits on Postgres, which metadata.get_result does not accept
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    for type_id, key in RESULT_KEYS.items():
+        op.execute(f"""update fact_record
+            set result = null
+            where type_id = {type_id}
+              and result is not null
+              and jsonb_typeof(payload->'{key}') <> 'number'""")
+
+
+def downgrade():
+    # the cleared results were not valid
+    pass
@@ -0,0 +1,45 @@
+"""add daily record rollups
+
+Revision ID: a93e5b7f2c16
+Revises: f47d2c8e9a13
+Create Date: 2026-10-19 12:08:26.740195
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import func
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93e5b7f2c16'
+down_revision = 'f47d2c8e9a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('agg_record_daily',
+                    sa.Column('record_type_id', sa.Integer, primary_key=True),
+                    sa.Column('organization_id', sa.Integer, primary_key=True),
+                    sa.Column('day', sa.Date, primary_key=True),
+                    sa.Column('count', sa.Integer, nullable=False),
+                    sa.Column('result_count', sa.Integer, nullable=False),
+                    sa.Column('mean', sa.Float, nullable=True),
+                    sa.Column('median', sa.Float, nullable=True),
+                    sa.Column('updated_at', sa.DateTime, nullable=False,
+                              default=func.now()))
+    op.create_table('agg_record_daily_performance',
+                    sa.Column('record_type_id', sa.Integer, primary_key=True),
+                    sa.Column('organization_id', sa.Integer, primary_key=True),
+                    sa.Column('day', sa.Date, primary_key=True),
+                    sa.Column('performance_id', sa.Integer, primary_key=True),
+                    sa.Column('count', sa.Integer, nullable=False))
+    op.create_table('agg_watermark',
+                    sa.Column('name', sa.String, primary_key=True),
+                    sa.Column('watermark', sa.DateTime, nullable=False))
+
+
+def downgrade():
+    op.drop_table('agg_watermark')
+    op.drop_table('agg_record_daily_performance')
+    op.drop_table('agg_record_daily')
@@ -0,0 +1,48 @@
+"""add record archive
+
+Revision ID: b5d8e2f41c70
+Revises: a93e5b7f2c16
+Create Date: 2026-10-19 12:41:09.365812
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy_utils import UUIDType, JSONType
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d8e2f41c70'
+down_revision = 'a93e5b7f2c16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    payload_type = JSONType().with_variant(postgresql.JSONB(), 'postgresql')
+    op.create_table('fact_record_archive',
+                    sa.Column('id', UUIDType, primary_key=True),
+                    sa.Column('created_at', sa.DateTime, nullable=False),
+                    sa.Column('updated_at', sa.DateTime, nullable=False),
+                    sa.Column('user_id', UUIDType, nullable=False),
+                    sa.Column('created_user_id', UUIDType, nullable=False),
+                    sa.Column('event_id', UUIDType, nullable=True),
+                    sa.Column('parent_record_id', UUIDType, nullable=True),
+                    sa.Column('type_id', sa.Integer, nullable=False, default=0),
+                    sa.Column('validated_user_id', UUIDType, nullable=True),
+                    sa.Column('validated_at', sa.DateTime, nullable=True),
+                    sa.Column('payload', payload_type, nullable=False),
+                    sa.Column('result', sa.Float, nullable=True),
+                    sa.Column('archived_at', sa.DateTime, nullable=False,
+                              default=func.now()))
+    op.create_index('ix_fact_record_archive_created_at', 'fact_record_archive',
+                    ['created_at'])
+    # used to find the records to archive, and by exports limited by creation time
+    op.create_index('ix_fact_record_created_at', 'fact_record', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_fact_record_created_at', 'fact_record')
+    op.drop_index('ix_fact_record_archive_created_at', 'fact_record_archive')
+    op.drop_table('fact_record_archive')
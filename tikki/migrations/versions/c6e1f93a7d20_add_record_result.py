@@ -0,0 +1,50 @@
+"""add typed result column to fact_record
+
+Revision ID: c6e1f93a7d20
+Revises: 8b51c4e0a2d7
+Create Date: 2026-10-19 10:31:05.217730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e1f93a7d20'
+down_revision = '8b51c4e0a2d7'
+branch_labels = None
+depends_on = None
+
+# payload keys of the numeric results by record type, as in metadata.RESULT_KEYS
+RESULT_KEYS = {
+    1: 'distance',
+    2: 'pushups',
+    3: 'situps',
+    4: 'standingjump',
+}
+
+
+def upgrade():
+    op.add_column('fact_record', sa.Column('result', sa.Float, nullable=True))
+
+    bind = op.get_bind()
+    for type_id, key in RESULT_KEYS.items():
+        if bind.dialect.name == 'postgresql':
+            # payloads with values other than json numbers are left without a
+            # result, as in metadata.get_result
+            op.execute(f"""update fact_record
+                set result = cast(payload->>'{key}' as double precision)
+                where type_id = {type_id}
+                  and json_typeof(payload->'{key}') = 'number'""")
+        else:
+            op.execute(f"""update fact_record
+                set result = json_extract(payload, '$.{key}')
+                where type_id = {type_id}
+                  and json_type(payload, '$.{key}') in ('integer', 'real')""")
+
+    op.create_index('ix_fact_record_type_id_result', 'fact_record', ['type_id', 'result'])
+
+
+def downgrade():
+    op.drop_index('ix_fact_record_type_id_result', 'fact_record')
+    op.drop_column('fact_record', 'result')
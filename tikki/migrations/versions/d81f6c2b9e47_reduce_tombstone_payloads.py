@@ -0,0 +1,37 @@
+"""reduce tombstone payloads to the columns used by rollups
+
+Revision ID: d81f6c2b9e47
+Revises: b5d8e2f41c70
+Create Date: 2026-10-19 14:05:32.480219
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f6c2b9e47'
+down_revision = 'b5d8e2f41c70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # tombstones held all columns of deleted rows, including the payloads of users
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("""update fact_tombstone
+            set payload = case when table_name = 'fact_record'
+                then json_build_object('created_at', payload->'created_at',
+                                       'type_id', payload->'type_id')
+                else '{}'::json end""")
+    else:
+        op.execute("""update fact_tombstone
+            set payload = case when table_name = 'fact_record'
+                then json_object('created_at', json_extract(payload, '$.created_at'),
+                                 'type_id', json_extract(payload, '$.type_id'))
+                else '{}' end""")
+
+
+def downgrade():
+    # the removed columns cannot be restored
+    pass
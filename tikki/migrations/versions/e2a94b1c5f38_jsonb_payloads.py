@@ -0,0 +1,59 @@
+"""store payloads as jsonb with gin indexes
+
+Revision ID: e2a94b1c5f38
+Revises: c6e1f93a7d20
+Create Date: 2026-10-19 11:02:48.361027
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a94b1c5f38'
+down_revision = 'c6e1f93a7d20'
+branch_labels = None
+depends_on = None
+
+PAYLOAD_TABLES = ['fact_user', 'fact_record', 'fact_event', 'fact_user_event_link']
+# payloads filtered by the api get a gin index
+INDEXED_TABLES = ['fact_user', 'fact_record', 'fact_event']
+
+# views are recreated by `tikki --migrate up` after the migrations
+VIEWS = [
+    'view_user_fa_index',
+    'view_record_coopers',
+    'view_record_pushups',
+    'view_record_situps',
+    'view_record_standingjump',
+    'view_user',
+]
+
+
+def _alter_payloads(type_name):
+    for view in VIEWS:
+        op.execute(f'drop view if exists {view}')
+    for table in PAYLOAD_TABLES:
+        op.execute(f'alter table {table} alter column payload type {type_name} '
+                   f'using payload::{type_name}')
+
+
+def upgrade():
+    # other databases keep the json text column, and filter payloads in python
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    _alter_payloads('jsonb')
+    for table in INDEXED_TABLES:
+        # jsonb_path_ops only supports containment, but is smaller and faster than
+        # the default operator class
+        op.execute(f'create index ix_{table}_payload on {table} '
+                   f'using gin (payload jsonb_path_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in INDEXED_TABLES:
+        op.execute(f'drop index if exists ix_{table}_payload')
+    _alter_payloads('json')
@@ -0,0 +1,24 @@
+"""add index for event leaderboards
+
+Revision ID: f47d2c8e9a13
+Revises: e2a94b1c5f38
+Create Date: 2026-10-19 11:34:52.108364
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f47d2c8e9a13'
+down_revision = 'e2a94b1c5f38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_fact_record_event_id_type_id_result', 'fact_record',
+                    ['event_id', 'type_id', 'result'])
+
+
+def downgrade():
+    op.drop_index('ix_fact_record_event_id_type_id_result', 'fact_record')
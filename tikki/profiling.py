@@ -0,0 +1,142 @@
+"""
+Opt-in profiling of single requests. When enabled, requests from admin users that
+have the X-Tikki-Profile header are run under cProfile, and the stats are written in
+the pstats format, which can be read with `pstats` or visualized with tools such as
+snakeviz or flameprof.
+
+Configured with the following environment variables:
+ - TIKKI_PROFILING: set to 1 to enable profiling
+ - TIKKI_PROFILE_DIR: directory for the profiles, defaults to `tikki-profiles` in the
+   temporary directory
+ - TIKKI_PROFILE_MAX_PER_MINUTE: maximum number of profiled requests per minute and
+   process, defaults to 6
+ - TIKKI_PROFILE_MAX_FILES: maximum number of profiles kept in the directory, older
+   profiles are removed. Defaults to 100.
+"""
+import cProfile
+import datetime
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, List
+
+from flask import current_app, g, request
+from flask_jwt_simple.utils import decode_jwt
+
+from tikki import utils
+
+PROFILE_HEADER = 'X-Tikki-Profile'
+PROFILE_ID_HEADER = 'X-Tikki-Profile-Id'
+ADMIN_ROLE = 999
+
+log = logging.getLogger(utils.APP_NAME)
+
+
+class RateLimiter(object):
+    """
+    Allows at most `limit` events within a sliding window.
+
+    :param limit: maximum number of events within the window
+    :param window: length of the window in seconds
+    """
+    def __init__(self, limit: int, window: float = 60.0):
+        self.limit = limit
+        self.window = window
+        self._events: List[float] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """
+        Register an event if the limit has not been reached.
+
+        :return: True if the event is allowed
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._events = [event for event in self._events if event > now - self.window]
+            if len(self._events) >= self.limit:
+                return False
+            self._events.append(now)
+            return True
+
+
+def _is_admin() -> bool:
+    parts = request.headers.get(current_app.config['JWT_HEADER_NAME'], '').split()
+    if not parts:
+        return False
+    try:
+        claims = decode_jwt(parts[-1])
+    except Exception:
+        return False
+    return claims.get('rol') == ADMIN_ROLE
+
+
+def _get_profile_name() -> str:
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    route = re.sub(r'[^\w]+', '_', route).strip('_') or 'root'
+    timestamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    return f'{timestamp}-{request.method}-{route}-{os.getpid()}.prof'
+
+
+def _remove_old_profiles(directory: str, max_files: int) -> None:
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith('.prof'))
+    for name in profiles[:max(len(profiles) - max_files, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def _stop_profiler() -> Any:
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+    return profiler
+
+
+def init_app(app: Any) -> None:
+    """
+    Set up request profiling of a Flask app if enabled with TIKKI_PROFILING.
+
+    :param app: Flask app object
+    """
+    if os.environ.get('TIKKI_PROFILING') != '1':
+        return
+    directory = os.environ.get('TIKKI_PROFILE_DIR',
+                               os.path.join(tempfile.gettempdir(), 'tikki-profiles'))
+    max_files = int(os.environ.get('TIKKI_PROFILE_MAX_FILES', 100))
+    limiter = RateLimiter(int(os.environ.get('TIKKI_PROFILE_MAX_PER_MINUTE', 6)))
+    os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_profiler():
+        if request.headers.get(PROFILE_HEADER) != '1' or not _is_admin():
+            return
+        if not limiter.acquire():
+            log.info('Profile of %s %s skipped, rate limit reached',
+                     request.method, request.path)
+            return
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def write_profile(response):
+        profiler = _stop_profiler()
+        if profiler is None:
+            return response
+        name = _get_profile_name()
+        try:
+            profiler.dump_stats(os.path.join(directory, name))
+            _remove_old_profiles(directory, max_files)
+        except OSError as e:
+            log.warning('Could not write profile %s: %s', name, e)
+            return response
+        response.headers[PROFILE_ID_HEADER] = name
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exception=None):
+        _stop_profiler()
@@ -0,0 +1,301 @@
+"""
+Generation of synthetic users, events, participant links and records for load
+testing. The data is generated from a random seed, so the same seed and reference
+date always produce the same rows.
+
+Users are split into cohorts by military status, gender and age. Test results are
+drawn from cohort specific distributions, adjusted by a personal fitness level so
+that the results of a user are correlated, and questionnaire answers are drawn from
+the options of each record type schema. Rows are generated and bulk loaded in chunks,
+so memory use does not grow with the number of users.
+"""
+import datetime
+import logging
+import random
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from tikki import utils
+from tikki.db import api as db_api, metadata
+from tikki.db.metadata import CategoryEnum, GenderEnum, MilitaryStatusEnum, RecordTypeEnum
+from tikki.db.tables import Event, Record, User, UserEventLink
+
+# Days before the reference date covered by the generated events and records
+PERIOD_DAYS = 730
+USERS_PER_EVENT = 50
+MAX_EVENTS_PER_USER = 3
+# Fraction of records that are tests, the rest are questionnaire answers
+TEST_RECORD_SHARE = 0.6
+
+
+class Cohort(NamedTuple):
+    military_status_id: int
+    gender_id: int
+    min_age: int
+    max_age: int
+    weight: float
+
+
+class TestDistribution(NamedTuple):
+    key: str
+    mean: float
+    stdev: float
+    female_factor: float
+    yearly_decline: float
+    minimum: float
+    maximum: float
+
+
+COHORTS = [
+    Cohort(int(MilitaryStatusEnum.CONSCRIPT), int(GenderEnum.MALE), 18, 21, 0.20),
+    Cohort(int(MilitaryStatusEnum.CONSCRIPT), int(GenderEnum.FEMALE), 18, 21, 0.02),
+    Cohort(int(MilitaryStatusEnum.SOLDIER), int(GenderEnum.MALE), 22, 55, 0.10),
+    Cohort(int(MilitaryStatusEnum.SOLDIER), int(GenderEnum.FEMALE), 22, 55, 0.02),
+    Cohort(int(MilitaryStatusEnum.CIVILIAN), int(GenderEnum.MALE), 22, 65, 0.50),
+    Cohort(int(MilitaryStatusEnum.CIVILIAN), int(GenderEnum.FEMALE), 22, 65, 0.16),
+]
+
+# Results of men aged 30, scaled for women and declining with age after 30
+TEST_DISTRIBUTIONS = {
+    int(RecordTypeEnum.COOPERS_TEST):
+        TestDistribution('distance', 2600, 350, 0.88, 15, 800, 4200),
+    int(RecordTypeEnum.PUSH_UP_60_TEST):
+        TestDistribution('pushups', 35, 12, 0.65, 0.4, 0, 100),
+    int(RecordTypeEnum.SIT_UPS):
+        TestDistribution('situps', 38, 10, 0.9, 0.3, 0, 90),
+    int(RecordTypeEnum.STANDING_JUMP):
+        TestDistribution('standingjump', 225, 25, 0.82, 1.2, 80, 340),
+}
+
+# Fitness multiplier of each military status
+MILITARY_STATUS_FITNESS = {
+    int(MilitaryStatusEnum.CONSCRIPT): 1.0,
+    int(MilitaryStatusEnum.SOLDIER): 1.08,
+    int(MilitaryStatusEnum.CIVILIAN): 0.95,
+}
+
+FIRST_NAMES = ['Aino', 'Eero', 'Helmi', 'Juha', 'Kaisa', 'Lauri', 'Maria', 'Mikko',
+               'Onni', 'Sanna', 'Timo', 'Venla']
+LAST_NAMES = ['Heikkinen', 'Korhonen', 'Laine', 'Mäkinen', 'Nieminen', 'Virtanen']
+CITIES = ['Helsinki', 'Hämeenlinna', 'Jyväskylä', 'Kuopio', 'Oulu', 'Rovaniemi',
+          'Tampere', 'Turku']
+
+
+class SeedStats(object):
+    """
+    Counters describing the progress of seeding.
+    """
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.rows: Dict[str, int] = {}
+
+    def add(self, table_name: str, count: int) -> None:
+        self.rows[table_name] = self.rows.get(table_name, 0) + count
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return sum(self.rows.values()) / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        counts = ', '.join(f'{count} {name}' for name, count in self.rows.items())
+        return f'{counts} rows inserted ({self.rows_per_sec:.0f} rows/sec)'
+
+
+class Generator(object):
+    """
+    Generator of synthetic rows.
+
+    :param random_seed: seed of the random number generator
+    :param reference_date: end of the period covered by the generated rows. Defaults
+    to the current date at midnight.
+    """
+    def __init__(self, random_seed: int = 0,
+                 reference_date: Optional[datetime.datetime] = None):
+        self.rng = random.Random(random_seed)
+        self.random_seed = random_seed
+        self.reference_date = reference_date or datetime.datetime.combine(
+            datetime.date.today(), datetime.time())
+        self.questionnaires = {
+            type_id: record_type.schema
+            for type_id, record_type in metadata.record_types.items()
+            if record_type.category_id == int(CategoryEnum.QUESTIONNAIRE)}
+
+    def generate_uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def random_timestamp(self) -> datetime.datetime:
+        seconds = self.rng.randrange(PERIOD_DAYS * 24 * 3600)
+        return self.reference_date - datetime.timedelta(seconds=seconds)
+
+    def generate_events(self, count: int) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Generate events, distributed over military statuses by cohort weight.
+
+        :param count: number of events
+        :return: events by military status id
+        """
+        events: Dict[int, List[Dict[str, Any]]] = {
+            status: [] for status in MILITARY_STATUS_FITNESS}
+        weights = [cohort.weight for cohort in COHORTS]
+        for i in range(count):
+            cohort = self.rng.choices(COHORTS, weights)[0]
+            event_at = self.random_timestamp()
+            events[cohort.military_status_id].append({
+                'id': self.generate_uuid(),
+                'organization_id': 0,
+                'name': f'Event {i}',
+                'description': 'Generated event',
+                'event_at': event_at,
+                'created_at': event_at - datetime.timedelta(days=14),
+                'user_id': None,
+                'address': None,
+                'postal_code': None,
+                'longitude': None,
+                'latitude': None,
+                'payload': {},
+            })
+        return events
+
+    def generate_user(self, index: int) -> Dict[str, Any]:
+        cohort = self.rng.choices(COHORTS, [cohort.weight for cohort in COHORTS])[0]
+        age = self.rng.randint(cohort.min_age, cohort.max_age)
+        birth_date = self.reference_date - datetime.timedelta(
+            days=age * 365 + self.rng.randrange(365))
+        created_at = self.random_timestamp()
+        return {
+            'id': self.generate_uuid(),
+            'username': f'seed-{self.random_seed}-{index}',
+            'type_id': 1,
+            'created_at': created_at,
+            'payload': {
+                'firstName': self.rng.choice(FIRST_NAMES),
+                'lastName': self.rng.choice(LAST_NAMES),
+                'city': self.rng.choice(CITIES),
+                'birthDate': birth_date.strftime('%d.%m.%Y'),
+                'genderId': cohort.gender_id,
+                'militaryStatusId': cohort.military_status_id,
+                # not stored by the app, used to generate records
+                '_age': age,
+            },
+        }
+
+    def generate_test_payload(self, type_id: int, user: Dict[str, Any],
+                              fitness: float) -> Dict[str, Any]:
+        distribution = TEST_DISTRIBUTIONS[type_id]
+        mean = distribution.mean * fitness
+        if user['payload']['genderId'] == int(GenderEnum.FEMALE):
+            mean *= distribution.female_factor
+        mean -= max(user['payload']['_age'] - 30, 0) * distribution.yearly_decline
+        value = self.rng.gauss(mean, distribution.stdev * 0.5)
+        value = min(max(value, distribution.minimum), distribution.maximum)
+        return {distribution.key: int(round(value))}
+
+    def generate_answer_payload(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        if 'format' in schema:
+            return {'value': self.rng.randint(9, 20)}
+        return {key: self.rng.choice(sorted(value['options']))
+                for key, value in schema.items()
+                if isinstance(value, dict) and 'options' in value}
+
+    def generate_records(self, user: Dict[str, Any], events: List[Dict[str, Any]],
+                         count: int) -> Iterator[Dict[str, Any]]:
+        """
+        Generate records of a user.
+
+        :param user: user row
+        :param events: events the user participates in
+        :param count: number of records
+        """
+        status = user['payload']['militaryStatusId']
+        fitness = MILITARY_STATUS_FITNESS[status] * self.rng.gauss(1.0, 0.12)
+        questionnaire_ids = sorted(self.questionnaires)
+        for _ in range(count):
+            event = None
+            if self.rng.random() < TEST_RECORD_SHARE:
+                type_id = self.rng.choice(sorted(TEST_DISTRIBUTIONS))
+                payload = self.generate_test_payload(type_id, user, fitness)
+                if events and self.rng.random() < 0.7:
+                    event = self.rng.choice(events)
+            else:
+                type_id = self.rng.choice(questionnaire_ids)
+                payload = self.generate_answer_payload(self.questionnaires[type_id])
+            created_at = event['event_at'] if event else self.random_timestamp()
+            yield {
+                'id': self.generate_uuid(),
+                'created_at': created_at,
+                'user_id': user['id'],
+                'created_user_id': user['id'],
+                'event_id': event['id'] if event else None,
+                'parent_record_id': None,
+                'type_id': type_id,
+                'validated_user_id': None,
+                'validated_at': None,
+                'payload': payload,
+            }
+
+
+def _flush(base_class: Any, rows: List[Dict[str, Any]], stats: SeedStats) -> None:
+    # rows are timestamped by the database clock, as when written through the api,
+    # so that rollups and snapshots pick them up
+    updated_at = db_api.get_database_time()
+    stats.add(base_class.__tablename__, db_api.bulk_insert(
+        base_class, [dict(row, updated_at=updated_at) for row in rows]))
+    rows.clear()
+
+
+def seed(users: int, records_per_user: int = 10, random_seed: int = 0,
+         reference_date: Optional[datetime.datetime] = None,
+         chunk_size: int = 10000) -> SeedStats:
+    """
+    Generate synthetic data and bulk load it into the database. Should be run against
+    an empty, migrated database.
+
+    :param users: number of users
+    :param records_per_user: average number of records per user
+    :param random_seed: seed of the random number generator
+    :param reference_date: end of the period covered by the generated rows
+    :param chunk_size: number of rows inserted at a time
+    :return: statistics of the inserted rows
+    """
+    logger = logging.getLogger(utils.APP_NAME)
+    generator = Generator(random_seed, reference_date)
+    stats = SeedStats()
+
+    events_by_status = generator.generate_events(max(users // USERS_PER_EVENT, 1))
+    events = [event for status_events in events_by_status.values()
+              for event in status_events]
+    for start in range(0, len(events), chunk_size):
+        _flush(Event, events[start:start + chunk_size], stats)
+
+    user_rows: List[Dict[str, Any]] = []
+    link_rows: List[Dict[str, Any]] = []
+    record_rows: List[Dict[str, Any]] = []
+    for index in range(users):
+        user = generator.generate_user(index)
+        status_events = events_by_status[user['payload']['militaryStatusId']]
+        user_events: List[Dict[str, Any]] = []
+        if status_events:
+            user_events = generator.rng.sample(
+                status_events,
+                min(generator.rng.randint(1, MAX_EVENTS_PER_USER), len(status_events)))
+        for event in user_events:
+            link_rows.append({'user_id': user['id'], 'event_id': event['id'],
+                              'created_at': event['created_at'], 'payload': {}})
+        count = generator.rng.randint(records_per_user // 2,
+                                      records_per_user + records_per_user // 2)
+        record_rows.extend(generator.generate_records(user, user_events, count))
+        del user['payload']['_age']
+        user_rows.append(user)
+
+        if len(user_rows) + len(link_rows) + len(record_rows) >= chunk_size:
+            # users are inserted first, as links and records refer to them
+            _flush(User, user_rows, stats)
+            _flush(UserEventLink, link_rows, stats)
+            _flush(Record, record_rows, stats)
+            logger.info(str(stats))
+    _flush(User, user_rows, stats)
+    _flush(UserEventLink, link_rows, stats)
+    _flush(Record, record_rows, stats)
+    return stats
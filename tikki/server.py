@@ -0,0 +1,76 @@
+"""
+Production server for the Tikki backend. Wraps gunicorn so that the application can
+be served with multiple worker processes and threads from the `tikki` entry point.
+
+The application is loaded in the master process before workers are forked, so that
+module level data such as `tikki.db.metadata` is shared copy-on-write between
+workers. Sending SIGHUP to the master process gracefully restarts all workers.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from gunicorn.app.base import BaseApplication  # type: ignore
+
+from tikki.db import api as db_api
+
+
+def _post_fork(server: Any, worker: Any) -> None:
+    # connections must never be shared between processes, so discard any pooled
+    # connections inherited from the master process
+    db_api.dispose_engine()
+
+
+def get_options(workers: Optional[int] = None, threads: Optional[int] = None,
+                bind: Optional[str] = None,
+                keepalive: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Get gunicorn settings. Values that are not passed are read from environment
+    variables, falling back to defaults suitable for a container.
+
+    :param workers: number of worker processes (TIKKI_WORKERS), defaults to
+    2 * CPU count + 1
+    :param threads: number of threads per worker (TIKKI_THREADS), defaults to 1
+    :param bind: address to bind to (TIKKI_BIND), defaults to 0.0.0.0:8000
+    :param keepalive: seconds to keep idle connections open (TIKKI_KEEPALIVE),
+    defaults to 5
+    :return: dict of gunicorn settings
+    """
+    cpu_count = os.cpu_count() or 1
+    return {
+        'workers': workers or int(os.environ.get('TIKKI_WORKERS', 2 * cpu_count + 1)),
+        'threads': threads or int(os.environ.get('TIKKI_THREADS', 1)),
+        'bind': bind or os.environ.get('TIKKI_BIND', '0.0.0.0:8000'),
+        'keepalive': keepalive or int(os.environ.get('TIKKI_KEEPALIVE', 5)),
+        'graceful_timeout': int(os.environ.get('TIKKI_GRACEFUL_TIMEOUT', 30)),
+        'max_requests': int(os.environ.get('TIKKI_MAX_REQUESTS', 0)),
+        'max_requests_jitter': int(os.environ.get('TIKKI_MAX_REQUESTS_JITTER', 0)),
+        'preload_app': True,
+        'post_fork': _post_fork,
+    }
+
+
+class TikkiApplication(BaseApplication):
+    """
+    Gunicorn application serving an already initialized Flask app.
+    """
+    def __init__(self, app: Any, options: Dict[str, Any]):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def run(app: Any, **kwargs) -> None:
+    """
+    Serve the Flask app with gunicorn. Blocks until the server is stopped.
+
+    :param app: Flask app object
+    :param kwargs: overrides for the settings returned by `get_options`
+    """
+    TikkiApplication(app, get_options(**kwargs)).run()
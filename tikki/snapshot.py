@@ -0,0 +1,326 @@
+"""
+Parquet snapshots of the database for analysis outside the production database.
+Records, users, events, tombstones and dimensions are written to a directory as
+Parquet files. Records are partitioned by record type and year in hive style
+(`fact_record/type_id=1/year=2025/`), and have typed columns for the results of each
+fitness test, so that they can be read with e.g. pyarrow, pandas or DuckDB.
+
+Rows are streamed from the database and written in row groups of at most
+`chunk_size` rows, so memory usage does not grow with the size of the tables.
+
+A snapshot into a directory that already contains one is incremental: only rows
+written since the previous snapshot and tombstones of rows deleted since then are
+written, as new files next to the old ones. A row updated after the previous snapshot
+appears in several files, and its latest version is the one with the greatest
+`updated_at`. Tombstones only identify the deleted rows, without their contents.
+Dimensions are small, and are rewritten by every snapshot.
+
+Files are written to a staging directory, which readers of the snapshot ignore as its
+name starts with an underscore, and are only moved into place once all of them have
+been written. A failed snapshot leaves no files behind, and the next one starts from
+the previous successful snapshot.
+
+Requires pyarrow, which is only imported when a snapshot is written.
+"""
+import datetime
+import decimal
+import json
+import logging
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy_utils import UUIDType
+
+from tikki import utils
+from tikki.db import api as db_api, metadata
+from tikki.db.tables import (
+    Event,
+    Record,
+    RecordType,
+    TestLimit,
+    Tombstone,
+    User,
+)
+from tikki.exceptions import AppException
+
+MANIFEST_FILE = '_snapshot.json'
+STAGING_PREFIX = '_staging-'
+# columns of tombstones written to snapshots, leaving out the user and payload
+TOMBSTONE_COLUMNS = ['id', 'table_name', 'row_key', 'deleted_at']
+DEFAULT_CHUNK_SIZE = 50000
+# Rows committed this long after they were timestamped are still picked up, as
+# incremental snapshots look back this far past the previous snapshot
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+
+Partition = Tuple[Tuple[str, Any], ...]
+
+
+def _import_pyarrow() -> Tuple[Any, Any]:
+    try:
+        import pyarrow  # type: ignore
+        import pyarrow.parquet  # type: ignore
+    except ImportError:
+        raise AppException('Parquet snapshots require pyarrow, which can be installed '
+                           'with `pip install tikki[parquet]`.')
+    return pyarrow, pyarrow.parquet
+
+
+def _get_arrow_type(pa: Any, column_type: Any) -> Any:
+    if isinstance(column_type, UUIDType):
+        return pa.string()
+    elif isinstance(column_type, sa.DateTime):
+        return pa.timestamp('us')
+    elif isinstance(column_type, sa.Date):
+        return pa.date32()
+    elif isinstance(column_type, sa.Integer):
+        return pa.int64()
+    elif isinstance(column_type, sa.Numeric):
+        return pa.float64()
+    # strings, and json values serialized as strings
+    return pa.string()
+
+
+def _get_arrow_value(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    elif isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    elif isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def get_partition_path(partition: Partition) -> str:
+    """
+    Get the hive style directory of a partition, e.g. `type_id=1/year=2025`.
+
+    :param partition: tuple of (column name, value) tuples
+    :return: relative path of the partition directory
+    """
+    return os.path.join(*[f'{name}={value}' for name, value in partition]) \
+        if partition else ''
+
+
+def get_result_columns(row: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """
+    Get the typed result columns of a record, one per fitness test, named by the
+    payload key of the result.
+
+    :param row: record row
+    :return: dict mapping result column names to the result or None
+    """
+    key = metadata.RESULT_KEYS.get(row['type_id'])
+    return {name: row['result'] if name == key else None
+            for name in metadata.RESULT_KEYS.values()}
+
+
+class PartitionedWriter(object):
+    """
+    Writer of the rows of a table into Parquet files, one file per partition. Rows
+    are buffered and written as row groups when `chunk_size` rows are buffered.
+
+    :param directory: directory of the table
+    :param columns: list of (column name, arrow type) tuples
+    :param file_name: name of the files written in each partition directory
+    :param chunk_size: maximum number of buffered rows
+    """
+    def __init__(self, directory: str, columns: List[Tuple[str, Any]], file_name: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.pa, self.pq = _import_pyarrow()
+        self.directory = directory
+        self.schema = self.pa.schema(columns)
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._buffers: Dict[Partition, List[Dict[str, Any]]] = {}
+        self._buffered = 0
+        self._writers: Dict[Partition, Any] = {}
+
+    def write(self, row: Dict[str, Any], partition: Partition = ()) -> None:
+        self._buffers.setdefault(partition, []).append(row)
+        self._buffered += 1
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for partition, rows in self._buffers.items():
+            writer = self._writers.get(partition)
+            if writer is None:
+                directory = os.path.join(self.directory, get_partition_path(partition))
+                os.makedirs(directory, exist_ok=True)
+                writer = self.pq.ParquetWriter(os.path.join(directory, self.file_name),
+                                               self.schema, compression='zstd')
+                self._writers[partition] = writer
+            data = {name: [_get_arrow_value(row.get(name)) for row in rows]
+                    for name in self.schema.names}
+            writer.write_table(self.pa.Table.from_pydict(data, schema=self.schema))
+            self.rows += len(rows)
+        self._buffers.clear()
+        self._buffered = 0
+
+    def close(self) -> int:
+        """
+        Write the buffered rows and close the files.
+
+        :return: number of written rows
+        """
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        return self.rows
+
+
+def _get_columns(pa: Any, columns: Iterable[sa.Column]) -> List[Tuple[str, Any]]:
+    return [(col.name, _get_arrow_type(pa, col.type)) for col in columns]
+
+
+def _stream_rows(columns: List[sa.Column], since: Optional[datetime.datetime],
+                 timestamp_column: sa.Column, batch_size: int) \
+        -> Iterable[Dict[str, Any]]:
+    query = sa.select(columns)
+    if since is not None:
+        query = query.where(timestamp_column >= since)
+    with db_api.ENGINE.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+
+def _write_records(output_dir: str, file_name: str, since: Optional[datetime.datetime],
+                   chunk_size: int) -> int:
+    pa, _ = _import_pyarrow()
+    table = Record.__table__
+    # the type id is stored in the directory names of the partitions
+    columns = [col for col in _get_columns(pa, table.columns) if col[0] != 'type_id']
+    columns += [(name, pa.float64()) for name in metadata.RESULT_KEYS.values()]
+    writer = PartitionedWriter(os.path.join(output_dir, table.name), columns, file_name,
+                               chunk_size)
+    for row in _stream_rows(list(table.columns), since, table.c.updated_at,
+                            chunk_size):
+        row.update(get_result_columns(row))
+        writer.write(row, (('type_id', row['type_id']),
+                           ('year', row['created_at'].year)))
+    return writer.close()
+
+
+def _write_table(output_dir: str, table: sa.Table, file_name: str,
+                 since: Optional[datetime.datetime], timestamp_column: str,
+                 chunk_size: int, column_names: Optional[List[str]] = None) -> int:
+    pa, _ = _import_pyarrow()
+    columns = [table.c[name] for name in column_names] if column_names \
+        else list(table.columns)
+    writer = PartitionedWriter(os.path.join(output_dir, table.name),
+                               _get_columns(pa, columns), file_name, chunk_size)
+    for row in _stream_rows(columns, since, table.c[timestamp_column], chunk_size):
+        writer.write(row)
+    return writer.close()
+
+
+def _write_dimensions(output_dir: str) -> int:
+    pa, _ = _import_pyarrow()
+    dimensions: List[Tuple[Any, List[Any]]] = list(metadata.dim_map.items())
+    dimensions.append((RecordType, list(metadata.record_types.values())))
+    dimensions.append((TestLimit, metadata.test_limits))
+    rows = 0
+    for base_class, objects in dimensions:
+        table = base_class.__table__
+        writer = PartitionedWriter(os.path.join(output_dir, table.name),
+                                   _get_columns(pa, table.columns), 'data.parquet')
+        for obj in objects:
+            writer.write({col.name: getattr(obj, col.key) for col in table.columns})
+        rows += writer.close()
+    return rows
+
+
+def read_manifest(output_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the manifest describing the snapshots written to a directory.
+
+    :param output_dir: snapshot directory
+    :return: manifest, or None if the directory contains no snapshot
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _publish(staging_dir: str, output_dir: str) -> None:
+    # renames within a file system are atomic, and replace the dimensions in place
+    for directory, _, file_names in os.walk(staging_dir):
+        target = os.path.join(output_dir, os.path.relpath(directory, staging_dir))
+        os.makedirs(target, exist_ok=True)
+        for name in file_names:
+            os.replace(os.path.join(directory, name), os.path.join(target, name))
+
+
+def snapshot(output_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Write a snapshot of the database to a directory, incrementally if the directory
+    already contains a snapshot.
+
+    :param output_dir: snapshot directory
+    :param chunk_size: maximum number of rows held in memory per table
+    :return: description of the snapshot, as added to the manifest
+    """
+    logger = logging.getLogger(utils.APP_NAME)
+    _import_pyarrow()
+    manifest = read_manifest(output_dir) or {'snapshots': []}
+    since = None
+    if manifest['snapshots']:
+        previous = manifest['snapshots'][-1]['started_at']
+        since = utils.parse_value(previous, datetime.datetime) - WATERMARK_OVERLAP
+
+    # taken from the clock that timestamps the rows before reading, so that rows
+    # committed during the snapshot are included in the next one
+    started_at = db_api.get_database_time()
+    snapshot_id = started_at.strftime('%Y%m%dT%H%M%S%f')
+    file_name = f'part-{snapshot_id}.parquet'
+    os.makedirs(output_dir, exist_ok=True)
+    # staging directories are only left behind by failed snapshots
+    for name in os.listdir(output_dir):
+        if name.startswith(STAGING_PREFIX):
+            shutil.rmtree(os.path.join(output_dir, name))
+
+    staging_dir = os.path.join(output_dir, STAGING_PREFIX + snapshot_id)
+    try:
+        rows = {Record.__tablename__: _write_records(staging_dir, file_name, since,
+                                                     chunk_size)}
+        for base_class in (User, Event):
+            rows[base_class.__tablename__] = _write_table(
+                staging_dir, base_class.__table__, file_name, since, 'updated_at',
+                chunk_size)
+        if since is not None:
+            rows[Tombstone.__tablename__] = _write_table(
+                staging_dir, Tombstone.__table__, file_name, since, 'deleted_at',
+                chunk_size, TOMBSTONE_COLUMNS)
+        rows['dimensions'] = _write_dimensions(staging_dir)
+        _publish(staging_dir, output_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    description = {'id': snapshot_id,
+                   'started_at': started_at.isoformat(),
+                   'since': since.isoformat() if since else None,
+                   'rows': rows,
+                   }
+    manifest['snapshots'].append(description)
+    _write_manifest(output_dir, manifest)
+    logger.info(f'Wrote snapshot {snapshot_id} to {output_dir}: {rows}')
+    return description
@@ -4,24 +4,21 @@ more than once that isn't specific to any certain functionality here.
 """
 
 import flask
-from flask import request, has_request_context
 
 import datetime
 import dateutil.parser
 
+import base64
+import hashlib
 import json
-
-from jwt.algorithms import RSAAlgorithm  # type: ignore
-
-from flask_jwt_simple import get_jwt_identity
-
 import logging
 import os
 from typing import Dict, List, Union, Optional, Any, Type, Tuple
 import traceback
-import urllib.request
 from uuid import UUID, uuid4
 
+from tikki import log
+from tikki.cache import LRUCache
 from tikki.db import tables
 from tikki.exceptions import (
     AppException,
@@ -31,6 +28,7 @@ from tikki.exceptions import (
     Flask500Exception,
     NoRecordsException,
 )
+from tikki.jwks import DEFAULT_URL as DEFAULT_JWKS_URL, JwksCache
 
 from werkzeug.datastructures import MultiDict
 
@@ -38,6 +36,14 @@ import jwt
 
 
 APP_NAME = 'tikki'
+SYNC_EPOCH = datetime.datetime(1970, 1, 1)
+# Longest time a transaction may take to commit. Changes timestamped within this long
+# before the current time are sent again on the next synchronization, as changes of
+# transactions still in progress may be committed with earlier timestamps.
+SYNC_LOOKBACK = datetime.timedelta(minutes=5)
+
+# Verified Auth0 token payloads by token digest
+TOKEN_CACHE = LRUCache(maxsize=int(os.environ.get('TIKKI_TOKEN_CACHE_SIZE', 4096)))
 
 
 def _add_config_from_env(app: Any, config_key: str, env_variable: str,
@@ -80,10 +86,31 @@ def get_sqla_uri() -> str:
 
 
 def get_auth0_payload(app: Any, request):
-    public_key = app.config['AUTH0_PUBLIC_KEY']
+    """
+    Verify the Auth0 token in the request body and return its payload. Verified
+    payloads are cached until the token expires, so that repeated presentations of the
+    same token skip signature verification.
+
+    :param app: Flask app object
+    :param request: Flask http request
+    :return: token payload
+    """
+    jwks = app.config['AUTH0_JWKS']
     audience = app.config['AUTH0_AUDIENCE']
     token = get_args(request.json, required={'token': str})['token'].encode()
+    digest = hashlib.sha256(token).hexdigest()
+    payload = TOKEN_CACHE.get(digest)
+    if payload is not None:
+        return dict(payload)
+
+    try:
+        kid = jwt.get_unverified_header(token).get('kid')
+    except jwt.InvalidTokenError as ex:
+        raise Flask400Exception(f'Invalid token: {ex}')
+    public_key = jwks.get_key(kid)
     payload = jwt.decode(token, public_key, algorithms=['RS256'], audience=audience)
+    if 'exp' in payload:
+        TOKEN_CACHE.set(digest, dict(payload), expires_at=payload['exp'])
     return payload
 
 
@@ -92,25 +119,9 @@ def init_app(app: Any):
     Initializes the Flask app with all necessary config parameters.
     """
 
-    class RequestFormatter(logging.Formatter):
-        def format(self, record):
-            if has_request_context():
-                record.url = request.url
-                record.remote_addr = request.remote_addr
-                jwt_identity = get_jwt_identity()
-                record.jwt_identity = '' if jwt_identity is None else jwt_identity
-            else:
-                record.url, record.remote_addr, record.jwt_identity = '', '', ''
-            return super().format(record)
-
     # Setup logging
-    logger = logging.getLogger(APP_NAME)
-    logger.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
-    log_formatter = RequestFormatter('[%(asctime)s] - %(name)s - %(levelname)s - %(remote_addr)s - %(url)s - %(jwt_identity)s - %(message)s')  # noqa
-    ch.setFormatter(log_formatter)
-    logger.addHandler(ch)
+    log.init_logging(APP_NAME)
+    log.init_app(app)
 
     # Disable deprecation warning for flask-sqlalchemy
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -119,10 +130,13 @@ def init_app(app: Any):
     _add_config_from_env(app, 'SQLALCHEMY_DATABASE_URI', 'TIKKI_SQLA_DB_URI', missing_vars)  # noqa
     _add_config_from_env(app, 'AUTH0_AUDIENCE', 'TIKKI_AUTH0_AUDIENCE', missing_vars)
 
-    url = 'https://tikkifi.eu.auth0.com/.well-known/jwks.json'
-    contents = urllib.request.urlopen(url).read()
-    key = json.dumps(json.loads(contents)['keys'][0])
-    app.config['AUTH0_PUBLIC_KEY'] = RSAAlgorithm.from_jwk(key)
+    jwks = JwksCache(url=os.environ.get('TIKKI_AUTH0_JWKS_URL', DEFAULT_JWKS_URL),
+                     cache_path=os.environ.get('TIKKI_AUTH0_JWKS_CACHE'),
+                     local_path=os.environ.get('TIKKI_AUTH0_JWKS_FILE'),
+                     refresh_interval=float(os.environ.get('TIKKI_AUTH0_JWKS_REFRESH',
+                                                           3600)))
+    jwks.load()
+    app.config['AUTH0_JWKS'] = jwks
 
     if missing_vars:
         raise RuntimeError('Following environment variables undefined: '
@@ -159,6 +173,80 @@ def get_anydict_value(source_dict: Dict[str, Any], key: str, default_value: Any,
     raise AppException('Unsupported source_dict type: ' + type(source_dict).__name__)
 
 
+def get_payload_filter(received: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Retrieve a payload filter from the `payload` argument, which must be a json object.
+    Rows match the filter if their payload contains it, e.g. `{"distance": 2400}`.
+
+    :param received: The dict or MultiDict that contains the source data
+    :return: the filter, or None if the argument is missing
+    """
+    value = received.get('payload')
+    if value is None:
+        return None
+    try:
+        payload_filter = json.loads(value)
+    except ValueError:
+        raise Flask400Exception('Payload filter is not valid JSON.')
+    if not isinstance(payload_filter, dict):
+        raise Flask400Exception('Payload filter must be a JSON object.')
+    return payload_filter
+
+
+def decode_sync_cursor(cursor: Optional[str]) -> Dict[str, Tuple[datetime.datetime, Any]]:
+    """
+    Decode a cursor returned by `/sync`.
+
+    :param cursor: The cursor, or None if the client has not synchronized before
+    :return: a dict mapping the names of synchronized tables to the position up to
+    which the client has received their changes, as `(timestamp, key)` tuples
+    """
+    if not cursor:
+        return {}
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {name: (dateutil.parser.parse(timestamp), key)
+                for name, (timestamp, key) in positions.items()}
+    except (AttributeError, TypeError, ValueError):
+        raise Flask400Exception('Invalid cursor parameter.')
+
+
+def encode_sync_cursor(positions: Dict[str, Tuple[datetime.datetime, Any]]) -> str:
+    """
+    Encode the positions of synchronized tables into an opaque cursor.
+
+    :param positions: a dict mapping table names to `(timestamp, key)` tuples
+    :return: the cursor
+    """
+    value = json.dumps({name: [timestamp.isoformat(), key]
+                        for name, (timestamp, key) in positions.items()},
+                       sort_keys=True)
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def get_sync_position(rows: List[Any], timestamp_column: str, key_column: str,
+                      position: Tuple[datetime.datetime, Any],
+                      settled: datetime.datetime) -> Tuple[datetime.datetime, Any]:
+    """
+    Get the position up to which a client has received the changes of a table. The
+    position does not pass rows changed after `settled`, so that they are sent again
+    together with any rows committed later with earlier timestamps.
+
+    :param rows: The rows sent to the client, ordered by timestamp and key
+    :param timestamp_column: Name of the column containing the time of the change
+    :param key_column: Name of the column ordering rows sharing a timestamp
+    :param position: The position before the rows were sent
+    :param settled: Changes timestamped after this may still be followed by others
+    :return: the new position as a `(timestamp, key)` tuple
+    """
+    for row in reversed(rows):
+        timestamp = getattr(row, timestamp_column)
+        if timestamp <= settled:
+            key = getattr(row, key_column)
+            return timestamp, key if isinstance(key, int) else str(key)
+    return position
+
+
 def get_args(received: Dict[str, Any], required: Optional[Dict[str, Type[Any]]] = None,
              defaultable: Optional[Dict[str, Any]] = None,
              optional: Optional[Dict[str, Type[Any]]] = None,
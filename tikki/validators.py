@@ -0,0 +1,194 @@
+"""
+Validation of record payloads against the schemas in `metadata.record_types`. Each
+schema is compiled once into a validator function, which is cached by record type id.
+
+Schemas are interpreted as follows:
+ - `{'distance': 'float'}`: the payload key `distance` must be a number. Supported
+   types are `float` and `integer`.
+ - `{'single': {'question': ..., 'options': {...}}}`: the payload key `single` must
+   be one of the option keys.
+ - `{'question': ..., 'format': 'integer'}`: the payload key `value` must be of the
+   given type.
+ - `{}`: any payload object is accepted.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from tikki.db import metadata
+from tikki.exceptions import PayloadValidationException
+
+# A check returns None if the payload is valid, otherwise a description of the problem
+Check = Callable[[Dict[str, Any]], Optional[str]]
+
+NUMERIC_TYPES = {
+    'float': (int, float),
+    'integer': (int,),
+}
+
+
+class ValidationStats(object):
+    """
+    Counters describing the validation cost of a record type.
+    """
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def add(self, other: 'ValidationStats', sign: int = 1) -> None:
+        self.count += sign * other.count
+        self.failures += sign * other.failures
+        self.seconds += sign * other.seconds
+
+    @property
+    def json_dict(self) -> Dict[str, Any]:
+        return {'count': self.count,
+                'failures': self.failures,
+                'seconds': self.seconds,
+                }
+
+
+_validators: Dict[int, Check] = {}
+_stats: Dict[int, ValidationStats] = {}
+_lock = threading.Lock()
+
+
+def _compile_type_check(key: str, value_type: str) -> Check:
+    types = NUMERIC_TYPES[value_type]
+    error = f'{key} must be of type {value_type}'
+
+    def check(payload: Dict[str, Any]) -> Optional[str]:
+        value = payload.get(key)
+        if isinstance(value, bool) or not isinstance(value, types):
+            return error
+        return None
+    return check
+
+
+def _compile_option_check(key: str, options: Dict[str, Any]) -> Check:
+    option_keys = frozenset(str(option) for option in options)
+    error = f'{key} must be one of: ' + ', '.join(sorted(option_keys))
+
+    def check(payload: Dict[str, Any]) -> Optional[str]:
+        value = payload.get(key)
+        if isinstance(value, bool) or str(value) not in option_keys:
+            return error
+        return None
+    return check
+
+
+def compile_schema(schema: Dict[str, Any]) -> Check:
+    """
+    Compile a record type schema into a validator function.
+
+    :param schema: the schema of a record type
+    :return: a function that returns None if a payload is valid, otherwise a
+    description of the problem
+    """
+    checks: List[Check] = []
+    if 'format' in schema:
+        if schema['format'] in NUMERIC_TYPES:
+            checks.append(_compile_type_check('value', schema['format']))
+    else:
+        for key, value in schema.items():
+            if isinstance(value, str) and value in NUMERIC_TYPES:
+                checks.append(_compile_type_check(key, value))
+            elif isinstance(value, dict) and 'options' in value:
+                checks.append(_compile_option_check(key, value['options']))
+
+    def validator(payload: Dict[str, Any]) -> Optional[str]:
+        if not isinstance(payload, dict):
+            return 'payload is not an object'
+        for check in checks:
+            error = check(payload)
+            if error is not None:
+                return error
+        return None
+    return validator
+
+
+def compile_validators() -> None:
+    """
+    Compile validators for all record types. Called when the app is initialized, so
+    that compilation cost is not paid on the first request.
+    """
+    for type_id in metadata.record_types:
+        get_validator(type_id)
+
+
+def get_validator(type_id: int) -> Optional[Check]:
+    """
+    Get the compiled validator of a record type.
+
+    :param type_id: record type id
+    :return: validator function, or None if the record type is unknown
+    """
+    validator = _validators.get(type_id)
+    if validator is None:
+        record_type = metadata.record_types.get(type_id)
+        if record_type is None:
+            return None
+        validator = compile_schema(record_type.schema)
+        with _lock:
+            _validators[type_id] = validator
+            _stats.setdefault(type_id, ValidationStats())
+    return validator
+
+
+def validate_payload(type_id: int, payload: Any) -> None:
+    """
+    Validate a record payload against the schema of its record type.
+
+    :param type_id: record type id
+    :param payload: the payload to be validated
+    :raises PayloadValidationException: if the record type is unknown or the payload
+    does not conform to its schema
+    """
+    validator = get_validator(type_id)
+    if validator is None:
+        raise PayloadValidationException(f'Unknown record type: {type_id}')
+    started_at = time.perf_counter()
+    error = validator(payload)
+    elapsed = time.perf_counter() - started_at
+    stats = _stats[type_id]
+    with _lock:
+        stats.count += 1
+        stats.seconds += elapsed
+        if error is not None:
+            stats.failures += 1
+    if error is not None:
+        raise PayloadValidationException(
+            f'Invalid payload for record type {type_id}: {error}')
+
+
+def get_stats() -> Dict[int, ValidationStats]:
+    """
+    Get validation statistics of this process by record type id.
+    """
+    return dict(_stats)
+
+
+def copy_stats() -> Dict[int, ValidationStats]:
+    """
+    Get a copy of the validation statistics of this process by record type id, which
+    is not changed by later validations.
+    """
+    copies = {}
+    with _lock:
+        for type_id, stats in _stats.items():
+            copies[type_id] = ValidationStats()
+            copies[type_id].add(stats)
+    return copies
+
+
+def merge_stats(stats: Dict[int, ValidationStats]) -> None:
+    """
+    Add validation statistics counted in another process, such as an import worker,
+    to the statistics of this process.
+
+    :param stats: validation statistics by record type id
+    """
+    with _lock:
+        for type_id, other in stats.items():
+            _stats.setdefault(type_id, ValidationStats()).add(other)